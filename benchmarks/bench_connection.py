@@ -0,0 +1,114 @@
+"""测量连接复用节省的单次请求延迟
+
+对本地模拟服务器顺序发送请求，比较两种方式：
+  cold: 每个请求使用新的DeepSeekClient(相当于原先裸调用requests.post，每次重新建立连接)
+  warm: 所有请求共享一个DeepSeekClient连接池(keep-alive)
+
+用法: python benchmarks/bench_connection.py [--requests 50] [--tls]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from mock_server import MockDeepSeekServer  # noqa: E402
+
+
+def make_self_signed_cert(directory):
+    """用openssl命令生成仅用于本机测试的自签名证书"""
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", keyfile, "-out", certfile, "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return certfile, keyfile
+
+
+def make_client(certfile):
+    client = main.DeepSeekClient(max_retries=0)
+    # 不读取REQUESTS_CA_BUNDLE/代理等环境变量，否则会覆盖自签名证书设置
+    client.session.trust_env = False
+    client.session.verify = certfile or True
+    return client
+
+
+def timed_request(server, client):
+    started = time.perf_counter()
+    main.chat_completion("sk-mock", "ping", max_tokens=16, url=server.url, client=client)
+    return (time.perf_counter() - started) * 1000
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+    }
+
+
+def run(requests_count, tls):
+    tmpdir = tempfile.mkdtemp()
+    certfile = keyfile = None
+    if tls:
+        certfile, keyfile = make_self_signed_cert(tmpdir)
+
+    try:
+        with MockDeepSeekServer(tokens=16, certfile=certfile, keyfile=keyfile) as server:
+            cold = []
+            connections_before = server.connections
+            for _ in range(requests_count):
+                client = make_client(certfile)
+                cold.append(timed_request(server, client))
+                client.close()
+            cold_connections = server.connections - connections_before
+
+            client = make_client(certfile)
+            timed_request(server, client)  # 预热，建立连接
+            warm = []
+            connections_before = server.connections
+            for _ in range(requests_count):
+                warm.append(timed_request(server, client))
+            warm_connections = server.connections - connections_before
+            client.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    cold_summary = summarize(cold)
+    warm_summary = summarize(warm)
+    return {
+        "requests": requests_count,
+        "tls": tls,
+        "cold": dict(cold_summary, connections=cold_connections),
+        "warm": dict(warm_summary, connections=warm_connections),
+        "saved_per_request_ms": round(cold_summary["median_ms"] - warm_summary["median_ms"], 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="连接复用延迟测量")
+    parser.add_argument("--requests", type=int, default=50, help="每种方式发送的请求数")
+    parser.add_argument("--tls", action="store_true", help="模拟服务器启用HTTPS(需要openssl命令)")
+    parser.add_argument("--json", metavar="PATH", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    result = run(args.requests, args.tls)
+    print(f"cold (每次新建连接): 中位数 {result['cold']['median_ms']} ms, "
+          f"p95 {result['cold']['p95_ms']} ms, 新建连接 {result['cold']['connections']} 个")
+    print(f"warm (连接池复用):   中位数 {result['warm']['median_ms']} ms, "
+          f"p95 {result['warm']['p95_ms']} ms, 新建连接 {result['warm']['connections']} 个")
+    print(f"每个请求节省约 {result['saved_per_request_ms']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,122 @@
+"""测量生成历史的搜索延迟
+
+向临时(或--db指定的)历史库写入指定数量的文书，再对几类典型查询各执行多次，报告p50/p95/最大耗时：
+  latest: 空查询，按时间倒序列出最新记录
+  name:   两个字的姓名(少于3个字符，只在申请人与申请目标中查找)
+  target: 申请目标
+  phrase: 正文中的常见词组(全文索引)
+  rare:   只出现在一份文书中的词
+  miss:   不存在的短词(需要扫描全部申请人与申请目标)
+
+用法: python benchmarks/bench_history.py [--documents 100000] [--db PATH] [--budget-ms 50]
+任一查询的p95超过budget-ms时以状态码1退出。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_pipeline import SAMPLE_PROFILE  # noqa: E402
+
+SURNAMES = "张王李赵刘陈杨黄周吴"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞"
+WORDS = ("machine learning graph neural network research university statement motivation experience "
+         "project data analysis 数据 研究 推荐系统 实验 论文 学术 能力").split()
+
+
+def fill(store, documents, seed=0):
+    """写入documents份随机文书(每份约400词)，已有足够记录时跳过"""
+    existing = store.count()
+    rnd = random.Random(seed)
+    # 只影响基准测试用的连接：不等待每次提交落盘
+    store.conn.execute("PRAGMA synchronous=OFF")
+    for index in range(existing, documents):
+        data = dict(
+            SAMPLE_PROFILE,
+            name=rnd.choice(SURNAMES) + rnd.choice(GIVEN_NAMES),
+            target=f"University {index % 500} - MS",
+        )
+        content = " ".join(rnd.choice(WORDS) for _ in range(400)) + f" marker{index}"
+        store.add(data, "deepseek-chat", "", content, {"total_tokens": 1000}, f"output/bench_{index}.tex")
+    store.conn.execute("PRAGMA synchronous=NORMAL")
+    return store.count()
+
+
+def measure(store, query, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = store.search(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "query": query,
+        "results": len(results),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def run(documents, db_path, repeat):
+    workdir = None
+    if not db_path:
+        workdir = tempfile.mkdtemp(prefix="bench_history_")
+        db_path = os.path.join(workdir, "history.sqlite")
+    try:
+        store = main.HistoryStore(db_path)
+        started = time.perf_counter()
+        total = fill(store, documents)
+        fill_seconds = time.perf_counter() - started
+        queries = {
+            "latest": "",
+            "name": "张伟",
+            "target": "University 42",
+            "phrase": "graph neural",
+            "rare": f"marker{total // 2}",
+            "miss": "昊天",
+        }
+        results = {label: measure(store, query, repeat) for label, query in queries.items()}
+        size_mib = os.path.getsize(db_path) / 1024 / 1024
+        store.conn.close()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "documents": total,
+        "fts": store.fts,
+        "fill_seconds": round(fill_seconds, 1),
+        "db_mib": round(size_mib, 1),
+        "queries": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="历史记录搜索延迟")
+    parser.add_argument("--documents", type=int, default=100000, help="历史库中的文书数")
+    parser.add_argument("--db", metavar="PATH", help="使用(并保留)指定的历史库，便于重复测量")
+    parser.add_argument("--repeat", type=int, default=20, help="每个查询执行的次数")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="p95允许的最大耗时")
+    parser.add_argument("--json", metavar="PATH", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    result = run(args.documents, args.db, args.repeat)
+    print(f"{result['documents']} 份文书, 库大小 {result['db_mib']} MiB, 写入用时 {result['fill_seconds']} 秒, "
+          f"全文索引{'可用' if result['fts'] else '不可用(使用LIKE)'}")
+    print(f"{'query':<8}{'results':>8}{'p50_ms':>10}{'p95_ms':>10}{'max_ms':>10}")
+    for label, stats in result["queries"].items():
+        print(f"{label:<8}{stats['results']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['max_ms']:>10}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if any(stats["p95_ms"] > args.budget_ms for stats in result["queries"].values()):
+        print(f"存在p95超过 {args.budget_ms} ms 的查询")
+        sys.exit(1)
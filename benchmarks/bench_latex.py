@@ -0,0 +1,78 @@
+"""测量模型输出检查(normalize_latex)的速度，并确认规范化结果再次规范化时不变
+
+对若干典型的模型输出(Markdown、代码块、未闭合的公式/环境/花括号、多余的特殊字符等)及其
+所有前缀(模拟被截断的输出)各执行两次normalize_latex：
+  once/twice: 第一次的结果再规范化一次应完全相同(幂等)，否则修复提示词和缓存的正文会不一致
+  throughput: 每秒处理的字符数
+
+用法: python benchmarks/bench_latex.py [--repeat 20] [--json PATH]
+存在不幂等的输入时以状态码1退出，并输出前几个例子。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_pipeline import SAMPLE_CONTENT  # noqa: E402
+
+SAMPLES = [
+    SAMPLE_CONTENT,
+    "```latex\n\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n\\maketitle\n"
+    "## 研究经历\n- **推荐系统**: 准确率提升 30% & 召回率提升 12%\n- 变量 x_1 与 y^2\n\\end{document}\n```",
+    "\\section{Motivation}\nI want to study AI_ML at MIT \\& CMU {with focus on \\textbf{graph models\n\n"
+    "\\begin{itemize}\n\\item 论文一篇 \\begin{enumerate}\\item 子项\n$E = mc^2 与 $$ a + b $$ 以及 \\( x \\)",
+    "\\begin{tabular}{cc}\na & b \\\\\nc & d \\\\\n\\end{tabular}\n\\begin{verbatim}\n_#&%\n\\end{verbatim}",
+    "价格 $100 和 $200，编号 #3，注释 % 这里 {\n\\url{https://a.b/c_d} \\href{https://x}{主页} \\toprule\n}}",
+    "\\begin{foo} \\end{bar} \\end{itemize} \\begin{} \\end{} \\begin x \\begin{equation} a_1 \\end{equation}",
+]
+
+
+def prefixes(text):
+    """文本的所有前缀(按字符截断)，较长的文本每隔几个字符取一个"""
+    step = max(1, len(text) // 400)
+    return [text[:end] for end in range(0, len(text) + 1, step)] + [text]
+
+
+def run(repeat):
+    cases = [case for sample in SAMPLES for case in prefixes(sample)]
+    not_idempotent = []
+    for case in cases:
+        once = main.normalize_latex(case)["text"]
+        twice = main.normalize_latex(once)["text"]
+        if once != twice:
+            not_idempotent.append({"input": case, "once": once, "twice": twice})
+
+    characters = sum(len(sample) for sample in SAMPLES) * repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for sample in SAMPLES:
+            main.normalize_latex(sample)
+    seconds = time.perf_counter() - started
+    return {
+        "cases": len(cases),
+        "not_idempotent": len(not_idempotent),
+        "examples": not_idempotent[:5],
+        "chars_per_s": round(characters / seconds),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LaTeX正文检查的速度与幂等性")
+    parser.add_argument("--repeat", type=int, default=20, help="测速时每个样本处理的次数")
+    parser.add_argument("--json", metavar="PATH", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    result = run(args.repeat)
+    print(f"{result['cases']} 个输入(含截断的前缀)，再次规范化结果不同的 {result['not_idempotent']} 个，"
+          f"处理速度 {result['chars_per_s']} 字符/秒")
+    for example in result["examples"]:
+        print(f"  {example['input']!r}\n    -> {example['once']!r}\n    -> {example['twice']!r}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if result["not_idempotent"]:
+        sys.exit(1)
@@ -0,0 +1,350 @@
+"""流水线基准测试，所有请求发往本地模拟服务器，可完全离线运行
+
+场景:
+  worker: 直接调用DeepSeekAPIWorker.run()(流式)，测量端到端延迟与首token时间
+  errors: 同上，但模拟服务器按比例返回503，测量重试后的延迟与成功率
+  render: 生成.tex文件(--renderer选择template或pylatex)，测量每秒生成的文档数(延迟按每10个文档的平均值统计)
+  batch:  run_batch读取临时档案文件并发生成，测量整批吞吐量
+  throttled: 同batch，但模拟服务器同时只处理--max-in-flight个请求，超出返回429，
+             测量自适应并发收敛后的吞吐量、被拒绝的请求数与重试次数
+
+每个场景报告吞吐量、延迟百分位和内存(tracemalloc峰值)。计时与内存分两轮测量，
+避免tracemalloc的开销影响延迟数据。运行期间工作目录切换到临时目录，生成的文件不会留在仓库中。
+
+绝对耗时随机器变化很大，因此与基线比较的是同一次运行内的比值(*_rel)：
+访问模拟服务器的场景除以服务器按设置必须等待的时间(latency + tokens/token_rate)，
+render场景除以同一次运行中测得的固定纯Python参照计算耗时(calibration_ms)。
+
+用法:
+  python benchmarks/bench_pipeline.py --save benchmarks/baseline.json
+  python benchmarks/bench_pipeline.py --compare benchmarks/baseline.json [--tolerance 0.5]
+有比值比基线差超过tolerance时以状态码1退出，可用于CI检查回归。
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from mock_server import MockDeepSeekServer  # noqa: E402
+
+SAMPLE_PROFILE = {
+    "name": "张三",
+    "email": "zhangsan@example.com",
+    "phone": "13800000000",
+    "university": "某大学",
+    "major": "计算机科学与技术",
+    "gpa": "3.8/4.0",
+    "awards": "国家奖学金\n校级优秀学生",
+    "research": "参与图神经网络推荐系统课题，负责数据处理与实验\n发表会议论文一篇",
+    "competitions": "全国大学生数学建模竞赛一等奖",
+    "target": "MIT - MS in Computer Science",
+    "doc_type": "留学申请文书",
+    "photo_path": "",
+}
+
+SAMPLE_CONTENT = "\n\n".join(
+    f"第{index}段：申请人在本科阶段系统学习了数据结构、算法与机器学习，"
+    f"并在科研项目中积累了实践经验。This paragraph is part of the generated statement."
+    for index in range(1, 9)
+)
+
+RENDER_BATCH = 10
+
+# 比较基线时各指标的方向：True表示越小越好。耗时与吞吐量只比较同一次运行内的比值，不受机器快慢影响
+COMPARED_METRICS = {
+    "throughput_rel": False,
+    "p50_rel": True,
+    "p95_rel": True,
+    "speedup": False,
+    "peak_kib": True,
+}
+
+
+def percentile(sorted_samples, q):
+    return sorted_samples[min(len(sorted_samples) - 1, int(q / 100 * len(sorted_samples)))]
+
+
+def summarize(samples_ms, wall_seconds, count):
+    samples = sorted(samples_ms)
+    return {
+        "count": count,
+        "throughput_per_s": round(count / wall_seconds, 3) if wall_seconds else 0.0,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+    }
+
+
+def calibrate(repeat=15):
+    """固定的纯Python字符串与字典操作耗时的中位数(ms)，作为本次运行中CPU速度的参照"""
+    lines = [f"第{index}行 line {index} with % and {{braces}}" for index in range(2000)]
+    samples = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        counts = {}
+        for line in lines:
+            escaped = line.replace("%", "\\%").replace("{", "\\{").replace("}", "\\}")
+            counts[escaped[:4]] = counts.get(escaped[:4], 0) + len(escaped.split())
+        "\n".join(f"{key}: {value}" for key, value in sorted(counts.items()))
+        samples.append((time.perf_counter() - began) * 1000)
+    return statistics.median(samples)
+
+
+def add_relative(stats, unit_ms):
+    """把耗时与吞吐量换算成相对unit_ms的比值，供与基线比较"""
+    stats.update(
+        unit_ms=round(unit_ms, 3),
+        p50_rel=round(stats["p50_ms"] / unit_ms, 3),
+        p95_rel=round(stats["p95_ms"] / unit_ms, 3),
+        throughput_rel=round(stats["throughput_per_s"] * unit_ms / 1000, 3),
+    )
+    return stats
+
+
+def peak_memory_kib(func, iterations):
+    """在tracemalloc下重复执行func，返回Python分配的内存峰值(KiB)"""
+    tracemalloc.start()
+    try:
+        for index in range(iterations):
+            func(index)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def run_worker(server, model, stream=True, max_tokens=2000):
+    """同步执行一次DeepSeekAPIWorker.run()，返回 (是否成功, 首token耗时ms, 总耗时ms)"""
+    worker = main.DeepSeekAPIWorker("sk-mock", main.build_prompt(SAMPLE_PROFILE), model,
+                                    stream=stream, max_tokens=max_tokens)
+    worker.url = server.url
+    first_token = []
+    outcome = []
+    started = time.perf_counter()
+    worker.content_delta.connect(lambda text: first_token or first_token.append(time.perf_counter()))
+    worker.finished.connect(lambda content, success: outcome.append(success))
+    worker.run()
+    elapsed = (time.perf_counter() - started) * 1000
+    ttft = (first_token[0] - started) * 1000 if first_token else elapsed
+    return outcome[0], ttft, elapsed
+
+
+def bench_worker(args, error_rate=0.0):
+    with MockDeepSeekServer(latency=args.latency, tokens=args.tokens, token_rate=args.token_rate,
+                            error_rate=error_rate, seed=args.seed) as server:
+        run_worker(server, args.model)  # 预热连接
+        retries_before = main.get_api_client().stats()["retries"]
+        samples, ttfts, successes = [], [], 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            success, ttft, elapsed = run_worker(server, args.model)
+            successes += success
+            samples.append(elapsed)
+            ttfts.append(ttft)
+        wall = time.perf_counter() - started
+        retries = main.get_api_client().stats()["retries"] - retries_before
+        peak = peak_memory_kib(lambda _: run_worker(server, args.model), min(args.requests, 5))
+
+    result = summarize(samples, wall, args.requests)
+    result.update(
+        ttft_p50_ms=round(percentile(sorted(ttfts), 50), 3),
+        success_rate=round(successes / args.requests, 3),
+        retries=retries,
+        peak_kib=peak,
+    )
+    return result
+
+
+def bench_render(args):
+    tex_dir = tempfile.mkdtemp(dir=".")
+
+    def render(index):
+        main.render_document(SAMPLE_PROFILE, SAMPLE_CONTENT, os.path.join(tex_dir, f"bench_{index}.tex"),
+                             renderer=args.renderer)
+
+    try:
+        render(0)  # 预热
+        # 参照耗时紧挨着渲染前后各测一次取平均，使比值不受机器快慢与负载变化影响
+        calibration_ms = calibrate()
+        samples = []
+        started = time.perf_counter()
+        # 单个文档不到1ms，逐个计时会被偶发的调度切换放大，因此每RENDER_BATCH个文档计一次平均耗时，
+        # 与参照计算的时间粒度相当
+        for first in range(0, args.documents, RENDER_BATCH):
+            indexes = range(first, min(first + RENDER_BATCH, args.documents))
+            began = time.perf_counter()
+            for index in indexes:
+                render(index)
+            samples.append((time.perf_counter() - began) * 1000 / len(indexes))
+        wall = time.perf_counter() - started
+        calibration_ms = (calibration_ms + calibrate()) / 2
+        peak = peak_memory_kib(render, min(args.documents, 20))
+    finally:
+        shutil.rmtree(tex_dir, ignore_errors=True)
+
+    return add_relative(dict(summarize(samples, wall, args.documents), peak_kib=peak), calibration_ms)
+
+
+def bench_batch(args, max_in_flight=0):
+    profiles_path = os.path.abspath("bench_profiles.jsonl")
+    targets = [f"University {index} - MS" for index in range(args.targets)]
+    with open(profiles_path, "w", encoding="utf-8") as f:
+        for index in range(args.profiles):
+            profile = dict(SAMPLE_PROFILE, name=f"申请人{index}", targets=targets)
+            f.write(json.dumps(profile, ensure_ascii=False) + "\n")
+
+    def run_batch():
+        # run_batch会逐条打印结果，基准测试中不需要
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(main.run_batch(
+                profiles_path, "sk-mock", args.model, concurrency=args.concurrency,
+                use_cache=False, url=server.url
+            ))
+
+    main.configure_api_client(max_retries=8, backoff_base=0.01, backoff_max=0.05,
+                              initial_concurrency=args.concurrency)
+    with MockDeepSeekServer(latency=args.latency, tokens=args.tokens, token_rate=args.token_rate,
+                            max_in_flight=max_in_flight) as server:
+        report = run_batch()
+        rejected = server.rejected
+        peak = peak_memory_kib(lambda _: run_batch(), 1)
+
+    samples = [item["seconds"] * 1000 for item in report["items"]]
+    result = summarize(samples, report["wall_seconds"], report["total"])
+    result.update(
+        concurrency=args.concurrency,
+        succeeded=report["succeeded"],
+        speedup=round(report["sequential_seconds"] / report["wall_seconds"], 2),
+        peak_kib=peak,
+    )
+    if max_in_flight:
+        result.update(
+            max_in_flight=max_in_flight,
+            rejected=rejected,
+            retries=report["api_client"]["retries"],
+            concurrency_limit=report["api_client"]["concurrency_limit"],
+            concurrency_decreases=report["api_client"]["concurrency_decreases"],
+        )
+    return result
+
+
+SCENARIOS = {
+    "worker": bench_worker,
+    "errors": lambda args: bench_worker(args, error_rate=args.error_rate),
+    "render": bench_render,
+    "batch": bench_batch,
+    "throttled": lambda args: bench_batch(args, max_in_flight=args.max_in_flight),
+}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.makedirs(main.OUTPUT_DIR, exist_ok=True)
+    # 阶段耗时日志写入临时目录(绝对路径)，不受之前创建的实例或工作目录影响
+    metrics = main.configure_metrics(os.path.join(workdir, main.METRICS_LOG))
+    # 错误注入场景中重试退避不宜过长
+    main.configure_api_client(max_retries=5, backoff_base=0.01, backoff_max=0.05)
+    try:
+        scenarios = {name: SCENARIOS[name](args) for name in args.scenarios}
+    finally:
+        metrics.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 模拟服务器每个请求至少等待的时间，与机器无关
+    server_ms = (args.latency + (args.tokens / args.token_rate if args.token_rate else 0.0)) * 1000
+    for name, stats in scenarios.items():
+        if "unit_ms" not in stats:
+            add_relative(stats, server_ms)
+
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "settings": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        },
+        "scenarios": scenarios,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """逐项比较，返回 (报告行, 是否有回归)"""
+    lines, regressed = [], False
+    for name, stats in result["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            lines.append(f"{name}: 基线中没有该场景，跳过")
+            continue
+        for metric, lower_is_better in COMPARED_METRICS.items():
+            if metric not in stats or not base.get(metric):
+                continue
+            change = (stats[metric] - base[metric]) / base[metric]
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            regressed = regressed or worse
+            flag = "  <-- 回归" if worse else ""
+            lines.append(f"{name:<10}{metric:<18}{base[metric]:>12}{stats[metric]:>12}{change:>+10.1%}{flag}")
+    return lines, regressed
+
+
+def print_result(result):
+    for name, stats in result["scenarios"].items():
+        print(f"[{name}] " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    print(f"进程最大RSS: {result['meta']['max_rss_kib'] / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流水线基准测试(本地模拟服务器)")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--requests", type=int, default=30, help="worker/errors场景的请求数")
+    parser.add_argument("--documents", type=int, default=200, help="render场景生成的文档数")
+    parser.add_argument("--renderer", choices=main.LATEX_RENDERERS, default=main.LATEX_RENDERER,
+                        help="render场景使用的渲染器")
+    parser.add_argument("--profiles", type=int, default=20, help="batch场景的申请人数")
+    parser.add_argument("--targets", type=int, default=2, help="batch场景每人的申请目标数")
+    parser.add_argument("--concurrency", type=int, default=8, help="batch场景的并发数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务器首token延迟(秒)")
+    parser.add_argument("--tokens", type=int, default=200, help="每个回复的token数")
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="模拟服务器每秒生成的token数")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="errors场景注入错误的比例")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="throttled场景模拟服务器的并发上限")
+    parser.add_argument("--seed", type=int, default=1, help="错误注入的随机种子")
+    parser.add_argument("--save", metavar="PATH", help="把结果保存为JSON基线")
+    parser.add_argument("--compare", metavar="PATH", help="与JSON基线比较")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="允许的相对退化比例")
+    args = parser.parse_args()
+    save_path = os.path.abspath(args.save) if args.save else None
+
+    result = run(args)
+    print_result(result)
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存: {save_path}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressed = compare(result, baseline, args.tolerance)
+        print(f"{'scenario':<10}{'metric':<18}{'baseline':>12}{'current':>12}{'change':>10}")
+        print("\n".join(lines))
+        if regressed:
+            print(f"存在超过 {args.tolerance:.0%} 的性能回归")
+            sys.exit(1)
@@ -0,0 +1,108 @@
+"""比较两种.tex渲染器每秒生成的文档数
+
+  pylatex:  create_latex_document构建对象树 + generate_tex序列化
+  template: render_latex_template单次拼接
+
+分别测量留学申请文书、学术简历、求职简历三种版式，并确认两种渲染器的输出逐字节相同。
+
+用法: python benchmarks/bench_render.py [--documents 500] [--json PATH]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_pipeline import SAMPLE_PROFILE, SAMPLE_CONTENT  # noqa: E402
+
+DOC_TYPES = ["留学申请文书", "学术简历", "求职简历"]
+SECTIONED_CONTENT = [(section["title"], SAMPLE_CONTENT) for section in main.PS_SECTIONS]
+
+
+def make_profiles(count, doc_type):
+    """生成互不相同的档案，避免测到缓存效果"""
+    return [
+        dict(SAMPLE_PROFILE, doc_type=doc_type, name=f"申请人_{index}", gpa=f"3.{index % 10}/4.0",
+             target=f"University {index} - MS")
+        for index in range(count)
+    ]
+
+
+def measure(renderer, profiles, content, tex_dir):
+    started = time.perf_counter()
+    for index, data in enumerate(profiles):
+        main.render_document(data, content, os.path.join(tex_dir, f"{renderer}_{index}.tex"), renderer=renderer)
+    return time.perf_counter() - started
+
+
+def peak_memory_kib(renderer, profiles, content, tex_dir):
+    tracemalloc.start()
+    try:
+        measure(renderer, profiles, content, tex_dir)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def outputs_identical(profiles, content, tex_dir):
+    for index in range(len(profiles)):
+        with open(os.path.join(tex_dir, f"pylatex_{index}.tex"), "rb") as a, \
+                open(os.path.join(tex_dir, f"template_{index}.tex"), "rb") as b:
+            if a.read() != b.read():
+                return False
+    return True
+
+
+def run(documents):
+    workdir = tempfile.mkdtemp(prefix="bench_render_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = {}
+    try:
+        cases = [(doc_type, SAMPLE_CONTENT) for doc_type in DOC_TYPES] + [("留学申请文书(分段)", SECTIONED_CONTENT)]
+        for label, content in cases:
+            profiles = make_profiles(documents, label.split("(")[0])
+            tex_dir = tempfile.mkdtemp(dir=".")
+            measure("template", profiles[:10], content, tex_dir)  # 预热
+            measure("pylatex", profiles[:10], content, tex_dir)
+            case = {}
+            for renderer in main.LATEX_RENDERERS:
+                seconds = measure(renderer, profiles, content, tex_dir)
+                case[renderer] = {
+                    "docs_per_s": round(documents / seconds, 1),
+                    "ms_per_doc": round(seconds / documents * 1000, 4),
+                    "peak_kib": peak_memory_kib(renderer, profiles[:50], content, tex_dir),
+                }
+            case["identical"] = outputs_identical(profiles, content, tex_dir)
+            case["speedup"] = round(case["template"]["docs_per_s"] / case["pylatex"]["docs_per_s"], 2)
+            results[label] = case
+            shutil.rmtree(tex_dir, ignore_errors=True)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"documents": documents, "cases": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="渲染器吞吐量对比")
+    parser.add_argument("--documents", type=int, default=500, help="每种情况生成的文档数")
+    parser.add_argument("--json", metavar="PATH", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    result = run(args.documents)
+    for label, case in result["cases"].items():
+        print(f"{label}: template {case['template']['docs_per_s']} 份/秒, "
+              f"pylatex {case['pylatex']['docs_per_s']} 份/秒, 提速 {case['speedup']}x, "
+              f"内存峰值 {case['template']['peak_kib']} / {case['pylatex']['peak_kib']} KiB, "
+              f"输出{'一致' if case['identical'] else '不一致'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if not all(case["identical"] for case in result["cases"].values()):
+        sys.exit(1)
@@ -0,0 +1,124 @@
+"""测量多个客户端共用本地生成服务时的缓存命中与上游请求数
+
+模拟同一台机器上的多位顾问：clients个客户端各自按随机顺序提交同一批申请人档案
+(部分档案重复)，全部经由同一个GenerationService生成。报告:
+  upstream: 实际发往(模拟)API的请求数，理想情况等于不同档案的数量
+  hits:     命中共享响应缓存的任务数
+  joined:   提交时相同任务仍在进行、直接复用该任务的次数
+  connections: 上游新建的TCP连接数(共享连接池)
+  latency:  提交到完成(含轮询间隔)的p50/p95
+
+运行期间工作目录切换到临时目录，生成的文件不会留在仓库中。
+
+用法: python benchmarks/bench_service.py [--clients 4] [--profiles 20] [--json PATH]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_pipeline import SAMPLE_PROFILE  # noqa: E402
+from mock_server import MockDeepSeekServer  # noqa: E402
+
+
+def run_client(client_index, base_url, profiles, samples, seed):
+    """一个客户端：逐份提交并轮询到完成，记录 (耗时, 是否命中缓存, 是否复用进行中的任务)"""
+    client = main.ServiceClient(base_url)
+    order = list(profiles)
+    random.Random(seed + client_index).shuffle(order)
+    try:
+        for data in order:
+            started = time.perf_counter()
+            status = client.submit(data, "deepseek-chat", "sk-bench", stream=True)
+            created = status["created"]
+            while status["state"] not in main.SERVICE_FINAL_STATES:
+                time.sleep(main.SERVICE_POLL_INTERVAL / 4)
+                status = client.status(status["id"], status["offset"])
+            samples.append((time.perf_counter() - started, status["cache_hit_ms"] is not None, not created,
+                            status["state"]))
+    finally:
+        client.close()
+
+
+def run(clients, profiles, latency, tokens, seed=0):
+    workdir = tempfile.mkdtemp(prefix="bench_service_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        os.makedirs(main.OUTPUT_DIR, exist_ok=True)
+        with MockDeepSeekServer(latency=latency, tokens=tokens) as server:
+            main.configure_backends(backends=[main.Backend.from_url(server.url, name="mock")])
+            main.configure_api_client(rpm=0, tpm=0)
+            service = main.GenerationService(workers=main.SERVICE_WORKERS)
+            httpd = main.create_service_server(service, port=0)
+            thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+            thread.start()
+            host, port = httpd.server_address[:2]
+            base_url = f"http://{host}:{port}"
+
+            data = [dict(SAMPLE_PROFILE, name=f"申请人_{index}", target=f"University {index} - MS")
+                    for index in range(profiles)]
+            samples = []
+            started = time.perf_counter()
+            threads = [threading.Thread(target=run_client, args=(index, base_url, data, samples, seed))
+                       for index in range(clients)]
+            for client_thread in threads:
+                client_thread.start()
+            for client_thread in threads:
+                client_thread.join()
+            wall_seconds = time.perf_counter() - started
+
+            stats = service.stats()
+            httpd.shutdown()
+            httpd.server_close()
+            service.shutdown()
+            upstream, connections = server.requests, server.connections
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(seconds for seconds, _, _, _ in samples)
+    return {
+        "clients": clients,
+        "profiles": profiles,
+        "jobs": len(samples),
+        "failed": sum(1 for *_, state in samples if state != "done"),
+        "upstream": upstream,
+        "hits": sum(1 for _, hit, _, _ in samples if hit),
+        "joined": sum(1 for _, _, joined, _ in samples if joined),
+        "connections": connections,
+        "wall_seconds": round(wall_seconds, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+        "cache": stats["cache"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地生成服务的共享缓存效果")
+    parser.add_argument("--clients", type=int, default=4, help="同时提交任务的客户端数")
+    parser.add_argument("--profiles", type=int, default=20, help="每个客户端提交的档案数(各客户端相同)")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟接口的首token延迟(秒)")
+    parser.add_argument("--tokens", type=int, default=200, help="每个回复的token数")
+    parser.add_argument("--json", metavar="PATH", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    result = run(args.clients, args.profiles, args.latency, args.tokens)
+    print(f"{result['clients']} 个客户端共提交 {result['jobs']} 个任务 (失败 {result['failed']})，"
+          f"上游请求 {result['upstream']} 次 / 新建连接 {result['connections']} 个，"
+          f"命中共享缓存 {result['hits']} 次，复用进行中的任务 {result['joined']} 次")
+    print(f"总耗时 {result['wall_seconds']} 秒，单个任务 p50 {result['p50_ms']} ms / p95 {result['p95_ms']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if result["failed"]:
+        sys.exit(1)
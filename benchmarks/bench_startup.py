@@ -0,0 +1,116 @@
+"""测量冷启动耗时
+
+  imports: 用 python -X importtime 导入main，统计总导入耗时与最慢的模块，
+           并检查requests/pylatex等重量级模块是否被推迟加载
+  window:  以子进程启动界面(默认offscreen平台，无需显示器)，设置RESUME_HELPER_STARTUP_PROBE后
+           界面在首次绘制与延迟初始化完成时输出时间戳并退出，据此得到从启动进程到窗口显示的耗时
+
+用法: python benchmarks/bench_startup.py [--runs 5] [--platform offscreen] [--json PATH]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_SCRIPT = os.path.join(REPO_DIR, "main.py")
+PROBE_ENV = "RESUME_HELPER_STARTUP_PROBE"
+# 期望推迟到首次使用时才导入的模块
+DEFERRED_MODULES = ["requests", "pylatex"]
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 {模块名: (自身耗时us, 累计耗时us)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure_imports(workdir, top):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    modules = parse_importtime(completed.stderr)
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        "main_cumulative_ms": round(modules["main"][1] / 1000, 3),
+        "total_modules": len(modules),
+        "deferred": {name: name not in modules for name in DEFERRED_MODULES},
+        "slowest_self_ms": {name: round(times[0] / 1000, 3) for name, times in slowest},
+    }
+
+
+def measure_window(workdir, platform):
+    env = dict(os.environ, **{PROBE_ENV: "1"})
+    if platform:
+        env["QT_QPA_PLATFORM"] = platform
+    launched = time.time()
+    completed = subprocess.run(
+        [sys.executable, MAIN_SCRIPT], cwd=workdir, env=env,
+        capture_output=True, text=True, timeout=60
+    )
+    probe = None
+    for line in completed.stdout.splitlines():
+        if line.startswith("{"):
+            probe = json.loads(line)
+    if probe is None:
+        raise RuntimeError(f"界面未输出启动时间 (退出码 {completed.returncode}):\n{completed.stderr}")
+    return {
+        "imports_ms": (probe["imports_done"] - launched) * 1000,
+        "window_shown_ms": (probe["first_paint"] - launched) * 1000,
+        "ready_ms": (probe["ready"] - launched) * 1000,
+        "loaded_heavy_modules": probe["modules"],
+    }
+
+
+def run(runs, platform, top):
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        imports = measure_imports(workdir, top)
+        measure_window(workdir, platform)  # 预热文件系统缓存与.pyc
+        samples = [measure_window(workdir, platform) for _ in range(runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    window = {
+        key: round(statistics.median(sample[key] for sample in samples), 3)
+        for key in ("imports_ms", "window_shown_ms", "ready_ms")
+    }
+    window["loaded_heavy_modules"] = samples[-1]["loaded_heavy_modules"]
+    return {"runs": runs, "platform": platform, "imports": imports, "window": window}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动耗时测量")
+    parser.add_argument("--runs", type=int, default=5, help="启动界面的次数(取中位数)")
+    parser.add_argument("--platform", default="offscreen", help="QT_QPA_PLATFORM，传空字符串则使用系统默认")
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗时最长的模块数")
+    parser.add_argument("--json", metavar="PATH", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    result = run(args.runs, args.platform, args.top)
+    imports = result["imports"]
+    print(f"import main: {imports['main_cumulative_ms']} ms ({imports['total_modules']} 个模块)")
+    for name, deferred in imports["deferred"].items():
+        print(f"  {name}: {'已推迟' if deferred else '启动时加载'}")
+    print("自身耗时最长的模块:")
+    for name, ms in imports["slowest_self_ms"].items():
+        print(f"  {ms:>9.3f} ms  {name}")
+    window = result["window"]
+    print(f"启动进程 -> 导入完成: {window['imports_ms']} ms")
+    print(f"启动进程 -> 窗口显示(首次绘制): {window['window_shown_ms']} ms")
+    print(f"启动进程 -> 界面就绪(延迟初始化完成): {window['ready_ms']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
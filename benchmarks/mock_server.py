@@ -0,0 +1,267 @@
+"""本地模拟的DeepSeek/OpenAI兼容接口，用于离线测量，不消耗真实API额度"""
+import argparse
+import json
+import random
+import ssl
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持keep-alive
+    disable_nagle_algorithm = True  # 避免Nagle与延迟ACK叠加造成约40ms的额外等待
+
+    def log_message(self, format, *args):
+        pass
+
+    def finish(self):
+        # 客户端取消或超时后直接断开连接，刷新缓冲区时的写错误可以忽略
+        try:
+            super().finish()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def setup(self):
+        super().setup()
+        # 每个TCP连接对应一个handler实例，可据此统计新建连接数
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        """/v1/models，供健康检查使用"""
+        if not self.path.rstrip("/").endswith("/models"):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_json(200, {"object": "list", "data": [
+            {"id": model, "object": "model", "owned_by": "mock"} for model in ("deepseek-chat", "deepseek-reasoner")
+        ]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            inject_error = server.error_rate and server.random.random() < server.error_rate
+            if inject_error:
+                server.errors += 1
+            # 超过并发上限的请求直接返回429，模拟服务端按并发数限流
+            over_limit = server.max_in_flight and server.in_flight >= server.max_in_flight
+            if over_limit:
+                server.rejected += 1
+            else:
+                server.in_flight += 1
+
+        if over_limit:
+            self.send_error_response(429)
+            return
+        try:
+            self.respond(body, inject_error)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def respond(self, body, inject_error):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        if inject_error:
+            self.send_error_response(server.error_status)
+            return
+
+        tokens = min(server.tokens, body.get("max_tokens") or server.tokens)
+        # deepseek-reasoner先输出推理过程，再输出正文
+        reasoning_tokens = tokens // 2 if "reasoner" in str(body.get("model")) else 0
+        usage = self.make_usage(body, tokens + reasoning_tokens)
+        if body.get("stream"):
+            self.send_stream(tokens, reasoning_tokens, usage)
+        else:
+            self.pace(tokens + reasoning_tokens)
+            message = {"role": "assistant", "content": "token " * tokens}
+            if reasoning_tokens:
+                message["reasoning_content"] = "think " * reasoning_tokens
+            self.send_json(200, {
+                "id": "mock",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+    def pace(self, tokens):
+        """按token_rate模拟生成速度"""
+        if self.server.token_rate:
+            time.sleep(tokens / self.server.token_rate)
+
+    @staticmethod
+    def make_usage(body, completion_tokens):
+        # 粗略按字符数估算提示词token数
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 2
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": 0,
+            "prompt_cache_miss_tokens": prompt_tokens,
+        }
+
+    def send_error_response(self, status):
+        data = json.dumps({"error": {"message": "injected error", "type": "mock_error"}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.server.retry_after is not None:
+            self.send_header("Retry-After", str(self.server.retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, tokens, reasoning_tokens, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        delay = 1.0 / self.server.token_rate if self.server.token_rate else 0
+        deltas = [{"reasoning_content": "think "}] * reasoning_tokens + [{"content": "token "}] * tokens
+        try:
+            for delta in deltas:
+                if delay:
+                    time.sleep(delay)
+                write_event(json.dumps({"choices": [{"index": 0, "delta": delta}]}))
+            write_event(json.dumps({"choices": [], "usage": usage}))
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消请求时会中途关闭连接
+            self.close_connection = True
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端断开(对冲请求被取消、超时)属于正常情况，不打印traceback
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockDeepSeekServer:
+    """在后台线程运行的模拟服务器
+
+    latency: 每个请求返回前的固定延迟(秒)，相当于首token时间
+    tokens: 每个回复包含的正文token数(不超过请求的max_tokens)
+    token_rate: 每秒生成的token数，0表示不限速
+    error_rate: 按此比例随机返回error_status(默认503)，用于测试重试
+    retry_after: 注入错误时附带的Retry-After头(秒)，None表示不附带
+    max_in_flight: 同时处理的请求数上限，超出的请求返回429，0表示不限
+    seed: 错误注入的随机种子，便于复现
+    certfile/keyfile: 提供时启用HTTPS，可用于测量TLS握手开销
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tokens=50, certfile=None, keyfile=None,
+                 token_rate=0.0, error_rate=0.0, error_status=503, retry_after=None, seed=None,
+                 max_in_flight=0):
+        self.httpd = MockHTTPServer((host, port), MockHandler)
+        self.httpd.lock = threading.Lock()
+        self.httpd.connections = 0
+        self.httpd.requests = 0
+        self.httpd.latency = latency
+        self.httpd.tokens = tokens
+        self.httpd.token_rate = token_rate
+        self.httpd.error_rate = error_rate
+        self.httpd.error_status = error_status
+        self.httpd.retry_after = retry_after
+        self.httpd.random = random.Random(seed)
+        self.httpd.errors = 0
+        self.httpd.max_in_flight = max_in_flight
+        self.httpd.in_flight = 0
+        self.httpd.rejected = 0
+        self.scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+            self.scheme = "https"
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/v1/chat/completions"
+
+    @property
+    def connections(self):
+        return self.httpd.connections
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def errors(self):
+        return self.httpd.errors
+
+    @property
+    def rejected(self):
+        return self.httpd.rejected
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟DeepSeek接口")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2, help="首token前的延迟(秒)")
+    parser.add_argument("--tokens", type=int, default=200, help="每个回复的token数")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="每秒生成的token数，0为不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回错误的比例")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, help="注入错误时附带的Retry-After(秒)")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="并发上限，超出时返回429，0为不限")
+    args = parser.parse_args()
+
+    server = MockDeepSeekServer(
+        port=args.port, latency=args.latency, tokens=args.tokens, token_rate=args.token_rate,
+        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+        max_in_flight=args.max_in_flight
+    )
+    print(f"模拟接口: {server.url} (Ctrl+C 退出)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
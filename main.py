@@ -1,531 +1,5370 @@
 import os
 import sys
+import time
 import datetime
-import requests
 import json
+import csv
+import re
+import argparse
+import base64
+import bisect
+import functools
+import hashlib
+import logging
+import contextlib
+import queue
+import random
+import shutil
+import signal
+import sqlite3
+import statistics
+import subprocess
+import threading
+from collections import deque
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout,
     QLineEdit, QTextEdit, QComboBox, QPushButton, QLabel, QFileDialog, QGroupBox,
-    QProgressBar, QMessageBox
+    QProgressBar, QMessageBox, QCheckBox, QPlainTextEdit, QTabWidget, QDialog, QTableWidget,
+    QTableWidgetItem, QAbstractItemView, QHeaderView
 )
-from PyQt5.QtGui import QPixmap, QIcon
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from pylatex import Document, Section, Subsection, Command, Figure
-from pylatex.utils import NoEscape
+from PyQt5.QtGui import QPixmap, QIcon, QImageReader, QTextCursor, QDesktopServices
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal, QUrl
+
+# requests、pylatex、asyncio等模块导入较慢，首次发起请求/生成文档时才加载，以缩短启动时间
 
-# 确保输出目录存在
 OUTPUT_DIR = "output"
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
 
+API_URL = "https://api.deepseek.com/v1/chat/completions"
+# 可选的后端配置文件(JSON)，不存在时只使用DeepSeek官方接口
+BACKENDS_CONFIG = "backends.json"
+SYSTEM_PROMPT = "你是一位专业的留学求职文书助手，根据用户提供的信息生成高质量的个性化文书。"
+TEMPERATURE = 0.7
 
-class DeepSeekAPIWorker(QThread):
-    """后台线程处理DeepSeek API调用"""
-    finished = pyqtSignal(str, bool)  # (生成内容, 是否成功)
-    progress = pyqtSignal(int)  # 进度百分比
+# 响应缓存等内部数据
+CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache")
+# 各阶段耗时日志
+METRICS_LOG = os.path.join(OUTPUT_DIR, "logs", "metrics.jsonl")
 
-    def __init__(self, api_key, prompt, model="deepseek-chat", parent=None):
-        super().__init__(parent)
-        self.api_key = api_key
-        self.prompt = prompt
-        self.model = model
-        self.url = "https://api.deepseek.com/v1/chat/completions"
+# 设置该环境变量时，界面就绪后输出启动耗时并退出(benchmarks/bench_startup.py使用)
+STARTUP_PROBE_ENV = "RESUME_HELPER_STARTUP_PROBE"
 
-    def run(self):
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
 
-            data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system",
-                     "content": "你是一位专业的留学求职文书助手，根据用户提供的信息生成高质量的个性化文书。"},
-                    {"role": "user", "content": self.prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 2000,
-                "stream": False
-            }
+def ensure_output_dir():
+    """确保输出目录存在"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    return OUTPUT_DIR
 
-            self.progress.emit(30)
-            response = requests.post(self.url, headers=headers, json=data, timeout=120)
-            self.progress.emit(70)
 
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                self.progress.emit(100)
-                self.finished.emit(content, True)
-            else:
-                error_msg = f"API错误: {response.status_code}\n{response.text}"
-                self.finished.emit(error_msg, False)
+# 流水线各阶段名称(按执行顺序)
+PIPELINE_STAGES = [
+    "prompt_build", "rate_limit_wait", "connect", "ttft", "completion", "latex_normalize", "latex_repair",
+    "create_latex_document", "render_template", "generate_tex", "photo_copy", "format_build", "pdf_compile"
+]
 
-        except Exception as e:
-            self.finished.emit(f"请求异常: {str(e)}", False)
 
+class Metrics:
+    """轻量的阶段耗时统计
 
-class ResumeGeneratorApp(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("留学求职文书助手 - DeepSeek集成版")
-        self.setGeometry(100, 100, 900, 700)
+    每条记录写入按大小轮转的JSONL日志，同时在内存中保留各阶段最近的样本，
+    用于在界面中查看p50/p95，或导出为Prometheus文本格式。
+    """
 
-        # 主控件
-        main_widget = QWidget()
-        self.setCentralWidget(main_widget)
-        main_layout = QVBoxLayout(main_widget)
+    def __init__(self, path=None, window=1000, max_bytes=5 * 1024 * 1024, backup_count=5):
+        self.path = path or METRICS_LOG
+        self.window = window
+        self.samples = {}
+        self.totals = {}  # 阶段 -> [次数, 总耗时]，Prometheus的_count/_sum需要累计值
+        self.tokens = {}
+        self.estimates = {}  # 模型 -> 最近的 (估算提示词token, 实际提示词token, max_tokens, 实际输出token)
+        self.lock = threading.Lock()
 
-        # 创建表单区域
-        self.create_api_group(main_layout)
-        self.create_personal_info_group(main_layout)
-        self.create_academic_group(main_layout)
-        self.create_target_group(main_layout)
-        self.create_action_buttons(main_layout)
-        self.create_progress_bar(main_layout)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.logger = logging.getLogger(f"metrics.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        from logging.handlers import RotatingFileHandler
+        handler = RotatingFileHandler(
+            self.path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger.addHandler(handler)
 
-        # 初始化数据
-        self.api_key = ""
-        self.photo_path = ""
-        self.generated_content = ""
-        self.generated_tex_path = ""
+    def close(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
 
-    def create_api_group(self, layout):
-        group = QGroupBox("DeepSeek API 设置")
-        form = QFormLayout()
+    def log(self, event):
+        event = dict(event, ts=round(time.time(), 3))
+        self.logger.info(json.dumps(event, ensure_ascii=False))
 
-        # API 密钥输入
-        self.api_input = QLineEdit()
-        self.api_input.setPlaceholderText("输入DeepSeek API密钥 (sk-...)")
-        self.api_input.setEchoMode(QLineEdit.Password)
-        form.addRow(QLabel("API密钥:"), self.api_input)
+    def record(self, stage, seconds, **fields):
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            total = self.totals.setdefault(stage, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+        self.log(dict(fields, stage=stage, seconds=round(seconds, 4)))
 
-        # 模型选择
-        self.model_combo = QComboBox()
-        self.model_combo.addItems(["deepseek-chat (V3通用模型)", "deepseek-reasoner (R1推理模型)"])
-        form.addRow(QLabel("模型选择:"), self.model_combo)
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """计时上下文：with metrics.stage("prompt_build"): ..."""
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(name, time.perf_counter() - started, ok=ok, **fields)
 
-        group.setLayout(form)
-        layout.addWidget(group)
+    def record_usage(self, model, usage):
+        """累计API返回的token用量"""
+        counts = {key: value for key, value in (usage or {}).items() if isinstance(value, int)}
+        if not counts:
+            return
+        with self.lock:
+            for key, value in counts.items():
+                self.tokens[(model, key)] = self.tokens.get((model, key), 0) + value
+        self.log({"event": "usage", "model": model, **counts})
 
-    def create_personal_info_group(self, layout):
-        group = QGroupBox("个人信息")
-        form = QFormLayout()
+    def record_estimate(self, model, estimated_prompt, max_tokens, usage):
+        """记录本地估算的提示词token数、max_tokens与实际用量的对照"""
+        prompt_tokens = (usage or {}).get("prompt_tokens")
+        completion_tokens = (usage or {}).get("completion_tokens")
+        if not prompt_tokens or completion_tokens is None:
+            return
+        with self.lock:
+            self.estimates.setdefault(model, deque(maxlen=self.window)).append(
+                (estimated_prompt, prompt_tokens, max_tokens, completion_tokens)
+            )
+        self.log({"event": "token_estimate", "model": model, "estimated_prompt_tokens": estimated_prompt,
+                  "prompt_tokens": prompt_tokens, "max_tokens": max_tokens, "completion_tokens": completion_tokens})
 
-        self.name_input = QLineEdit()
-        self.email_input = QLineEdit()
-        self.phone_input = QLineEdit()
-        self.photo_button = QPushButton("选择照片")
-        self.photo_preview = QLabel()
-        self.photo_preview.setFixedSize(100, 100)
-        self.photo_preview.setStyleSheet("border: 1px solid gray; background-color: #f0f0f0;")
-        self.photo_preview.setAlignment(Qt.AlignCenter)
-        self.photo_preview.setText("无照片")
+    def estimate_summary(self):
+        """各模型估算与实际token数的对照：提示词估算误差、输出占max_tokens的比例、触顶次数"""
+        with self.lock:
+            estimates = {model: list(values) for model, values in self.estimates.items()}
+        result = {}
+        for model, values in sorted(estimates.items()):
+            usage_ratios = sorted(completion / max_tokens for _, _, max_tokens, completion in values)
+            result[model] = {
+                "count": len(values),
+                "estimated_prompt_tokens": round(statistics.mean(estimated for estimated, _, _, _ in values), 1),
+                "prompt_tokens": round(statistics.mean(actual for _, actual, _, _ in values), 1),
+                "prompt_estimate_error": round(
+                    statistics.mean((estimated - actual) / actual for estimated, actual, _, _ in values), 3
+                ),
+                "max_tokens": round(statistics.mean(max_tokens for _, _, max_tokens, _ in values), 1),
+                "completion_tokens": round(statistics.mean(completion for _, _, _, completion in values), 1),
+                "completion_ratio_p95": round(usage_ratios[int(0.95 * (len(usage_ratios) - 1))], 3),
+                "truncated": sum(1 for ratio in usage_ratios if ratio >= 1),
+            }
+        return result
 
-        photo_layout = QHBoxLayout()
-        photo_layout.addWidget(self.photo_button)
-        photo_layout.addWidget(self.photo_preview)
+    def summary(self):
+        """各阶段的次数、p50、p95与平均耗时(秒)"""
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+            totals = {stage: list(total) for stage, total in self.totals.items()}
+        result = {}
+        for stage in PIPELINE_STAGES + sorted(set(samples) - set(PIPELINE_STAGES)):
+            values = samples.get(stage)
+            if not values:
+                continue
+            result[stage] = {
+                "count": totals[stage][0],
+                "p50": values[int(0.5 * (len(values) - 1))],
+                "p95": values[int(0.95 * (len(values) - 1))],
+                "mean": totals[stage][1] / totals[stage][0],
+            }
+        return result
 
-        form.addRow(QLabel("姓名:"), self.name_input)
-        form.addRow(QLabel("邮箱:"), self.email_input)
-        form.addRow(QLabel("电话:"), self.phone_input)
-        form.addRow(QLabel("照片:"), photo_layout)
+    def token_totals(self):
+        with self.lock:
+            return dict(self.tokens)
 
-        self.photo_button.clicked.connect(self.select_photo)
+    def to_prometheus(self, prefix="resume_helper"):
+        """导出为Prometheus文本格式"""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Pipeline stage latency in seconds.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, stats in self.summary().items():
+            with self.lock:
+                count, total = self.totals[stage]
+            lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines.append(f"# HELP {prefix}_tokens_total Tokens reported in API usage.")
+        lines.append(f"# TYPE {prefix}_tokens_total counter")
+        for (model, kind), value in sorted(self.token_totals().items()):
+            lines.append(f'{prefix}_tokens_total{{model="{model}",kind="{kind}"}} {value}')
+        lines.append(f"# HELP {prefix}_prompt_estimate_error Mean relative error of local prompt token estimates.")
+        lines.append(f"# TYPE {prefix}_prompt_estimate_error gauge")
+        for model, stats in self.estimate_summary().items():
+            lines.append(f'{prefix}_prompt_estimate_error{{model="{model}"}} {stats["prompt_estimate_error"]}')
+        return "\n".join(lines) + "\n"
 
-        group.setLayout(form)
-        layout.addWidget(group)
 
-    def create_academic_group(self, layout):
-        group = QGroupBox("学术背景")
-        form = QFormLayout()
+_metrics = None
+_metrics_lock = threading.Lock()
 
-        self.university_input = QLineEdit()
-        self.major_input = QLineEdit()
-        self.gpa_input = QLineEdit()
-        self.awards_input = QTextEdit()
-        self.research_input = QTextEdit()
-        self.competitions_input = QTextEdit()
 
-        # 设置文本编辑框高度和样式
-        for text_edit in [self.awards_input, self.research_input, self.competitions_input]:
-            text_edit.setFixedHeight(80)
-            text_edit.setStyleSheet("background-color: #f8f8f8; border: 1px solid #ddd;")
+def get_metrics():
+    """进程内共享的阶段耗时统计"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
 
-        form.addRow(QLabel("院校:"), self.university_input)
-        form.addRow(QLabel("专业:"), self.major_input)
-        form.addRow(QLabel("GPA:"), self.gpa_input)
-        form.addRow(QLabel("获奖经历:"), self.awards_input)
-        form.addRow(QLabel("科研经历:"), self.research_input)
-        form.addRow(QLabel("竞赛经历:"), self.competitions_input)
 
-        group.setLayout(form)
-        layout.addWidget(group)
+def configure_metrics(path=None):
+    """替换共享的阶段耗时统计，例如写入另一个日志文件(基准测试使用临时目录)"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is not None:
+            _metrics.close()
+        _metrics = Metrics(os.path.abspath(path) if path else None)
+        return _metrics
 
-    def create_target_group(self, layout):
-        group = QGroupBox("申请目标")
-        form = QFormLayout()
 
-        self.target_type = QComboBox()
-        self.target_type.addItems(["留学申请文书", "求职简历"])
+def iter_sse_data(lines):
+    """逐行解析SSE流，依次返回每个data事件的JSON对象"""
+    for line in lines:
+        if not line:
+            continue
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        # 以冒号开头的是注释/keep-alive行
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        yield json.loads(payload)
 
-        self.target_input = QTextEdit()
-        self.target_input.setPlaceholderText("输入目标院校/专业 或 公司/职位")
-        self.target_input.setFixedHeight(80)
-        self.target_input.setStyleSheet("background-color: #f8f8f8; border: 1px solid #ddd;")
 
-        form.addRow(QLabel("文书类型:"), self.target_type)
-        form.addRow(QLabel("申请目标:"), self.target_input)
+class DeepSeekAPIError(Exception):
+    """API返回非200状态码"""
 
-        group.setLayout(form)
-        layout.addWidget(group)
+    def __init__(self, status_code, text):
+        super().__init__(f"API错误: {status_code}\n{text}")
+        self.status_code = status_code
+        self.text = text
 
-    def create_progress_bar(self, layout):
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setRange(0, 100)
-        self.progress_bar.setVisible(False)
-        self.progress_bar.setStyleSheet("""
-            QProgressBar {
-                border: 1px solid #3498db;
-                border-radius: 5px;
-                text-align: center;
-                background: #f0f0f0;
-                height: 20px;
-            }
-            QProgressBar::chunk {
-                background-color: #3498db;
-                width: 10px;
-            }
-        """)
-        layout.addWidget(self.progress_bar)
 
-    def create_action_buttons(self, layout):
-        button_layout = QHBoxLayout()
+class RequestCancelled(Exception):
+    """请求已被取消"""
 
-        self.generate_btn = QPushButton("生成文书")
-        self.preview_btn = QPushButton("预览PDF")
-        self.export_btn = QPushButton("导出LaTeX")
 
-        # 设置按钮样式
-        btn_style = """
-            QPushButton {
-                padding: 10px 20px;
-                font-weight: bold;
-                border-radius: 5px;
-                min-width: 120px;
-            }
-            QPushButton:hover {
-                opacity: 0.9;
-            }
-        """
-        self.generate_btn.setStyleSheet(btn_style + "background-color: #3498db; color: white;")
-        self.preview_btn.setStyleSheet(btn_style + "background-color: #2ecc71; color: white;")
-        self.export_btn.setStyleSheet(btn_style + "background-color: #9b59b6; color: white;")
+class CancelToken:
+    """请求取消标记
 
-        self.generate_btn.clicked.connect(self.generate_document)
-        self.preview_btn.clicked.connect(self.preview_pdf)
-        self.export_btn.clicked.connect(self.export_latex)
+    cancel()会关闭已建立的响应，使阻塞中的读取立即中断；
+    若响应尚未返回，则在响应头到达时立即关闭，重试等待也会提前结束。
+    """
 
-        button_layout.addWidget(self.generate_btn)
-        button_layout.addWidget(self.preview_btn)
-        button_layout.addWidget(self.export_btn)
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.response = None
 
-        layout.addLayout(button_layout)
+    @property
+    def cancelled(self):
+        return self.event.is_set()
 
-    def select_photo(self):
-        path, _ = QFileDialog.getOpenFileName(
-            self, "选择个人照片", "", "图片文件 (*.png *.jpg *.jpeg)"
-        )
-        if path:
-            self.photo_path = path
-            pixmap = QPixmap(path).scaled(
-                100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation
-            )
-            self.photo_preview.setPixmap(pixmap)
+    def cancel(self):
+        self.event.set()
+        with self.lock:
+            response = self.response
+        if response is not None:
+            response.close()
 
-    def generate_document(self):
-        # 验证API密钥
-        api_key = self.api_input.text().strip()
-        if not api_key:
-            QMessageBox.warning(self, "API密钥缺失", "请输入有效的DeepSeek API密钥")
-            return
+    def attach(self, response):
+        """登记进行中的响应，已取消时直接关闭并抛出RequestCancelled"""
+        with self.lock:
+            self.response = response
+        if self.cancelled:
+            response.close()
+            raise RequestCancelled()
 
-        # 收集用户数据
-        user_data = self.collect_user_data()
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled()
 
-        # 根据文书类型构建不同的提示词
-        if "留学" in self.target_type.currentText():
-            prompt = self.build_study_abroad_prompt(user_data)
-        else:
-            prompt = self.build_job_application_prompt(user_data)
 
-        # 显示进度条
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setValue(0)
-        self.statusBar().showMessage("正在生成文书内容...")
+# 客户端限流的默认值：每分钟请求数与token数(提示词估算值 + max_tokens)，可用命令行参数调整
+RATE_LIMIT_RPM = 300
+RATE_LIMIT_TPM = 1000000
+# 自适应并发：初始上限，遇到429/503/超时减半，每次成功增加 1/当前上限(约每轮并发请求全部成功后加1)
+INITIAL_CONCURRENCY = 8
+MIN_CONCURRENCY = 1
 
-        # 确定模型
-        model = "deepseek-chat"
-        if "R1" in self.model_combo.currentText():
-            model = "deepseek-reasoner"
 
-        # 启动后台线程调用DeepSeek API
-        self.worker = DeepSeekAPIWorker(api_key, prompt, model)
-        self.worker.progress.connect(self.progress_bar.setValue)
-        self.worker.finished.connect(self.handle_api_response)
-        self.worker.start()
+def estimate_tokens(text):
+    """粗略估算token数：中文字符约0.6个token，其余字符约0.3个token"""
+    cjk = sum(1 for char in text if "\u4e00" <= char <= "\u9fff")
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
 
-    def collect_user_data(self):
-        """收集所有用户输入数据"""
-        return {
-            "name": self.name_input.text(),
-            "email": self.email_input.text(),
-            "phone": self.phone_input.text(),
-            "university": self.university_input.text(),
-            "major": self.major_input.text(),
-            "gpa": self.gpa_input.text(),
-            "awards": self.awards_input.toPlainText(),
-            "research": self.research_input.toPlainText(),
-            "competitions": self.competitions_input.toPlainText(),
-            "target": self.target_input.toPlainText(),
-            "doc_type": self.target_type.currentText(),
-            "photo_path": self.photo_path
-        }
 
-    def build_study_abroad_prompt(self, data):
-        """构建留学申请文书提示词"""
-        return f"""
-        你是一位专业的留学申请文书写作专家，请根据以下信息为申请人{data['name']}撰写一份留学申请文书：要求返回latex格式
-        的代码，能够正常使用latex编译，注意，输出的文件内容应该符合留学申请文书个人陈述的要求，内容应该均为英文。
-        文书中不应该出现中文内容，非常重要。
-        
-        文书格式应该符合院校的要求，美观。
+def estimate_prompt_tokens(prompt):
+    """系统提示词加用户提示词的估算token数"""
+    return estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt)
 
-        ## 申请目标
-        {data['target']}
 
-        ## 个人信息
-        - 姓名：{data['name']}
-        - 邮箱：{data['email']}
-        - 电话：{data['phone']}
+def estimate_request_tokens(payload):
+    """一次请求最多消耗的token数：提示词估算值加max_tokens"""
+    prompt = sum(estimate_tokens(str(message.get("content", ""))) for message in payload.get("messages", []))
+    return prompt + (payload.get("max_tokens") or 0)
 
-        ## 教育背景
-        - 院校：{data['university']}
-        - 专业：{data['major']}
-        - GPA：{data['gpa']}
 
-        ## 经历与成就
-        - 获奖经历：{data['awards']}
-        - 科研经历：{data['research']}
-        - 竞赛经历：{data['competitions']}
+class TokenBucket:
+    """令牌桶：容量为每分钟的额度，按每秒 额度/60 的速度补充"""
 
-        ## 写作要求
-        1. 文书应突出申请人的学术能力和研究潜力
-        2. 结合申请目标说明申请动机
-        3. 展现个人特质和独特优势
-        4. 结构清晰，语言专业流畅
-        5. 长度应该遵循申请院校的文书要求，请搜索你的知识库来确定，如果没法准确判断，则输出1000词左右。
-        """
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
 
-    def build_job_application_prompt(self, data):
-        """构建求职简历提示词"""
-        return f"""
-        你是一位专业的求职简历写作专家，请根据以下信息为申请人{data['name']}撰写一份求职简历的自我评价部分，要求返回latex格式
-        的代码，能够正常使用latex编译。简历应该美观，内容清晰。
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
 
-        ## 申请目标
-        {data['target']}
+    def wait_time(self, amount):
+        # 超过容量的单次请求按容量计算，否则永远等不到
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
 
-        ## 个人信息
-        - 姓名：{data['name']}
-        - 邮箱：{data['email']}
-        - 电话：{data['phone']}
 
-        ## 教育背景
-        - 院校：{data['university']}
-        - 专业：{data['major']}
-        - GPA：{data['gpa']}
+class RateLimiter:
+    """按每分钟请求数(RPM)和token数(TPM)限流的令牌桶，额度不足时等待
 
-        ## 经历与成就
-        - 获奖经历：{data['awards']}
-        - 科研经历：{data['research']}
-        - 竞赛经历：{data['competitions']}
+    token按估算值预扣，请求完成后用settle按实际用量退还或补扣。
+    """
 
-        ## 写作要求
-        1. 突出与目标职位相关的技能和经验
-        2. 量化成就和贡献
-        3. 展现职业素养和团队合作能力
-        4. 语言精练专业，长度在300-500字
-        5. 格式使用Markdown，包含标题和项目符号
-        """
+    def __init__(self, rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.lock = threading.Lock()
+        self.sent = deque()  # 最近一分钟发出的请求 (时间, 预扣token数)
+        self.throttled = 0  # 因额度不足而等待的次数
+        self.waited = 0.0
 
-    def handle_api_response(self, content, success):
-        """处理API返回结果"""
-        self.progress_bar.setVisible(False)
+    def acquire(self, tokens, cancel_token=None):
+        """预扣1个请求和tokens个token，返回等待的秒数"""
+        waited = 0.0
+        counted = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                delay = 0.0
+                for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                    if bucket is not None:
+                        bucket.refill(now)
+                        delay = max(delay, bucket.wait_time(amount))
+                if delay == 0.0:
+                    if self.requests is not None:
+                        self.requests.tokens -= 1
+                    if self.tokens is not None:
+                        self.tokens.tokens -= tokens
+                    self.sent.append((now, tokens))
+                    self.waited += waited
+                    return waited
+                if not counted:
+                    self.throttled += 1
+                    counted = True
+            # 最多等待1秒再重新计算，期间其他线程可能已退还额度
+            delay = min(delay, 1.0)
+            if cancel_token:
+                if cancel_token.event.wait(delay):
+                    raise RequestCancelled()
+            else:
+                time.sleep(delay)
+            waited += delay
 
-        if success:
-            self.generated_content = content
-            self.statusBar().showMessage("文书内容生成成功!", 5000)
-
-            # 生成LaTeX文档
-            user_data = self.collect_user_data()
-            doc = self.create_latex_document(user_data, content)
-
-            # 生成唯一的文件名
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            doc_type = "study" if "留学" in user_data['doc_type'] else "job"
-            filename = f"{doc_type}_application_{timestamp}.tex"
-            tex_path = os.path.join(OUTPUT_DIR, filename)
-
-            # 保存文件到output目录
-            doc.generate_tex(tex_path)
-            self.generated_tex_path = tex_path
-
-            # 显示预览
-            preview_dialog = QMessageBox(self)
-            preview_dialog.setWindowTitle("生成预览")
-            preview_dialog.setTextFormat(Qt.RichText)
-            preview_dialog.setText(f"<h3>文书内容预览</h3><p>{content[:1000]}...</p>")
-            preview_dialog.setDetailedText(f"文件已保存至: {tex_path}")
-            preview_dialog.exec_()
-        else:
-            QMessageBox.critical(self, "生成失败", f"文书生成失败:\n{content}")
+    def settle(self, estimated, actual):
+        """请求完成后按实际token用量修正预扣的额度"""
+        if self.tokens is None or not actual:
+            return
+        with self.lock:
+            self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens + estimated - actual)
 
-    def create_latex_document(self, data, generated_content):
-        """创建包含生成内容的LaTeX文档"""
-        doc = Document(documentclass="article")
+    def stats(self):
+        with self.lock:
+            cutoff = time.monotonic() - 60
+            while self.sent and self.sent[0][0] < cutoff:
+                self.sent.popleft()
+            return {
+                "rpm_limit": int(self.requests.capacity) if self.requests else None,
+                "tpm_limit": int(self.tokens.capacity) if self.tokens else None,
+                "requests_last_minute": len(self.sent),
+                "tokens_last_minute": sum(tokens for _, tokens in self.sent),
+                "rate_limited": self.throttled,
+                "rate_limit_wait_seconds": round(self.waited, 3),
+            }
 
-        # 添加LaTeX包
-        doc.preamble.append(Command("usepackage", "graphicx"))
-        doc.preamble.append(Command("usepackage", "xcolor"))
-        doc.preamble.append(Command("usepackage", "fontspec"))
-        doc.preamble.append(Command("usepackage", ["geometry", "a4paper", "margin=1.5cm"]))
-        doc.preamble.append(Command("usepackage", "parskip"))
 
-        # 设置中文字体
-        doc.preamble.append(NoEscape(r"\setmainfont{Noto Serif CJK SC}"))
-        doc.preamble.append(NoEscape(r"\setsansfont{Noto Sans CJK SC}"))
+class AdaptiveConcurrency:
+    """AIMD自适应并发上限
 
-        # 文档标题
-        doc.preamble.append(Command("title", f"{data['doc_type']} - {data['name']}"))
-        doc.preamble.append(Command("author", data['name']))
-        doc.append(NoEscape(r"\maketitle"))
+    每次成功把上限增加 1/上限，遇到限流(429/503)或超时时上限减半。
+    同一轮并发中的多个限流响应只减半一次：减半后再完成的、减半前发出的请求不再触发减半。
+    """
 
-        # 添加照片部分
-        if data["photo_path"]:
-            # 复制照片到输出目录
-            try:
-                photo_filename = os.path.basename(data["photo_path"])
-                output_photo_path = os.path.join(OUTPUT_DIR, photo_filename)
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=16):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.epoch = 0  # 每次减半加1
+        self.condition = threading.Condition()
+        self.decreases = 0
+        self.successes = 0
 
-                # 如果照片不在输出目录，则复制过去
-                if not os.path.exists(output_photo_path):
-                    import shutil
-                    shutil.copy(data["photo_path"], output_photo_path)
+    def acquire(self, cancel_token=None):
+        """等待空闲名额，返回当前轮次(释放时传回release)"""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                if cancel_token:
+                    cancel_token.check()
+                self.condition.wait(0.2)
+            self.in_flight += 1
+            return self.epoch
 
-                with doc.create(Figure(position="h!")) as photo_fig:
-                    photo_fig.add_image(photo_filename, width=NoEscape(r"0.2\textwidth"))
-                    photo_fig.add_caption("个人照片")
-            except Exception as e:
-                print(f"照片处理错误: {str(e)}")
-
-        # 联系信息部分
-        with doc.create(Section("联系方式")):
-            doc.append(f"姓名: {data['name']}\n\n")
-            doc.append(f"邮箱: {data['email']}\n\n")
-            doc.append(f"电话: {data['phone']}\n\n")
-
-        # 教育背景部分
-        with doc.create(Section("教育背景")):
-            doc.append(f"{data['university']} | {data['major']}\n\n")
-            doc.append(f"GPA: {data['gpa']}\n\n")
-
-        # 添加AI生成的内容
-        if "留学" in data['doc_type']:
-            with doc.create(Section("申请陈述")):
-                doc.append(NoEscape(generated_content.replace("\n\n", "\n\n")))
-        else:
-            with doc.create(Section("求职意向")):
-                doc.append(f"目标职位: {data['target']}\n\n")
-            with doc.create(Section("个人陈述")):
-                doc.append(NoEscape(generated_content.replace("\n\n", "\n\n")))
+    def release(self, epoch, outcome):
+        """outcome: success / throttled / other"""
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.successes += 1
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif outcome == "throttled" and epoch == self.epoch:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.epoch += 1
+                self.decreases += 1
+            self.condition.notify_all()
 
-        # 添加成就部分
-        if data['awards']:
-            with doc.create(Section("获奖经历")):
-                doc.append(NoEscape(data['awards'].replace("\n", "\n\n")))
+    def stats(self):
+        with self.condition:
+            return {
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.limit),
+                "concurrency_decreases": self.decreases,
+            }
 
-        if data['research']:
-            with doc.create(Section("科研经历")):
-                doc.append(NoEscape(data['research'].replace("\n", "\n\n")))
 
-        if data['competitions']:
-            with doc.create(Section("竞赛经历")):
-                doc.append(NoEscape(data['competitions'].replace("\n", "\n\n")))
+class DeepSeekClient:
+    """进程内共享的API客户端
 
-        return doc
+    所有请求复用同一个requests.Session连接池(keep-alive)，避免每次生成都重新做DNS/TCP/TLS握手；
+    连接错误、超时和429/5xx按指数退避加随机抖动重试，429/503优先遵循Retry-After。
+    每次发送前先经过RPM/TPM令牌桶限流，再占用一个自适应并发名额，响应读完(done)后释放。
+    """
 
-    def preview_pdf(self):
-        if not hasattr(self, "generated_tex_path") or not self.generated_tex_path:
-            self.statusBar().showMessage("请先生成文书", 3000)
-            return
+    RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+    THROTTLE_STATUS = (429, 503)
 
-        # 在实际应用中应调用pdflatex编译
-        tex_file = self.generated_tex_path
-        pdf_path = tex_file.replace(".tex", ".pdf")
-
-        # 检查系统是否安装了pdflatex
-        if os.system("pdflatex --version") == 0:
-            # 在output目录中编译
-            os.chdir(OUTPUT_DIR)
-            os.system(f"pdflatex {os.path.basename(tex_file)}")
-
-            if os.path.exists(pdf_path):
-                # 跨平台打开PDF文件
-                if sys.platform == "win32":
-                    os.startfile(pdf_path)
-                elif sys.platform == "darwin":  # macOS
-                    os.system(f"open '{pdf_path}'")
-                else:  # Linux
-                    os.system(f"xdg-open '{pdf_path}'")
-            else:
-                QMessageBox.warning(self, "PDF生成失败", "无法生成PDF文件，请检查LaTeX安装")
-        else:
-            QMessageBox.information(
-                self,
-                "PDF预览",
-                "PDF预览需要安装LaTeX环境(如MiKTeX或TeX Live)\n"
-                f"生成的LaTeX文件已保存至: {self.generated_tex_path}"
-            )
+    def __init__(self, pool_size=16, connect_timeout=10, read_timeout=120,
+                 max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM, initial_concurrency=INITIAL_CONCURRENCY):
+        self.limiter = RateLimiter(rpm, tpm)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=pool_size)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
 
-    def export_latex(self):
-        if not hasattr(self, "generated_tex_path") or not self.generated_tex_path:
-            self.statusBar().showMessage("请先生成文书", 3000)
+        import requests.adapters
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def backoff_delay(self, attempt):
+        """full jitter：在[0, base*2^attempt]内随机取值"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def parse_retry_after(value):
+        """Retry-After可以是秒数或HTTP日期，无法解析时返回None"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        import email.utils
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        now = datetime.datetime.now(retry_at.tzinfo)
+        return max(0.0, (retry_at - now).total_seconds())
+
+    def post(self, url, headers, payload, stream=False, cancel_token=None, timeout=None, max_retries=None):
+        """发送POST请求，可重试的错误自动重试；返回最后一次的响应，用完后需调用done(response)
+
+        timeout为 (连接超时, 读取超时)，与max_retries一样为None时使用客户端的设置。
+        """
+        import requests
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        estimated = estimate_request_tokens(payload)
+        attempt = 0
+        while True:
+            if cancel_token:
+                cancel_token.check()
+            waited = self.limiter.acquire(estimated, cancel_token)
+            if waited:
+                get_metrics().record("rate_limit_wait", waited)
+            epoch = self.concurrency.acquire(cancel_token)
+            try:
+                response = self.session.post(
+                    url, headers=headers, json=payload, stream=stream, timeout=timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.concurrency.release(epoch, "throttled" if isinstance(e, requests.Timeout) else "other")
+                if attempt >= max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+            except BaseException:
+                self.concurrency.release(epoch, "other")
+                raise
+            else:
+                if response.status_code not in self.RETRYABLE_STATUS or attempt >= max_retries:
+                    response.concurrency_epoch = epoch
+                    response.estimated_tokens = estimated
+                    return response
+                delay = None
+                if response.status_code in self.THROTTLE_STATUS:
+                    delay = self.parse_retry_after(response.headers.get("Retry-After"))
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                response.close()
+                self.concurrency.release(epoch, self.outcome(response.status_code))
+            attempt += 1
+            # 多个工作线程共用同一客户端，计数与限流器共用一把锁
+            with self.limiter.lock:
+                self.retries += 1
+            if cancel_token:
+                # 等待期间被取消则立即结束
+                if cancel_token.event.wait(delay):
+                    raise RequestCancelled()
+            else:
+                time.sleep(delay)
+
+    def outcome(self, status_code):
+        if status_code == 200:
+            return "success"
+        return "throttled" if status_code in self.THROTTLE_STATUS else "other"
+
+    def done(self, response):
+        """关闭post返回的响应并释放并发名额(重复调用无副作用)"""
+        response.close()
+        epoch = response.__dict__.pop("concurrency_epoch", None)
+        if epoch is not None:
+            self.concurrency.release(epoch, self.outcome(response.status_code))
+
+    def settle(self, response, usage):
+        """按响应中的实际token用量修正预扣的TPM额度"""
+        if usage:
+            self.limiter.settle(response.estimated_tokens, usage.get("total_tokens"))
+
+    def stats(self):
+        """当前速率、进行中的请求数与限流次数"""
+        with self.limiter.lock:
+            retries = self.retries
+        return dict(self.limiter.stats(), **self.concurrency.stats(), retries=retries)
+
+    def close(self):
+        self.session.close()
+
+
+_api_client = None
+_api_client_lock = threading.Lock()
+
+
+def get_api_client():
+    """进程内共享的API客户端，所有界面线程和批量任务复用同一个连接池"""
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            _api_client = DeepSeekClient()
+        return _api_client
+
+
+def configure_api_client(**options):
+    """按给定参数(连接池大小、超时、重试次数等)替换共享客户端"""
+    global _api_client
+    with _api_client_lock:
+        if _api_client is not None:
+            _api_client.close()
+        _api_client = DeepSeekClient(**options)
+        return _api_client
+
+
+# ---------------------------------------------------------------------------
+# API后端与路由
+# ---------------------------------------------------------------------------
+
+# 每个后端保留最近多少次请求的耗时与成败
+BACKEND_WINDOW = 100
+# 连续失败次数达到该值后暂停使用该后端BACKEND_COOLDOWN秒，之后先放行少量请求试探
+BACKEND_MAX_FAILURES = 3
+BACKEND_COOLDOWN = 30.0
+# 错误率对排序的惩罚：得分 = 耗时中位数 * (1 + 系数 * 错误率)
+BACKEND_ERROR_PENALTY = 4.0
+HEALTH_CHECK_TIMEOUT = 5.0
+
+
+class Backend:
+    """一个OpenAI兼容的对话接口
+
+    base_url为到/v1为止的地址，请求发往 base_url/chat/completions，健康检查请求 base_url/models。
+    models把界面中的模型名映射为该后端的模型名，为空时接受所有模型且不改名。
+    api_key为空时使用界面或命令行传入的密钥；auth_header/auth_scheme用于Authorization以外的鉴权方式。
+    """
+
+    def __init__(self, name, base_url, models=None, api_key=None, auth_header="Authorization",
+                 auth_scheme="Bearer", connect_timeout=None, read_timeout=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.models = dict(models or {})
+        self.api_key = api_key
+        self.auth_header = auth_header
+        self.auth_scheme = auth_scheme
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    @classmethod
+    def from_url(cls, url, name=None):
+        """由完整的chat/completions地址创建后端"""
+        base_url = url[:-len("/chat/completions")] if url.endswith("/chat/completions") else url
+        return cls(name or base_url, base_url)
+
+    @classmethod
+    def from_config(cls, config):
+        """配置项中的api_key_env表示从该环境变量读取密钥"""
+        api_key = config.get("api_key") or os.environ.get(config.get("api_key_env") or "", "") or None
+        return cls(
+            config["name"], config["base_url"], models=config.get("models"), api_key=api_key,
+            auth_header=config.get("auth_header", "Authorization"), auth_scheme=config.get("auth_scheme", "Bearer"),
+            connect_timeout=config.get("connect_timeout"), read_timeout=config.get("read_timeout")
+        )
+
+    @property
+    def url(self):
+        return self.base_url + "/chat/completions"
+
+    def supports(self, model):
+        return not self.models or model in self.models
+
+    def model_name(self, model):
+        return self.models.get(model, model)
+
+    def headers(self, api_key):
+        key = self.api_key or api_key
+        headers = {"Content-Type": "application/json"}
+        if key:
+            headers[self.auth_header] = f"{self.auth_scheme} {key}" if self.auth_scheme else key
+        return headers
+
+    def timeout(self, client):
+        """(连接超时, 读取超时)，未配置的部分使用共享客户端的设置"""
+        return (self.connect_timeout or client.connect_timeout, self.read_timeout or client.read_timeout)
+
+
+class BackendRouter:
+    """按滚动耗时与错误率选择后端
+
+    每个后端记录最近BACKEND_WINDOW次请求的响应头耗时与成败。没有样本的后端优先使用，
+    以便尽快得到统计；连续失败的后端暂停一段时间，健康检查成功后立即恢复。
+    """
+
+    def __init__(self, backends):
+        if not backends:
+            raise ValueError("至少需要配置一个后端")
+        self.backends = list(backends)
+        self.samples = {backend.name: deque(maxlen=BACKEND_WINDOW) for backend in self.backends}
+        self.failures = {backend.name: 0 for backend in self.backends}
+        self.cooldown_until = {backend.name: 0.0 for backend in self.backends}
+        self.health = {}  # 后端名 -> 最近一次健康检查 {"ok", "status", "seconds", "checked_at"}
+        self.lock = threading.Lock()
+
+    def score(self, name):
+        """越小越好；没有样本时为0"""
+        samples = self.samples[name]
+        latencies = sorted(seconds for seconds, ok in samples if ok)
+        if not samples:
+            return 0.0
+        error_rate = sum(1 for _, ok in samples if not ok) / len(samples)
+        # 全部失败时按超时上限计
+        median = latencies[len(latencies) // 2] if latencies else 60.0
+        return median * (1 + BACKEND_ERROR_PENALTY * error_rate)
+
+    def candidates(self, model):
+        """支持该模型的后端，按优先顺序排列：可用的按得分，暂停中的按恢复时间排在最后"""
+        now = time.monotonic()
+        with self.lock:
+            supported = [backend for backend in self.backends if backend.supports(model)]
+            ready = [backend for backend in supported if self.cooldown_until[backend.name] <= now]
+            cooling = [backend for backend in supported if self.cooldown_until[backend.name] > now]
+            ready.sort(key=lambda backend: self.score(backend.name))
+            cooling.sort(key=lambda backend: self.cooldown_until[backend.name])
+        if not supported:
+            raise ValueError(f"没有后端支持模型 {model}")
+        return ready + cooling
+
+    def record(self, backend, seconds, ok):
+        with self.lock:
+            self.samples[backend.name].append((seconds, ok))
+            if ok:
+                self.failures[backend.name] = 0
+                self.cooldown_until[backend.name] = 0.0
+            else:
+                self.failures[backend.name] += 1
+                if self.failures[backend.name] >= BACKEND_MAX_FAILURES:
+                    self.cooldown_until[backend.name] = time.monotonic() + BACKEND_COOLDOWN
+
+    def check(self, backend, api_key="", session=None):
+        """请求 base_url/models 检查后端是否可达，结果计入该后端的统计"""
+        import requests
+        session = session or get_api_client().session
+        started = time.perf_counter()
+        try:
+            response = session.get(backend.base_url + "/models", headers=backend.headers(api_key),
+                                   timeout=(HEALTH_CHECK_TIMEOUT, HEALTH_CHECK_TIMEOUT))
+            response.close()
+            status = response.status_code
+            # 鉴权失败也说明服务可达；限流与5xx视为不健康
+            ok = status < 500 and status != 429
+        except requests.RequestException:
+            status, ok = None, False
+        seconds = time.perf_counter() - started
+        self.record(backend, seconds, ok)
+        with self.lock:
+            self.health[backend.name] = {"ok": ok, "status": status, "seconds": round(seconds, 3),
+                                         "checked_at": time.time()}
+        return self.health[backend.name]
+
+    def check_all(self, api_key=""):
+        """并行检查所有后端，返回 {后端名: 检查结果}"""
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(self.backends)) as executor:
+            results = list(executor.map(lambda backend: self.check(backend, api_key), self.backends))
+        return {backend.name: result for backend, result in zip(self.backends, results)}
+
+    def stats(self):
+        """各后端的请求数、错误率、耗时p50/p95与状态"""
+        now = time.monotonic()
+        result = {}
+        with self.lock:
+            for backend in self.backends:
+                samples = self.samples[backend.name]
+                latencies = sorted(seconds for seconds, ok in samples if ok)
+                result[backend.name] = {
+                    "url": backend.url,
+                    "samples": len(samples),
+                    "error_rate": round(sum(1 for _, ok in samples if not ok) / len(samples), 3) if samples else 0.0,
+                    "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                    "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1) if latencies else None,
+                    "score": round(self.score(backend.name), 4),
+                    "cooling_down": self.cooldown_until[backend.name] > now,
+                    "health": self.health.get(backend.name),
+                }
+        return result
+
+
+def load_backends(path=None):
+    """读取后端配置(JSON列表)，文件不存在时返回只含DeepSeek官方接口的列表"""
+    path = path or os.environ.get("RESUME_HELPER_BACKENDS") or BACKENDS_CONFIG
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+    except FileNotFoundError:
+        return [Backend.from_url(API_URL, name="deepseek")]
+    return [Backend.from_config(config) for config in configs]
+
+
+_backend_router = None
+_backend_router_lock = threading.Lock()
+
+
+def get_backend_router():
+    """进程内共享的后端路由"""
+    global _backend_router
+    with _backend_router_lock:
+        if _backend_router is None:
+            _backend_router = BackendRouter(load_backends())
+        return _backend_router
+
+
+def configure_backends(path=None, backends=None):
+    """按配置文件或给定的后端列表替换共享路由"""
+    global _backend_router
+    with _backend_router_lock:
+        _backend_router = BackendRouter(backends or load_backends(path))
+        return _backend_router
+
+
+def is_backend_failure(error):
+    """换一个后端可能成功的错误：连接失败、超时、限流与5xx"""
+    import requests
+    if isinstance(error, DeepSeekAPIError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def chat_completion(api_key, prompt, model="deepseek-chat", max_tokens=2000, stream=False,
+                    url=None, on_content=None, on_reasoning=None, on_progress=None, client=None,
+                    cancel_token=None):
+    """调用对话接口，返回 {"content", "reasoning", "usage", "backend"}
+
+    stream为True时逐块解析SSE，正文与推理过程增量分别交给on_content/on_reasoning回调，
+    进度按已收到token数占max_tokens的比例通过on_progress回调。
+    传入cancel_token时可从其他线程取消，取消后抛出RequestCancelled。
+    url为None时由共享的后端路由选择得分最好的后端，连接失败、超时、限流或5xx时换下一个后端
+    (已开始输出正文后不再切换)；指定url时直接请求该地址。
+    """
+    if url:
+        return backend_completion(
+            Backend.from_url(url), api_key, prompt, model, max_tokens, stream,
+            on_content, on_reasoning, on_progress, client, cancel_token
+        )
+
+    router = get_backend_router()
+    candidates = router.candidates(model)
+    output_started = []
+
+    def track(callback):
+        if callback is None:
+            return None
+
+        def emit(value):
+            output_started.append(True)
+            callback(value)
+        return emit
+
+    for index, backend in enumerate(candidates):
+        last = index == len(candidates) - 1
+        try:
+            # 还有其他后端可换时不在同一个后端上重试
+            return backend_completion(
+                backend, api_key, prompt, model, max_tokens, stream,
+                track(on_content), track(on_reasoning), on_progress, client, cancel_token,
+                router=router, max_retries=None if last else 0
+            )
+        except Exception as e:
+            if last or output_started or not is_backend_failure(e):
+                raise
+
+
+def backend_completion(backend, api_key, prompt, model, max_tokens, stream, on_content, on_reasoning,
+                       on_progress, client, cancel_token, router=None, max_retries=None):
+    """向一个后端发出请求；传入router时把响应头耗时与成败计入该后端的统计"""
+    import requests
+    headers = backend.headers(api_key)
+
+    data = {
+        "model": backend.model_name(model),
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens,
+        "stream": stream
+    }
+
+    client = client or get_api_client()
+
+    def post(stream):
+        started = time.perf_counter()
+        try:
+            with get_metrics().stage("connect", model=model, backend=backend.name):
+                response = client.post(backend.url, headers, data, stream=stream, cancel_token=cancel_token,
+                                       timeout=backend.timeout(client), max_retries=max_retries)
+        except (requests.ConnectionError, requests.Timeout):
+            if router:
+                router.record(backend, time.perf_counter() - started, False)
+            raise
+        if router:
+            failed = response.status_code == 429 or response.status_code >= 500
+            router.record(backend, response.elapsed.total_seconds(), not failed)
+        return response
+
+    if not stream:
+        if on_progress:
+            on_progress(30)
+        # 可取消的请求按流式读取响应体，关闭响应即可中断
+        response = post(cancel_token is not None)
+        try:
+            if cancel_token:
+                cancel_token.attach(response)
+            if on_progress:
+                on_progress(70)
+            if response.status_code != 200:
+                raise DeepSeekAPIError(response.status_code, response.text)
+            result = response.json()
+        except RequestCancelled:
+            raise
+        except Exception:
+            if cancel_token and cancel_token.cancelled:
+                raise RequestCancelled()
+            raise
+        finally:
+            client.done(response)
+        client.settle(response, result.get('usage'))
+        message = result['choices'][0]['message']
+        return {
+            "content": message['content'],
+            "reasoning": message.get('reasoning_content') or "",
+            "usage": result.get('usage') or {},
+            "backend": backend.name
+        }
+
+    data["stream_options"] = {"include_usage": True}
+    started = time.perf_counter()
+    response = post(True)
+    try:
+        if cancel_token:
+            cancel_token.attach(response)
+        if response.status_code != 200:
+            raise DeepSeekAPIError(response.status_code, response.text)
+
+        content_parts = []
+        reasoning_parts = []
+        usage = {}
+        received = 0  # 已收到的token数(每个增量块约为一个token)
+        last_percent = 0
+        for chunk in iter_sse_data(response.iter_lines()):
+            if cancel_token:
+                cancel_token.check()
+            for choice in chunk.get("choices") or []:
+                delta = choice.get("delta") or {}
+                reasoning = delta.get("reasoning_content")
+                if not received and (reasoning or delta.get("content")):
+                    get_metrics().record("ttft", time.perf_counter() - started, model=model)
+                if reasoning:
+                    received += 1
+                    reasoning_parts.append(reasoning)
+                    if on_reasoning:
+                        on_reasoning(reasoning)
+                text = delta.get("content")
+                if text:
+                    received += 1
+                    content_parts.append(text)
+                    if on_content:
+                        on_content(text)
+
+            # 最后一块携带usage时以实际completion_tokens为准
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+                received = usage.get("completion_tokens") or received
+
+            percent = min(99, received * 100 // max(1, max_tokens))
+            if on_progress and percent != last_percent:
+                last_percent = percent
+                on_progress(percent)
+
+        client.settle(response, usage)
+        return {
+            "content": "".join(content_parts),
+            "reasoning": "".join(reasoning_parts),
+            "usage": usage,
+            "backend": backend.name
+        }
+    except RequestCancelled:
+        raise
+    except Exception:
+        # 被其他线程关闭响应时，读取会以各种连接错误的形式中断
+        if cancel_token and cancel_token.cancelled:
+            raise RequestCancelled()
+        raise
+    finally:
+        client.done(response)
+
+
+class ResponseCache:
+    """LLM响应的本地缓存(SQLite)
+
+    键为模型、系统提示词、用户提示词、temperature与max_tokens的SHA-256，
+    超过max_age秒的条目过期，总大小超过max_bytes时按最近访问时间(LRU)淘汰。
+    """
+
+    def __init__(self, path=None, max_bytes=200 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.path = path or os.path.join(CACHE_DIR, "responses.sqlite")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT,
+                reasoning TEXT,
+                usage TEXT,
+                size INTEGER,
+                created_at REAL,
+                accessed_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model, system_prompt, prompt, temperature, max_tokens):
+        raw = json.dumps([model, system_prompt, prompt, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content, reasoning, usage, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[3] > self.max_age:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if not row:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return {"content": row[0], "reasoning": row[1], "usage": json.loads(row[2] or "{}")}
+
+    def put(self, key, model, result):
+        now = time.time()
+        content = result.get("content") or ""
+        reasoning = result.get("reasoning") or ""
+        size = len(content.encode("utf-8")) + len(reasoning.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, content, reasoning, json.dumps(result.get("usage") or {}), size, now, now)
+            )
+            self.evict(now)
+            self.conn.commit()
+
+    def evict(self, now=None):
+        """删除过期条目，再按LRU淘汰到max_bytes以内 (调用方需持有锁)"""
+        now = now or time.time()
+        self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """进程内共享的响应缓存"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+class HistoryStore:
+    """生成历史(SQLite)：表单快照、提示词、模型、正文、token用量与.tex/PDF路径
+
+    FTS5全文索引(trigram分词，中英文都可按任意子串搜索)覆盖申请人、申请目标和正文，
+    结果按时间倒序直接从索引中取前limit条，10万份文书时单次查询仍在毫秒级。
+    SQLite不支持trigram时退化为LIKE查询。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(OUTPUT_DIR, "history.sqlite")
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # 列表与搜索只用到的字段放在窄表中，大段文本单独存放，短词LIKE查询时扫描的数据量小
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS generations (
+                id INTEGER PRIMARY KEY,
+                created_at REAL,
+                name TEXT,
+                target TEXT,
+                doc_type TEXT,
+                model TEXT,
+                tex_path TEXT,
+                pdf_path TEXT
+            );
+            CREATE TABLE IF NOT EXISTS generation_texts (
+                id INTEGER PRIMARY KEY,
+                form TEXT,
+                prompt TEXT,
+                content TEXT,
+                usage TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_generations_tex ON generations(tex_path);
+            CREATE VIEW IF NOT EXISTS generations_search AS
+                SELECT g.id, g.name, g.target, t.content FROM generations g JOIN generation_texts t ON t.id = g.id;
+        """)
+        try:
+            # 外部内容表：索引本身不保存正文，snippet()按rowid从视图中读取
+            self.conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5(
+                    name, target, content, content='generations_search', content_rowid='id', tokenize='trigram'
+                )
+            """)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+        self.conn.commit()
+
+    def add(self, data, model, prompt, content, usage=None, tex_path=""):
+        """记录一次生成，返回记录id"""
+        name, target = data.get("name", ""), data.get("target", "")
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO generations (created_at, name, target, doc_type, model, tex_path, pdf_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, '')",
+                (time.time(), name, target, data.get("doc_type", ""), model, tex_path)
+            )
+            record_id = cursor.lastrowid
+            self.conn.execute(
+                "INSERT INTO generation_texts VALUES (?, ?, ?, ?, ?)",
+                (record_id, json.dumps(data, ensure_ascii=False), prompt, content, json.dumps(usage or {}))
+            )
+            if self.fts:
+                self.conn.execute(
+                    "INSERT INTO generations_fts (rowid, name, target, content) VALUES (?, ?, ?, ?)",
+                    (record_id, name, target, content)
+                )
+            self.conn.commit()
+        return record_id
+
+    def set_pdf_path(self, tex_path, pdf_path):
+        with self.lock:
+            self.conn.execute("UPDATE generations SET pdf_path = ? WHERE tex_path = ?", (pdf_path, tex_path))
+            self.conn.commit()
+
+    def search(self, query="", limit=50):
+        """按申请人、申请目标或正文搜索，返回最新的limit条摘要
+
+        每个词至少3个字符时走全文索引；有更短的词(如两个字的姓名)时只在申请人与申请目标中查找。
+        """
+        terms = query.split()
+        columns = "g.id, g.created_at, g.name, g.target, g.doc_type, g.model, g.tex_path"
+        with self.lock:
+            if not terms:
+                rows = self.conn.execute(
+                    f"SELECT {columns}, substr(t.content, 1, 80) FROM generations g JOIN generation_texts t ON t.id = g.id "
+                    "ORDER BY g.id DESC LIMIT ?",
+                    (limit,)
+                ).fetchall()
+            elif self.fts and all(len(term) >= 3 for term in terms):
+                match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+                rows = self.conn.execute(
+                    f"SELECT {columns}, f.snippet FROM ("
+                    "  SELECT rowid, snippet(generations_fts, 2, '[', ']', '…', 16) AS snippet"
+                    "  FROM generations_fts WHERE generations_fts MATCH ? ORDER BY rowid DESC LIMIT ?"
+                    ") f JOIN generations g ON g.id = f.rowid ORDER BY g.id DESC",
+                    (match, limit)
+                ).fetchall()
+            else:
+                conditions = " AND ".join("(g.name LIKE ? ESCAPE '\\' OR g.target LIKE ? ESCAPE '\\')" for _ in terms)
+                patterns = []
+                for term in terms:
+                    pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    patterns += [pattern, pattern]
+                rows = self.conn.execute(
+                    f"SELECT {columns}, substr(t.content, 1, 80) FROM ("
+                    f"  SELECT * FROM generations g WHERE {conditions} ORDER BY g.id DESC LIMIT ?"
+                    ") g JOIN generation_texts t ON t.id = g.id ORDER BY g.id DESC",
+                    patterns + [limit]
+                ).fetchall()
+        keys = ["id", "created_at", "name", "target", "doc_type", "model", "tex_path", "snippet"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def get(self, record_id):
+        """读取完整记录(含表单快照与正文)，不存在时返回None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT g.id, created_at, name, target, doc_type, model, form, prompt, content, usage, tex_path, pdf_path "
+                "FROM generations g JOIN generation_texts t ON t.id = g.id WHERE g.id = ?", (record_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(["id", "created_at", "name", "target", "doc_type", "model", "form", "prompt", "content",
+                           "usage", "tex_path", "pdf_path"], row))
+        record["form"] = json.loads(record["form"] or "{}")
+        record["usage"] = json.loads(record["usage"] or "{}")
+        return record
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """进程内共享的生成历史"""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = HistoryStore()
+        return _history_store
+
+
+def record_generation(data, model, prompt, content, usage=None, tex_path=""):
+    """把一次生成写入历史；content为字符串或分段的 [(标题, 正文)] 列表。写入失败不影响生成"""
+    if not isinstance(content, str):
+        content = sections_to_text(content)
+    try:
+        return get_history_store().add(data, model, prompt, content, usage, tex_path)
+    except Exception as e:
+        get_metrics().log({"event": "history_write_failed", "error": str(e), "tex_path": tex_path})
+        return None
+
+
+
+class LatencyTracker:
+    """按 (模型, 调用类型) 记录最近若干次请求耗时的滚动分布，用于快速策略的对冲时机
+
+    整篇文书、分段、提纲与修复请求的长度相差很大，分开统计，短请求不会拉低文书请求的百分位。
+    """
+
+    def __init__(self, window=200, path=None):
+        self.window = window
+        self.path = path or os.path.join(CACHE_DIR, "latency.json")
+        self.samples = {}  # (模型, 调用类型) -> 最近的耗时
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for model, kinds in json.load(f).items():
+                    if not isinstance(kinds, dict):
+                        continue  # 旧格式的样本没有区分调用类型，不再使用
+                    for kind, values in kinds.items():
+                        self.samples[(model, kind)] = deque(values, maxlen=window)
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def record(self, model, seconds, kind="document"):
+        with self.lock:
+            self.samples.setdefault((model, kind), deque(maxlen=self.window)).append(round(seconds, 3))
+            snapshot = {}
+            for (sample_model, sample_kind), values in self.samples.items():
+                snapshot.setdefault(sample_model, {})[sample_kind] = list(values)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+        except OSError:
+            pass
+
+    def percentile(self, model, q, min_samples=5, kind="document"):
+        """返回该模型这类调用耗时的第q百分位(秒)，样本不足时返回None"""
+        with self.lock:
+            values = sorted(self.samples.get((model, kind)) or [])
+        if len(values) < min_samples:
+            return None
+        index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+        return values[index]
+
+    def summary(self):
+        """{(模型, 调用类型): 样本数与p50/p95/p99}"""
+        return {
+            (model, kind): {
+                "count": len(self.samples.get((model, kind)) or []),
+                "p50": self.percentile(model, 50, 1, kind),
+                "p95": self.percentile(model, 95, 1, kind),
+                "p99": self.percentile(model, 99, 1, kind),
+            }
+            for model, kind in list(self.samples)
+        }
+
+
+_latency_tracker = None
+_latency_tracker_lock = threading.Lock()
+
+
+# 耗时统计中的调用类型：整篇文书、个人陈述的分段与提纲、LaTeX修复；流式请求另加"/stream"
+LATENCY_KINDS = {"document": "文书", "section": "分段", "outline": "提纲", "repair": "修复"}
+
+
+def latency_kind(kind, stream):
+    return f"{kind}/stream" if stream else kind
+
+
+def get_latency_tracker():
+    """进程内共享的模型耗时统计"""
+    global _latency_tracker
+    with _latency_tracker_lock:
+        if _latency_tracker is None:
+            _latency_tracker = LatencyTracker()
+        return _latency_tracker
+
+
+def generate_completion(api_key, prompt, model="deepseek-chat", max_tokens=2000, stream=False,
+                        url=None, on_content=None, on_reasoning=None, on_progress=None,
+                        cache=None, force_refresh=False, cancel_token=None, kind="document"):
+    """先查响应缓存，未命中(或强制重新生成)时调用API并写入缓存，结果中cached标记是否命中
+
+    kind为调用类型(见LATENCY_KINDS)，耗时按模型和调用类型分别统计。
+    """
+    key = None
+    if cache is not None:
+        key = ResponseCache.make_key(model, SYSTEM_PROMPT, prompt, TEMPERATURE, max_tokens)
+        if not force_refresh:
+            result = cache.get(key)
+            if result is not None:
+                if on_reasoning and result["reasoning"]:
+                    on_reasoning(result["reasoning"])
+                if on_content:
+                    on_content(result["content"])
+                return dict(result, cached=True)
+
+    started = time.perf_counter()
+    result = chat_completion(
+        api_key, prompt, model, max_tokens=max_tokens, stream=stream, url=url,
+        on_content=on_content, on_reasoning=on_reasoning, on_progress=on_progress,
+        cancel_token=cancel_token
+    )
+    elapsed = time.perf_counter() - started
+    get_latency_tracker().record(model, elapsed, latency_kind(kind, stream))
+    metrics = get_metrics()
+    metrics.record("completion", elapsed, model=model, stream=stream, usage=result["usage"])
+    metrics.record_usage(model, result["usage"])
+    metrics.record_estimate(model, estimate_prompt_tokens(prompt), max_tokens, result["usage"])
+    if cache is not None and result["content"]:
+        cache.put(key, model, result)
+    return dict(result, cached=False)
+
+
+# 快速策略：推理模型超时后回退到的模型
+FALLBACK_MODELS = {"deepseek-reasoner": "deepseek-chat"}
+HEDGE_PERCENTILE = 95
+FALLBACK_DEADLINE = 60.0  # 推理模型耗时样本不足时的回退等待时间(秒)
+# 耗时样本不足时的对冲等待时间(秒)
+DEFAULT_HEDGE_DELAY = {"deepseek-chat": 20.0, "deepseek-reasoner": FALLBACK_DEADLINE}
+
+
+def hedge_plan(model, hedge_percentile=HEDGE_PERCENTILE, fallback_deadline=FALLBACK_DEADLINE, tracker=None,
+               kind="document"):
+    """返回 (对冲请求的模型, 发出前的等待秒数)
+
+    等待时间为该模型同类调用(kind，见latency_kind)历史耗时的第hedge_percentile百分位：推理模型超过后回退到通用模型，
+    其他模型超过后再发出一个相同的请求。推理模型样本不足时等待fallback_deadline，为0时不回退。
+    """
+    tracker = tracker or get_latency_tracker()
+    delay = tracker.percentile(model, hedge_percentile, kind=kind)
+    if model in FALLBACK_MODELS and fallback_deadline:
+        return FALLBACK_MODELS[model], delay if delay is not None else fallback_deadline
+    return model, delay if delay is not None else DEFAULT_HEDGE_DELAY.get(model, 20.0)
+
+
+def hedged_completion(api_key, prompt, model="deepseek-chat", max_tokens=2000, stream=False,
+                      url=None, on_content=None, on_reasoning=None, on_progress=None,
+                      cache=None, force_refresh=False, cancel_token=None,
+                      hedge_percentile=HEDGE_PERCENTILE, fallback_deadline=FALLBACK_DEADLINE, kind="document"):
+    """快速策略：主请求迟迟未完成时再发出对冲请求，先返回有效结果的获胜，另一个被取消
+
+    结果中model为获胜请求使用的模型，hedged标记是否发出过对冲请求。
+    流式回调只转发一个请求的输出，避免两路内容混在一起：第一个输出正文或推理过程且仍在进行的请求
+    成为转发对象(进度不算)；它落败被取消或失败后不再转发，由另一个仍在进行的请求接替，并先补发该请求
+    已收到的输出。确定转发对象之前，进度取各请求中的最大值。
+    """
+    hedge_model, delay = hedge_plan(model, hedge_percentile, fallback_deadline, kind=latency_kind(kind, stream))
+    outcomes = queue.Queue()
+    tokens = []
+    owner = []
+    buffered = {}  # 非转发对象的请求已收到的输出 [(回调, 内容)]，接替时补发
+    progress = [0]
+    owner_lock = threading.Lock()
+
+    def forward(token, callback, claims=True):
+        if callback is None:
+            return None
+
+        def emit(value):
+            with owner_lock:
+                if token.cancelled:
+                    return  # 落败或已失败的请求不再转发
+                current = owner[0] if owner and not owner[0].cancelled else None
+                if not claims:
+                    if current is token or (current is None and value > progress[0]):
+                        progress[0] = value
+                        callback(value)
+                    return
+                if current is None:
+                    owner[:] = [token]
+                    current = token
+                    for pending_callback, pending_value in buffered.pop(token, []):
+                        pending_callback(pending_value)
+                if current is token:
+                    callback(value)
+                else:
+                    buffered.setdefault(token, []).append((callback, value))
+        return emit
+
+    def launch(attempt_model):
+        token = CancelToken()
+        tokens.append(token)
+
+        def run():
+            try:
+                result = generate_completion(
+                    api_key, prompt, attempt_model, max_tokens=max_tokens, stream=stream, url=url,
+                    on_content=forward(token, on_content), on_reasoning=forward(token, on_reasoning),
+                    on_progress=forward(token, on_progress, claims=False),
+                    cache=cache, force_refresh=force_refresh, cancel_token=token, kind=kind
+                )
+                outcomes.put((token, attempt_model, result, None))
+            except Exception as e:
+                outcomes.put((token, attempt_model, None, e))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def cancel_all(keep=None):
+        for token in tokens:
+            if token is not keep:
+                token.cancel()
+
+    launch(model)
+    pending = 1
+    hedged = False
+    errors = []
+    deadline = time.monotonic() + delay
+    while pending:
+        if cancel_token and cancel_token.cancelled:
+            cancel_all()
+            raise RequestCancelled()
+        # 每0.2秒检查一次外部取消
+        timeout = 0.2 if hedged else max(0.0, min(0.2, deadline - time.monotonic()))
+        try:
+            token, attempt_model, result, error = outcomes.get(timeout=timeout)
+        except queue.Empty:
+            if not hedged and time.monotonic() >= deadline:
+                hedged = True
+                pending += 1
+                launch(hedge_model)
+            continue
+        pending -= 1
+        if error is None and result["content"]:
+            cancel_all(keep=token)
+            return dict(result, model=attempt_model, hedged=hedged)
+        token.cancel()  # 失败的请求不再转发输出，由另一个请求接替
+        errors.append(error or DeepSeekAPIError(200, "返回内容为空"))
+        if isinstance(error, DeepSeekAPIError) and 400 <= error.status_code < 500 and error.status_code != 429:
+            # 密钥无效、参数错误等换模型也无济于事
+            cancel_all()
+            raise error
+        if not hedged:
+            # 主请求已失败(客户端已做过重试)，直接用对冲模型再试一次
+            hedged = True
+            pending += 1
+            launch(hedge_model)
+    raise errors[0]
+
+
+class DeepSeekAPIWorker(QThread):
+    """后台线程处理DeepSeek API调用"""
+    finished = pyqtSignal(str, bool)  # (生成内容, 是否成功)
+    progress = pyqtSignal(int)  # 进度百分比
+    content_delta = pyqtSignal(str)  # 流式输出的正文增量
+    reasoning_delta = pyqtSignal(str)  # 流式输出的推理过程增量(deepseek-reasoner)
+    cache_hit = pyqtSignal(float)  # 命中响应缓存时发出，参数为耗时(毫秒)
+    routed = pyqtSignal(str, bool)  # 快速策略下获胜请求的模型，以及是否发出过对冲请求
+    checked = pyqtSignal(object)  # 正文检查结果(check_latex的返回值)
+    completed = pyqtSignal(object)  # 请求结果(模型、token用量等)，在finished之前发出
+
+    def __init__(self, api_key, prompt, model="deepseek-chat", parent=None,
+                 stream=True, max_tokens=2000, cache=None, force_refresh=False, fast_policy=False):
+        super().__init__(parent)
+        self.fast_policy = fast_policy
+        self.api_key = api_key
+        self.prompt = prompt
+        self.model = model
+        self.stream = stream
+        self.max_tokens = max_tokens
+        self.cache = cache
+        self.force_refresh = force_refresh
+        self.url = None  # None表示由后端路由选择
+        self.cancel_token = CancelToken()
+
+    def cancel(self):
+        """从界面线程取消：中断进行中的HTTP请求或重试等待"""
+        self.cancel_token.cancel()
+
+    def run(self):
+        try:
+            started = time.perf_counter()
+            complete = hedged_completion if self.fast_policy else generate_completion
+            result = complete(
+                self.api_key, self.prompt, self.model,
+                max_tokens=self.max_tokens,
+                stream=self.stream,
+                url=self.url,
+                on_content=self.content_delta.emit,
+                on_reasoning=self.reasoning_delta.emit,
+                on_progress=self.progress.emit,
+                cache=self.cache,
+                force_refresh=self.force_refresh,
+                cancel_token=self.cancel_token
+            )
+            if result["cached"]:
+                self.cache_hit.emit((time.perf_counter() - started) * 1000)
+            if self.fast_policy:
+                self.routed.emit(result["model"], result["hedged"])
+            checked = check_latex(result["content"], repair=self.repair)
+            # 修复请求被取消时check_latex不会抛出异常，这里再检查一次
+            self.cancel_token.check()
+            self.checked.emit(checked)
+            self.completed.emit(dict(result, model=result.get("model", self.model)))
+            self.progress.emit(100)
+            self.finished.emit(checked["text"], True)
+        except RequestCancelled:
+            self.finished.emit("已取消", False)
+        except DeepSeekAPIError as e:
+            self.finished.emit(str(e), False)
+        except Exception as e:
+            self.finished.emit(f"请求异常: {str(e)}", False)
+
+    def repair(self, prompt):
+        return generate_completion(
+            self.api_key, prompt, REPAIR_MODEL, max_tokens=REPAIR_MAX_TOKENS, url=self.url, cache=self.cache,
+            cancel_token=self.cancel_token, kind="repair"
+        )["content"]
+
+
+# 界面中同时运行的生成任务数，其余任务排队
+JOB_POOL_SIZE = 2
+JOB_STATES = {"queued": "排队中", "running": "生成中", "done": "已完成", "failed": "失败", "cancelled": "已取消"}
+
+
+class GenerationJob:
+    """界面中的一次文书生成任务"""
+
+    def __init__(self, job_id, key, api_key, data, prompt, model, options):
+        self.id = job_id
+        self.key = key
+        self.api_key = api_key
+        self.data = data  # 提交时的表单，完成后按它生成文档
+        self.prompt = prompt
+        self.model = model
+        self.options = options  # 传给DeepSeekAPIWorker(分段生成时为SectionedStatementWorker)的其他参数
+        self.state = "queued"
+        self.worker = None
+        self.content = ""  # 完成时为生成的正文，失败时为错误信息
+        self.content_parts = []  # 流式输出的正文与推理过程，切换预览时用
+        self.reasoning_parts = []
+        self.checked = None
+        self.result = None
+        self.cache_hit_ms = None
+        self.route = None
+        self.tex_path = ""
+        self.fan_out = False  # 多目标生成的任务，不占用任务池名额
+        self.after = None  # 该任务结束后才开始(多目标生成中预热共享前缀的第一个目标)
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.ended_at = None
+
+    @property
+    def pending(self):
+        return self.state in ("queued", "running")
+
+    @property
+    def sectioned(self):
+        """分段生成的个人陈述，result为generate_sections_async的返回值"""
+        return bool(self.options.get("sectioned"))
+
+    @property
+    def label(self):
+        return f"{self.data['doc_type']} - {self.data['name'] or '未填写姓名'} -> {self.data['target'] or '未填写目标'}"
+
+    def usage(self):
+        """完成的任务的token用量(命中本地缓存时为原请求的用量)"""
+        return (self.result or {}).get("usage") or {}
+
+    def elapsed(self):
+        """运行耗时(秒)，尚未开始时为None"""
+        if self.started_at is None:
+            return None
+        return (self.ended_at or time.perf_counter()) - self.started_at
+
+
+class JobQueue(QObject):
+    """有上限的生成任务池：最多同时运行pool_size个生成线程，其余按提交顺序排队
+
+    每个任务是一份文书：单次请求(DeepSeekAPIWorker，瘦客户端模式下为ServiceJobWorker)
+    或分段生成的个人陈述(SectionedStatementWorker)；多目标生成时每个申请目标一个任务，
+    这些任务不受pool_size限制同时运行(实际并发请求数仍由共享客户端的限流与自适应并发控制)。
+
+    表单、提示词、模型和选项都相同的任务尚未结束时不会重复提交；
+    取消运行中的任务会中断HTTP请求并立即释放名额(请求头尚未返回时，后台线程在响应到达时关闭连接后退出)。
+    """
+    job_started = pyqtSignal(object)  # 任务开始运行，可在此连接worker的流式输出信号
+    job_changed = pyqtSignal(object)  # 任务状态变化
+    job_finished = pyqtSignal(object)  # 任务结束(完成、失败或取消)
+
+    def __init__(self, pool_size=JOB_POOL_SIZE, service_url=None, parent=None):
+        super().__init__(parent)
+        self.pool_size = pool_size
+        self.service_url = service_url  # 设置时由本地生成服务执行任务(ServiceJobWorker)，包括分段生成
+        self.jobs = []
+        self.next_id = 1
+
+    @staticmethod
+    def make_key(api_key, data, prompt, model, options):
+        # 上次的分段结果只用于增量生成，不参与去重
+        options = {name: value for name, value in options.items() if name not in ("cache", "previous")}
+        raw = json.dumps([api_key, data, prompt, model, options], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def submit(self, api_key, data, prompt, model, fan_out=False, after=None, **options):
+        """提交任务，返回 (任务, 是否新建)；相同的任务尚未结束时返回已有任务
+
+        fan_out为True时任务不占用任务池名额；after为另一个任务时，等它结束后才开始。
+        """
+        key = self.make_key(api_key, data, prompt, model, options)
+        for job in self.jobs:
+            if job.key == key and job.pending:
+                return job, False
+        job = GenerationJob(self.next_id, key, api_key, dict(data), prompt, model, options)
+        job.fan_out = fan_out
+        job.after = after
+        self.next_id += 1
+        self.jobs.append(job)
+        self.job_changed.emit(job)
+        self.schedule()
+        return job, True
+
+    def running_count(self):
+        return sum(job.state == "running" for job in self.jobs)
+
+    def pending_count(self):
+        return sum(job.pending for job in self.jobs)
+
+    def pooled_count(self):
+        """占用任务池名额的运行中任务数"""
+        return sum(job.state == "running" and not job.fan_out for job in self.jobs)
+
+    def schedule(self):
+        for job in self.jobs:
+            if job.state != "queued" or (job.after is not None and job.after.pending):
+                continue
+            if job.fan_out or self.pooled_count() < self.pool_size:
+                self.start(job)
+
+    def start(self, job):
+        options = dict(job.options)
+        if job.sectioned and not self.service_url:
+            options.pop("sectioned")
+            worker = SectionedStatementWorker(job.api_key, job.data, job.model, **options)
+            worker.finished.connect(lambda result, success: self.handle_sections_finished(job, result, success))
+        else:
+            if self.service_url:
+                # 分段生成也交给服务，completed发出的分段结果与本地相同
+                worker = ServiceJobWorker(self.service_url, job.api_key, job.data, job.model, **options)
+            else:
+                worker = DeepSeekAPIWorker(job.api_key, job.prompt, job.model, **options)
+            worker.cache_hit.connect(lambda elapsed_ms: setattr(job, "cache_hit_ms", elapsed_ms))
+            worker.routed.connect(lambda model, hedged: setattr(job, "route", (model, hedged)))
+            worker.completed.connect(lambda result: setattr(job, "result", result))
+            worker.finished.connect(lambda content, success: self.handle_finished(job, content, success))
+        worker.checked.connect(lambda checked: setattr(job, "checked", checked))
+        worker.content_delta.connect(job.content_parts.append)
+        worker.reasoning_delta.connect(job.reasoning_parts.append)
+        job.worker = worker
+        job.state = "running"
+        job.started_at = time.perf_counter()
+        self.job_started.emit(job)
+        self.job_changed.emit(job)
+        worker.start()
+
+    def handle_sections_finished(self, job, result, success):
+        """分段生成完成：正文为各段合并后的文本，分段结果保存在job.result"""
+        if success and job.state == "running":
+            job.result = result
+            result = sections_to_text(merge_sections(result))
+        self.handle_finished(job, result, success)
+
+    def handle_finished(self, job, content, success):
+        if job.state != "running":
+            return  # 已取消的任务，忽略后台线程随后发出的结果
+        job.state = "done" if success else "failed"
+        job.content = content
+        self.end(job)
+
+    def end(self, job):
+        job.ended_at = time.perf_counter()
+        self.job_changed.emit(job)
+        self.job_finished.emit(job)
+        self.schedule()
+
+    def cancel(self, job):
+        if not job.pending:
+            return
+        if job.worker is not None:
+            job.worker.cancel()
+        job.state = "cancelled"
+        self.end(job)
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def clear_finished(self):
+        """移除已结束的任务(后台线程仍在退出的除外)"""
+        self.jobs = [job for job in self.jobs
+                     if job.pending or (job.worker is not None and job.worker.isRunning())]
+
+    def wait(self, timeout_ms=3000):
+        """等待后台线程退出(关闭窗口时使用)"""
+        deadline = time.monotonic() + timeout_ms / 1000
+        for job in self.jobs:
+            if job.worker is not None:
+                job.worker.wait(max(0, int((deadline - time.monotonic()) * 1000)))
+
+
+# 文书使用fontspec设置中文字体，只能用XeLaTeX/LuaLaTeX编译
+LATEX_ENGINES = ["xelatex", "lualatex"]
+
+# 导言区中可预编译部分的结束标记(mylatexformat)：之前的宏包载入存入格式文件，之后的字体设置等每次编译时执行。
+# XeTeX/LuaTeX无法把已加载的字体存入格式文件，所以\setmainfont必须放在标记之后。
+# 不使用格式文件编译时，\csname endofdump\endcsname展开为\relax，不影响结果
+ENDOFDUMP = r"\csname endofdump\endcsname"
+FORMAT_DIR = os.path.join(CACHE_DIR, "formats")
+# LuaLaTeX的格式文件无法保存luaotfload的状态，只为XeLaTeX预编译
+FORMAT_ENGINES = ["xelatex"]
+
+
+class LatexCompileError(Exception):
+    """LaTeX编译失败或超时"""
+
+
+def find_latex_engine():
+    """返回系统中可用的LaTeX引擎，找不到时返回None"""
+    for engine in LATEX_ENGINES:
+        if shutil.which(engine):
+            return engine
+    return None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def kill_process_tree(process):
+    """终止进程及其子进程(POSIX下进程以新会话启动，可整组终止)"""
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def engine_version(engine):
+    """引擎版本信息的第一行；格式文件只能由生成它的同一版本引擎读取"""
+    try:
+        completed = subprocess.run([engine, "--version"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return completed.stdout.split("\n", 1)[0]
+
+
+def tex_preamble_head(tex_path):
+    """返回.tex中ENDOFDUMP之前的部分，没有该标记时返回None"""
+    with open(tex_path, "r", encoding="utf-8") as f:
+        text = f.read(64 * 1024)
+    index = text.find(ENDOFDUMP)
+    return text[:index] if index >= 0 else None
+
+
+_format_lock = threading.Lock()
+
+
+def build_format(head, engine, timeout=300):
+    """用mylatexformat把导言区的宏包载入部分预编译为格式文件，返回格式名(已存在时直接返回)
+
+    格式名包含导言区、引擎及其版本的哈希，导言区或TeX发行版更新后会自动生成新的格式文件。
+    """
+    digest = hashlib.sha256(f"{engine}\n{engine_version(engine)}\n{head}".encode("utf-8")).hexdigest()[:16]
+    name = f"preamble_{digest}"
+    fmt_path = os.path.join(FORMAT_DIR, name + ".fmt")
+    with _format_lock:
+        if os.path.exists(fmt_path):
+            return name
+        os.makedirs(FORMAT_DIR, exist_ok=True)
+        with open(os.path.join(FORMAT_DIR, name + ".tex"), "w", encoding="utf-8") as f:
+            f.write(head + ENDOFDUMP + "%\n\\begin{document}%\n\\end{document}\n")
+        # 先以临时名生成再改名，其他进程不会读到写了一半的格式文件
+        jobname = f"{name}_{os.getpid()}"
+        command = [engine, "-ini", "-interaction=nonstopmode", "-halt-on-error", f"-jobname={jobname}",
+                   f"&{engine}", "mylatexformat.ltx", name + ".tex"]
+        started = time.perf_counter()
+        try:
+            completed = subprocess.run(
+                command, cwd=FORMAT_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL, text=True, encoding="utf-8", errors="replace", timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise LatexCompileError(f"预编译导言区超时 ({timeout} 秒)")
+        built = os.path.join(FORMAT_DIR, jobname + ".fmt")
+        if completed.returncode != 0 or not os.path.exists(built):
+            tail = "".join(completed.stdout.splitlines(keepends=True)[-20:])
+            raise LatexCompileError(f"预编译导言区失败:\n{tail}")
+        os.replace(built, fmt_path)
+        get_metrics().record("format_build", time.perf_counter() - started, engine=engine, format=name)
+    return name
+
+
+def compile_tex(tex_path, engine=None, timeout=180, on_log=None, force=False, max_passes=3, fmt="auto"):
+    """在tex文件所在目录编译PDF，返回 (pdf路径, 是否因内容未变而跳过)
+
+    辅助文件(.aux/.log等)保留在原目录，再次编译时可直接复用；
+    tex内容哈希与上次成功编译时一致且PDF仍存在时跳过编译。timeout限制整份文档各遍编译的总耗时。
+    fmt为预编译的格式名；"auto"表示按文档导言区查找或生成，None表示不使用格式文件。
+    """
+    engine = engine or find_latex_engine()
+    if not engine:
+        raise LatexCompileError("未找到XeLaTeX/LuaLaTeX，请安装MiKTeX或TeX Live")
+
+    tex_path = os.path.abspath(tex_path)
+    workdir = os.path.dirname(tex_path)
+    stem = os.path.splitext(os.path.basename(tex_path))[0]
+    pdf_path = os.path.join(workdir, stem + ".pdf")
+    hash_path = os.path.join(workdir, stem + ".texhash")
+
+    content_hash = f"{engine}:{file_sha256(tex_path)}"
+    if not force and os.path.exists(pdf_path) and os.path.exists(hash_path):
+        with open(hash_path, "r", encoding="utf-8") as f:
+            if f.read().strip() == content_hash:
+                return pdf_path, True
+
+    if fmt == "auto":
+        fmt = None
+        head = tex_preamble_head(tex_path) if engine in FORMAT_ENGINES else None
+        if head is not None:
+            try:
+                fmt = build_format(head, engine)
+            except (LatexCompileError, OSError) as e:
+                if on_log:
+                    on_log(f"预编译导言区不可用，按普通方式编译: {e}")
+
+    command = [engine, "-interaction=nonstopmode", "-halt-on-error", "-file-line-error",
+               os.path.basename(tex_path)]
+    env = None
+    if fmt:
+        command.insert(1, f"-fmt={fmt}")
+        # 末尾的路径分隔符表示在FORMAT_DIR之后继续搜索默认位置
+        env = dict(os.environ, TEXFORMATS=os.path.abspath(FORMAT_DIR) + os.pathsep)
+    started = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    passes = 0
+    for _ in range(max_passes):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LatexCompileError(f"编译超时 ({timeout} 秒)")
+        passes += 1
+        process = subprocess.Popen(
+            command, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL, text=True, encoding="utf-8", errors="replace",
+            start_new_session=(os.name == "posix"), env=env
+        )
+        # 超时后由计时器终止进程，读取循环随之结束
+        timer = threading.Timer(remaining, kill_process_tree, args=(process,))
+        timer.start()
+        log_lines = []
+        try:
+            for line in process.stdout:
+                log_lines.append(line)
+                if on_log:
+                    on_log(line.rstrip("\n"))
+            process.wait()
+        finally:
+            timed_out = not timer.is_alive()
+            timer.cancel()
+
+        if timed_out:
+            raise LatexCompileError(f"编译超时 ({timeout} 秒)")
+        if process.returncode != 0 and fmt and "format file" in "".join(log_lines[:20]):
+            # 格式文件无法读取(如发行版升级后)时按普通方式重新编译
+            return compile_tex(tex_path, engine, max(0.0, deadline - time.monotonic()), on_log, force, max_passes,
+                               fmt=None)
+        if process.returncode != 0:
+            raise LatexCompileError("".join(log_lines[-20:]) or f"{engine} 返回错误码 {process.returncode}")
+
+        # 交叉引用等需要再编译一遍
+        log_text = "".join(log_lines)
+        if "Rerun to get" not in log_text and "Label(s) may have changed" not in log_text:
+            break
+
+    get_metrics().record("pdf_compile", time.perf_counter() - started, engine=engine, passes=passes,
+                         format=fmt or "")
+    with open(hash_path, "w", encoding="utf-8") as f:
+        f.write(content_hash)
+    return pdf_path, False
+
+
+def compile_many(tex_paths, jobs=None, timeout=180, engine=None, force=False, use_format=True, on_item=None,
+                 executor=None):
+    """并行编译多个.tex，返回汇总报告(失败报告保存在OUTPUT_DIR下)
+
+    先为各文档不同的导言区各生成一次格式文件，再按CPU核数并行编译；
+    每份文档单独计时，超时或失败只影响该文档。给定executor时使用这个共享的线程池(本地服务模式)。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    engine = engine or find_latex_engine()
+    if not engine:
+        raise LatexCompileError("未找到XeLaTeX/LuaLaTeX，请安装MiKTeX或TeX Live")
+    jobs = jobs or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    heads, formats, format_errors = {}, {}, []
+    if use_format and engine in FORMAT_ENGINES:
+        heads = {path: tex_preamble_head(path) for path in tex_paths}
+        for head in set(head for head in heads.values() if head is not None):
+            try:
+                formats[head] = build_format(head, engine)
+            except (LatexCompileError, OSError) as e:
+                format_errors.append(str(e))
+
+    def compile_one(tex_path):
+        began = time.perf_counter()
+        fmt = formats.get(heads.get(tex_path))
+        item = {"tex_path": tex_path, "format": fmt}
+        try:
+            # 每个编译都是独立的TeX进程，线程只负责等待，因此线程数即同时运行的TeX进程数
+            pdf_path, skipped = compile_tex(tex_path, engine, timeout, force=force, fmt=fmt)
+            item.update(status="ok", pdf_path=pdf_path, skipped=skipped)
+            try:
+                get_history_store().set_pdf_path(tex_path, pdf_path)
+            except sqlite3.Error:
+                pass
+        except Exception as e:
+            item.update(status="failed", error=str(e)[-2000:])
+        item["seconds"] = round(time.perf_counter() - began, 3)
+        if on_item:
+            on_item(item)
+        return item
+
+    if executor is not None:
+        items = list(executor.map(compile_one, tex_paths))
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            items = list(executor.map(compile_one, tex_paths))
+
+    failed = [item for item in items if item["status"] != "ok"]
+    report = {
+        "engine": engine,
+        "jobs": jobs,
+        "total": len(items),
+        "succeeded": len(items) - len(failed),
+        "failed": len(failed),
+        "skipped": sum(1 for item in items if item.get("skipped")),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "sequential_seconds": round(sum(item["seconds"] for item in items), 3),
+        "formats": sorted(set(formats.values())),
+        "format_errors": format_errors,
+        "items": items,
+    }
+    ensure_output_dir()
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(OUTPUT_DIR, f"compile_report_{stamp}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    report["report_path"] = report_path
+    return report
+
+
+def list_tex_files(directory=OUTPUT_DIR):
+    """目录下(不含子目录)的.tex文件，按文件名排序"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".tex"))
+
+
+def format_compile_report(report):
+    """批量编译的摘要与失败列表"""
+    lines = [
+        f"共 {report['total']} 份，成功 {report['succeeded']} (其中 {report['skipped']} 份内容未变化)，"
+        f"失败 {report['failed']}，{report['jobs']} 个并行任务耗时 {report['wall_seconds']} 秒 "
+        f"(顺序执行约需 {report['sequential_seconds']} 秒)",
+        f"预编译格式: {', '.join(report['formats']) or '未使用'}",
+    ]
+    lines += [f"格式文件生成失败: {error}" for error in report["format_errors"]]
+    for item in report["items"]:
+        if item["status"] != "ok":
+            last_line = item["error"].strip().splitlines()[-1] if item["error"].strip() else ""
+            lines.append(f"[失败] {item['tex_path']} ({item['seconds']}s): {last_line}")
+    lines.append(f"编译报告: {report['report_path']}")
+    return "\n".join(lines)
+
+
+class BulkCompileWorker(QThread):
+    """后台线程批量编译PDF"""
+    item_finished = pyqtSignal(dict)  # 单个文档编译完成(结果记录)
+    finished = pyqtSignal(object, str)  # (汇总报告, 错误信息)
+
+    def __init__(self, tex_paths, parent=None):
+        super().__init__(parent)
+        self.tex_paths = tex_paths
+
+    def run(self):
+        try:
+            self.finished.emit(compile_many(self.tex_paths, on_item=self.item_finished.emit), "")
+        except Exception as e:
+            self.finished.emit(None, str(e))
+
+
+class PdfCompileWorker(QThread):
+    """后台线程编译PDF，避免阻塞界面"""
+    log = pyqtSignal(str)  # 编译日志(逐行)
+    finished = pyqtSignal(str, bool, bool)  # (PDF路径或错误信息, 是否成功, 是否跳过了编译)
+
+    def __init__(self, tex_path, timeout=180, parent=None):
+        super().__init__(parent)
+        self.tex_path = tex_path
+        self.timeout = timeout
+
+    def run(self):
+        try:
+            pdf_path, skipped = compile_tex(self.tex_path, timeout=self.timeout, on_log=self.log.emit)
+            self.finished.emit(pdf_path, True, skipped)
+        except Exception as e:
+            self.finished.emit(str(e), False, False)
+
+
+class ResumeGeneratorApp(QMainWindow):
+    startup_finished = pyqtSignal()  # 首次绘制后的延迟初始化完成
+
+    def __init__(self, service_url=None):
+        super().__init__()
+        self.setWindowTitle("留学求职文书助手 - DeepSeek集成版")
+        self.setGeometry(100, 100, 900, 700)
+
+        # 主控件
+        main_widget = QWidget()
+        self.setCentralWidget(main_widget)
+        main_layout = QVBoxLayout(main_widget)
+        self.main_layout = main_layout
+
+        # 创建表单区域；预览区等非关键部分在首次绘制后由finish_startup创建
+        self.create_api_group(main_layout)
+        self.create_personal_info_group(main_layout)
+        self.create_academic_group(main_layout)
+        self.create_target_group(main_layout)
+        self.create_action_buttons(main_layout)
+        self.create_progress_bar(main_layout)
+
+        # 初始化数据
+        self.api_key = ""
+        self.photo_path = ""
+        self.generated_content = ""
+        self.generated_tex_path = ""
+        self.first_token_seen = False
+        self.generate_started = 0.0
+        self.service_url = service_url  # 本地生成服务的地址，设置时界面只作为瘦客户端提交任务
+        self.job_queue = JobQueue(service_url=service_url, parent=self)
+        self.job_queue.job_started.connect(self.handle_job_started)
+        self.job_queue.job_changed.connect(self.refresh_jobs_table)
+        self.job_queue.job_finished.connect(self.handle_job_finished)
+        self.preview_job = None  # 预览区正在显示的任务
+        self.fan_out_groups = []  # 尚未全部结束的多目标生成，每组为各目标的任务列表
+        self.compile_worker = None
+        self.bulk_compile_worker = None
+        self.last_generation = None  # 上次分段生成的结果(含当时的表单)，用于增量重新生成
+        self.first_paint_at = None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_at is None:
+            self.first_paint_at = time.time()
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        """首次绘制后再完成的初始化：输出目录、预览区与耗时统计"""
+        ensure_output_dir()
+        self.create_preview_group(self.main_layout)
+        self.update_latency_label()
+        if self.service_url:
+            # 后端由服务选择，多个界面共用服务的缓存与连接
+            self.statusBar().showMessage(f"使用本地生成服务: {self.service_url}", 5000)
+            self.startup_finished.emit()
+            return
+        try:
+            router = get_backend_router()
+        except (ValueError, KeyError, TypeError) as e:
+            QMessageBox.warning(self, "后端配置错误", f"{BACKENDS_CONFIG} 无法解析，将使用DeepSeek官方接口:\n{str(e)}")
+            router = configure_backends(backends=[Backend.from_url(API_URL, name="deepseek")])
+        if len(router.backends) > 1:
+            # 配置了多个后端时在后台检查一次，选择后端时就有耗时数据
+            threading.Thread(target=router.check_all, daemon=True).start()
+        self.startup_finished.emit()
+
+    def create_api_group(self, layout):
+        group = QGroupBox("DeepSeek API 设置")
+        form = QFormLayout()
+
+        # API 密钥输入
+        self.api_input = QLineEdit()
+        self.api_input.setPlaceholderText("输入DeepSeek API密钥 (sk-...)")
+        self.api_input.setEchoMode(QLineEdit.Password)
+        form.addRow(QLabel("API密钥:"), self.api_input)
+
+        # 模型选择
+        self.model_combo = QComboBox()
+        self.model_combo.addItems(["deepseek-chat (V3通用模型)", "deepseek-reasoner (R1推理模型)"])
+        form.addRow(QLabel("模型选择:"), self.model_combo)
+
+        # 快速策略：慢请求自动对冲，推理模型超时回退到通用模型
+        self.fast_policy_check = QCheckBox("快速策略 (慢请求对冲 / 推理模型超时回退)")
+        self.latency_label = QLabel()
+        self.latency_label.setStyleSheet("color: gray;")
+        form.addRow(QLabel(""), self.fast_policy_check)
+        form.addRow(QLabel("近期耗时:"), self.latency_label)
+
+        # 流式输出：边生成边显示
+        self.stream_check = QCheckBox("流式输出 (实时预览生成内容)")
+        self.stream_check.setChecked(True)
+        form.addRow(QLabel(""), self.stream_check)
+
+        # 表单未改动时直接复用缓存结果，勾选后强制重新调用API
+        self.force_refresh_check = QCheckBox("强制重新生成 (忽略缓存)")
+        form.addRow(QLabel(""), self.force_refresh_check)
+
+        group.setLayout(form)
+        layout.addWidget(group)
+
+    def create_personal_info_group(self, layout):
+        group = QGroupBox("个人信息")
+        form = QFormLayout()
+
+        self.name_input = QLineEdit()
+        self.email_input = QLineEdit()
+        self.phone_input = QLineEdit()
+        self.photo_button = QPushButton("选择照片")
+        self.photo_preview = QLabel()
+        self.photo_preview.setFixedSize(100, 100)
+        self.photo_preview.setStyleSheet("border: 1px solid gray; background-color: #f0f0f0;")
+        self.photo_preview.setAlignment(Qt.AlignCenter)
+        self.photo_preview.setText("无照片")
+
+        photo_layout = QHBoxLayout()
+        photo_layout.addWidget(self.photo_button)
+        photo_layout.addWidget(self.photo_preview)
+
+        form.addRow(QLabel("姓名:"), self.name_input)
+        form.addRow(QLabel("邮箱:"), self.email_input)
+        form.addRow(QLabel("电话:"), self.phone_input)
+        form.addRow(QLabel("照片:"), photo_layout)
+
+        self.photo_button.clicked.connect(self.select_photo)
+
+        group.setLayout(form)
+        layout.addWidget(group)
+
+    def create_academic_group(self, layout):
+        group = QGroupBox("学术背景")
+        form = QFormLayout()
+
+        self.university_input = QLineEdit()
+        self.major_input = QLineEdit()
+        self.gpa_input = QLineEdit()
+        self.awards_input = QTextEdit()
+        self.research_input = QTextEdit()
+        self.competitions_input = QTextEdit()
+
+        # 设置文本编辑框高度和样式
+        for text_edit in [self.awards_input, self.research_input, self.competitions_input]:
+            text_edit.setFixedHeight(80)
+            text_edit.setStyleSheet("background-color: #f8f8f8; border: 1px solid #ddd;")
+
+        form.addRow(QLabel("院校:"), self.university_input)
+        form.addRow(QLabel("专业:"), self.major_input)
+        form.addRow(QLabel("GPA:"), self.gpa_input)
+        form.addRow(QLabel("获奖经历:"), self.awards_input)
+        form.addRow(QLabel("科研经历:"), self.research_input)
+        form.addRow(QLabel("竞赛经历:"), self.competitions_input)
+
+        group.setLayout(form)
+        layout.addWidget(group)
+
+    def create_target_group(self, layout):
+        group = QGroupBox("申请目标")
+        form = QFormLayout()
+
+        self.target_type = QComboBox()
+        self.target_type.addItems(["留学申请文书", "学术简历", "求职简历"])
+
+        self.target_input = QTextEdit()
+        self.target_input.setPlaceholderText("输入目标院校/专业 或 公司/职位")
+        self.target_input.setFixedHeight(80)
+        self.target_input.setStyleSheet("background-color: #f8f8f8; border: 1px solid #ddd;")
+
+        # 多个申请目标(每行一个)并行生成，各自保存为独立文件
+        self.fan_out_check = QCheckBox("多目标并行生成 (每行一个申请目标)")
+
+        form.addRow(QLabel("文书类型:"), self.target_type)
+        form.addRow(QLabel("申请目标:"), self.target_input)
+        form.addRow(QLabel(""), self.fan_out_check)
+
+        # 个人陈述先生成提纲，再并行生成各段
+        self.sectioned_check = QCheckBox("分段并行生成 (仅留学文书)")
+        form.addRow(QLabel(""), self.sectioned_check)
+
+        group.setLayout(form)
+        layout.addWidget(group)
+
+    def create_progress_bar(self, layout):
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setStyleSheet("""
+            QProgressBar {
+                border: 1px solid #3498db;
+                border-radius: 5px;
+                text-align: center;
+                background: #f0f0f0;
+                height: 20px;
+            }
+            QProgressBar::chunk {
+                background-color: #3498db;
+                width: 10px;
+            }
+        """)
+        layout.addWidget(self.progress_bar)
+
+    def create_preview_group(self, layout):
+        group = QGroupBox("实时预览")
+        group_layout = QVBoxLayout()
+
+        # 正文与推理过程分开显示
+        self.preview_tabs = QTabWidget()
+        self.content_preview = QPlainTextEdit()
+        self.reasoning_preview = QPlainTextEdit()
+        for preview in [self.content_preview, self.reasoning_preview]:
+            preview.setReadOnly(True)
+            preview.setStyleSheet("background-color: #f8f8f8; border: 1px solid #ddd;")
+        self.reasoning_preview.setStyleSheet("background-color: #f8f8f8; border: 1px solid #ddd; color: gray;")
+        self.preview_tabs.addTab(self.content_preview, "文书内容")
+        self.preview_tabs.addTab(self.reasoning_preview, "推理过程")
+
+        self.compile_log = QPlainTextEdit()
+        self.compile_log.setReadOnly(True)
+        self.compile_log.setStyleSheet("background-color: #f8f8f8; border: 1px solid #ddd; font-family: monospace;")
+        self.preview_tabs.addTab(self.compile_log, "编译日志")
+        self.create_jobs_tab()
+        self.preview_tabs.setFixedHeight(180)
+
+        group_layout.addWidget(self.preview_tabs)
+        group.setLayout(group_layout)
+        layout.addWidget(group)
+
+    def append_preview(self, preview, text):
+        """在预览框末尾追加流式增量"""
+        preview.moveCursor(QTextCursor.End)
+        preview.insertPlainText(text)
+        preview.moveCursor(QTextCursor.End)
+
+    def handle_content_delta(self, text):
+        if not self.first_token_seen:
+            self.first_token_seen = True
+            elapsed = time.perf_counter() - self.generate_started
+            self.statusBar().showMessage(f"正在接收文书内容... (首个token用时 {elapsed:.2f} 秒)")
+            self.preview_tabs.setCurrentWidget(self.content_preview)
+        self.append_preview(self.content_preview, text)
+
+    def handle_reasoning_delta(self, text):
+        if not self.first_token_seen:
+            self.first_token_seen = True
+            elapsed = time.perf_counter() - self.generate_started
+            self.statusBar().showMessage(f"模型正在推理... (首个token用时 {elapsed:.2f} 秒)")
+            self.preview_tabs.setCurrentWidget(self.reasoning_preview)
+        self.append_preview(self.reasoning_preview, text)
+
+    def create_action_buttons(self, layout):
+        button_layout = QHBoxLayout()
+
+        self.generate_btn = QPushButton("生成文书")
+        self.preview_btn = QPushButton("预览PDF")
+        self.export_btn = QPushButton("导出LaTeX")
+        self.metrics_btn = QPushButton("性能统计")
+        self.history_btn = QPushButton("历史记录")
+        self.compile_all_btn = QPushButton("批量编译")
+
+        # 设置按钮样式
+        btn_style = """
+            QPushButton {
+                padding: 10px 20px;
+                font-weight: bold;
+                border-radius: 5px;
+                min-width: 120px;
+            }
+            QPushButton:hover {
+                opacity: 0.9;
+            }
+        """
+        self.generate_btn.setStyleSheet(btn_style + "background-color: #3498db; color: white;")
+        self.preview_btn.setStyleSheet(btn_style + "background-color: #2ecc71; color: white;")
+        self.export_btn.setStyleSheet(btn_style + "background-color: #9b59b6; color: white;")
+        self.metrics_btn.setStyleSheet(btn_style + "background-color: #7f8c8d; color: white;")
+        self.history_btn.setStyleSheet(btn_style + "background-color: #e67e22; color: white;")
+        self.compile_all_btn.setStyleSheet(btn_style + "background-color: #16a085; color: white;")
+
+        self.generate_btn.clicked.connect(self.generate_document)
+        self.preview_btn.clicked.connect(self.preview_pdf)
+        self.export_btn.clicked.connect(self.export_latex)
+        self.metrics_btn.clicked.connect(self.show_metrics)
+        self.history_btn.clicked.connect(self.show_history)
+        self.compile_all_btn.clicked.connect(self.compile_all)
+
+        button_layout.addWidget(self.generate_btn)
+        button_layout.addWidget(self.preview_btn)
+        button_layout.addWidget(self.export_btn)
+        button_layout.addWidget(self.metrics_btn)
+        button_layout.addWidget(self.history_btn)
+        button_layout.addWidget(self.compile_all_btn)
+
+        layout.addLayout(button_layout)
+
+    def select_photo(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "选择个人照片", "", "图片文件 (*.png *.jpg *.jpeg)"
+        )
+        if path:
+            self.photo_path = path
+            try:
+                # 缩略图按内容哈希缓存，再次选择同一张照片时不再解码原图
+                self.photo_preview.setPixmap(QPixmap(get_photo_store().thumbnail(path, THUMBNAIL_SIZE)))
+            except Exception as e:
+                self.photo_preview.setText("无法预览")
+                self.statusBar().showMessage(f"照片处理错误: {str(e)}", 5000)
+
+    def generate_document(self):
+        # 验证API密钥
+        api_key = self.api_input.text().strip()
+        if not api_key:
+            QMessageBox.warning(self, "API密钥缺失", "请输入有效的DeepSeek API密钥")
+            return
+
+        # 收集用户数据
+        user_data = self.collect_user_data()
+
+        # 确定模型
+        model = "deepseek-chat"
+        if "R1" in self.model_combo.currentText():
+            model = "deepseek-reasoner"
+
+        sectioned = self.sectioned_check.isChecked() and "留学" in user_data["doc_type"]
+        targets = split_targets(user_data["target"])
+        if self.fan_out_check.isChecked() and len(targets) > 1:
+            # 每个申请目标一个任务，不占用任务池名额，可与单份文书一样去重和取消。
+            # 第一个目标先单独完成，让服务端缓存共享的提示词前缀，其余目标随后同时发出以命中前缀缓存
+            jobs = []
+            for target in targets:
+                job, _ = self.submit_job(api_key, dict(user_data, target=target), model, sectioned,
+                                         fan_out=True, after=jobs[0] if jobs else None)
+                jobs.append(job)
+            self.fan_out_groups.append(jobs)
+            self.statusBar().showMessage(
+                f"已为 {len(targets)} 个申请目标提交任务，第一个目标完成后其余目标并行生成，"
+                f"可在\"任务队列\"页查看", 5000
+            )
+            return
+
+        # 与上次分段生成的表单对比，提纲未过期时只重新生成受影响的段落
+        previous = None
+        if sectioned and self.last_generation and not self.force_refresh_check.isChecked():
+            previous = self.last_generation
+            stale = stale_sections(previous, user_data)
+            if stale is not None:
+                self.statusBar().showMessage(f"表单改动影响 {len(stale)} 段，只重新生成这些段落", 5000)
+            else:
+                self.statusBar().showMessage("档案改动使原提纲过期，将连同提纲全部重新生成", 5000)
+
+        # 加入任务队列，由后台线程池调用DeepSeek API
+        job, created = self.submit_job(api_key, user_data, model, sectioned, previous)
+        if not created:
+            self.statusBar().showMessage(f"相同的任务 #{job.id} 尚未完成，未重复提交", 5000)
+        elif job.state == "queued":
+            self.statusBar().showMessage(
+                f"任务 #{job.id} 已加入队列 (进行中 {self.job_queue.running_count()} 个)，可在\"任务队列\"页查看", 5000
+            )
+
+    def submit_job(self, api_key, user_data, model, sectioned=False, previous=None, fan_out=False, after=None):
+        """把一份文书加入任务队列；分段生成的个人陈述作为一个任务，由SectionedStatementWorker执行"""
+        force_refresh = self.force_refresh_check.isChecked()
+        if sectioned:
+            return self.job_queue.submit(
+                api_key, user_data, build_outline_prompt(user_data), model, fan_out=fan_out, after=after,
+                sectioned=True, force_refresh=force_refresh, previous=previous
+            )
+        return self.job_queue.submit(
+            api_key, user_data, build_prompt(user_data), model, fan_out=fan_out, after=after,
+            stream=self.stream_check.isChecked(),
+            max_tokens=output_max_tokens(user_data),
+            cache=get_response_cache(),
+            force_refresh=force_refresh,
+            fast_policy=self.fast_policy_check.isChecked()
+        )
+
+    def begin_preview(self):
+        """开始新的生成：显示进度条并清空预览"""
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.statusBar().showMessage("正在生成文书内容...")
+        self.content_preview.clear()
+        self.reasoning_preview.clear()
+        self.first_token_seen = False
+        self.generate_started = time.perf_counter()
+
+    def collect_user_data(self):
+        """收集所有用户输入数据"""
+        return {
+            "name": self.name_input.text(),
+            "email": self.email_input.text(),
+            "phone": self.phone_input.text(),
+            "university": self.university_input.text(),
+            "major": self.major_input.text(),
+            "gpa": self.gpa_input.text(),
+            "awards": self.awards_input.toPlainText(),
+            "research": self.research_input.toPlainText(),
+            "competitions": self.competitions_input.toPlainText(),
+            "target": self.target_input.toPlainText(),
+            "doc_type": self.target_type.currentText(),
+            "photo_path": self.photo_path
+        }
+
+    # 提示词中固定的写作要求和申请人档案在前、申请目标在最后，
+    # 同一申请人的多个目标共享相同前缀，可以命中服务端的提示词前缀缓存
+
+    @staticmethod
+    def build_study_abroad_prompt(data):
+        """构建留学申请文书提示词"""
+        length, unit = requested_length(data)
+        return compact_prompt(f"""
+        你是一位专业的留学申请文书写作专家，请根据以下信息为申请人{data['name']}撰写一份留学申请文书：要求返回latex格式
+        的正文代码(不要包含\\documentclass和导言区)，能够正常使用latex编译，注意，输出的文件内容应该符合留学申请文书个人陈述的要求，内容应该均为英文。
+        文书中不应该出现中文内容，非常重要。
+
+        {profile_sections(data)}
+
+        ## 写作要求
+        1. 文书应突出申请人的学术能力和研究潜力
+        2. 结合申请目标说明申请动机
+        3. 展现个人特质和独特优势
+        4. 结构清晰，语言专业流畅
+        5. 长度约{length}{unit}
+
+        ## 申请目标
+        {data['target']}
+        """)
+
+    @staticmethod
+    def build_academic_cv_prompt(data):
+        """构建学术简历提示词"""
+        length, unit = requested_length(data)
+        return compact_prompt(f"""
+        你是一位专业的留学申请顾问，请根据以下信息为申请人{data['name']}撰写学术简历(Academic CV)中的学术简介部分，
+        要求返回latex格式的正文代码(不要包含\\documentclass和导言区)，能够正常使用latex编译，内容应该均为英文。
+
+        {profile_sections(data)}
+
+        ## 写作要求
+        1. 概括研究兴趣与学术方向
+        2. 提炼科研经历中的方法、成果与个人贡献
+        3. 语言客观、精练，使用第三人称
+        4. 长度不超过{length}{unit}
+
+        ## 申请目标
+        {data['target']}
+        """)
+
+    @staticmethod
+    def build_job_application_prompt(data):
+        """构建求职简历提示词"""
+        length, unit = requested_length(data)
+        return compact_prompt(f"""
+        你是一位专业的求职简历写作专家，请根据以下信息为申请人{data['name']}撰写一份求职简历的自我评价部分，要求返回latex格式
+        的正文代码(不要包含\\documentclass和导言区)，能够正常使用latex编译。内容清晰。
+
+        {profile_sections(data)}
+
+        ## 写作要求
+        1. 突出与目标职位相关的技能和经验
+        2. 量化成就和贡献
+        3. 展现职业素养和团队合作能力
+        4. 语言精练专业，长度不超过{length}{unit}
+        5. 格式使用Markdown，包含标题和项目符号
+
+        ## 申请目标
+        {data['target']}
+        """)
+
+    def handle_job_started(self, job):
+        """任务开始运行；当前没有正在预览的任务时，预览区跟随该任务的流式输出"""
+        worker = job.worker
+        worker.progress.connect(lambda value: self.preview_job is job and self.progress_bar.setValue(value))
+        worker.content_delta.connect(lambda text: self.preview_job is job and self.handle_content_delta(text))
+        worker.reasoning_delta.connect(lambda text: self.preview_job is job and self.handle_reasoning_delta(text))
+        worker.checked.connect(lambda checked: self.preview_job is job and self.handle_latex_check(checked))
+        if self.preview_job is None or not self.preview_job.pending:
+            self.show_job(job)
+
+    def show_job(self, job):
+        """预览区切换到指定任务，显示其已收到的输出"""
+        self.preview_job = job
+        self.begin_preview()
+        self.generate_started = job.started_at or time.perf_counter()
+        self.progress_bar.setVisible(job.pending)
+        if job.state == "done":
+            self.content_preview.setPlainText(job.content)
+        else:
+            self.content_preview.setPlainText("".join(job.content_parts))
+        self.reasoning_preview.setPlainText("".join(job.reasoning_parts))
+        self.first_token_seen = bool(job.content_parts or job.reasoning_parts)
+        if job.checked:
+            self.handle_latex_check(job.checked)
+        self.statusBar().showMessage(f"任务 #{job.id} {job.label}: {JOB_STATES[job.state]}", 5000)
+
+    def handle_job_finished(self, job):
+        self.update_latency_label()
+        previewing = job is self.preview_job
+        if job.state == "done":
+            self.handle_api_response(job)
+        elif job.state == "failed":
+            if not job.fan_out:  # 多目标生成的失败在全部结束后的汇总中列出
+                QMessageBox.critical(self, "生成失败", f"任务 #{job.id} {job.label} 生成失败:\n{job.content}")
+        elif previewing:
+            self.statusBar().showMessage(f"任务 #{job.id} 已取消", 5000)
+        if previewing:
+            # 预览区转到下一个进行中的任务
+            running = [other for other in self.job_queue.jobs if other.state == "running"]
+            if running:
+                self.show_job(running[0])
+            else:
+                self.progress_bar.setVisible(False)
+        for group in list(self.fan_out_groups):
+            if job in group and not any(other.pending for other in group):
+                self.fan_out_groups.remove(group)
+                self.show_fan_out_summary(group)
+
+    def show_fan_out_summary(self, jobs):
+        """多目标生成全部结束：汇总成功份数与命中服务端前缀缓存的token数"""
+        succeeded = [job for job in jobs if job.state == "done"]
+        prompt_tokens = sum(job.usage().get("prompt_tokens", 0) for job in succeeded)
+        cached_tokens = sum(prompt_cache_tokens(job.usage()) for job in succeeded)
+        summary = (f"成功 {len(succeeded)}/{len(jobs)} 份，"
+                   f"提示词共 {prompt_tokens} tokens，命中前缀缓存 {cached_tokens} tokens")
+        self.statusBar().showMessage(summary, 10000)
+
+        details = "\n".join(job.tex_path or f"{job.data['target']}: {job.content or JOB_STATES[job.state]}"
+                            for job in jobs)
+        result_dialog = QMessageBox(self)
+        result_dialog.setWindowTitle("多目标生成完成")
+        result_dialog.setText(summary)
+        result_dialog.setDetailedText(details)
+        result_dialog.exec_()
+
+    def create_jobs_tab(self):
+        """任务队列页：列出所有任务，可查看结果或取消"""
+        panel = QWidget()
+        panel_layout = QVBoxLayout(panel)
+        panel_layout.setContentsMargins(0, 0, 0, 0)
+        self.jobs_table = QTableWidget(0, 3)
+        self.jobs_table.setHorizontalHeaderLabels(["任务", "状态", "用时"])
+        self.jobs_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.jobs_table.verticalHeader().setVisible(False)
+        self.jobs_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.jobs_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.jobs_table.cellDoubleClicked.connect(lambda row, column: self.show_selected_job())
+        panel_layout.addWidget(self.jobs_table)
+
+        buttons = QHBoxLayout()
+        for text, handler in [("查看", self.show_selected_job), ("取消", self.cancel_selected_jobs),
+                              ("清除已结束", self.clear_finished_jobs)]:
+            button = QPushButton(text)
+            button.clicked.connect(handler)
+            buttons.addWidget(button)
+        buttons.addStretch()
+        panel_layout.addLayout(buttons)
+        self.jobs_tab = panel
+        self.preview_tabs.addTab(panel, "任务队列")
+
+    def refresh_jobs_table(self, job=None):
+        if not hasattr(self, "jobs_table"):
+            return
+        jobs = self.job_queue.jobs
+        self.jobs_table.setRowCount(len(jobs))
+        for row, item in enumerate(jobs):
+            elapsed = item.elapsed()
+            for column, text in enumerate([
+                f"#{item.id} {item.label}", JOB_STATES[item.state], "" if elapsed is None else f"{elapsed:.1f}s"
+            ]):
+                cell = QTableWidgetItem(text)
+                cell.setData(Qt.UserRole, item.id)
+                self.jobs_table.setItem(row, column, cell)
+        pending = self.job_queue.pending_count()
+        self.preview_tabs.setTabText(
+            self.preview_tabs.indexOf(self.jobs_tab), f"任务队列 ({pending})" if pending else "任务队列"
+        )
+
+    def selected_jobs(self):
+        ids = {index.data(Qt.UserRole) for index in self.jobs_table.selectionModel().selectedRows()}
+        return [job for job in self.job_queue.jobs if job.id in ids]
+
+    def show_selected_job(self):
+        jobs = self.selected_jobs()
+        if jobs:
+            self.show_job(jobs[0])
+            self.preview_tabs.setCurrentWidget(self.content_preview)
+
+    def cancel_selected_jobs(self):
+        for job in self.selected_jobs():
+            self.job_queue.cancel(job)
+
+    def clear_finished_jobs(self):
+        self.job_queue.clear_finished()
+        self.refresh_jobs_table()
+
+    def closeEvent(self, event):
+        # 取消未完成的任务，避免窗口关闭后后台线程仍在运行
+        self.job_queue.cancel_all()
+        self.job_queue.wait()
+        super().closeEvent(event)
+
+    def update_latency_label(self):
+        """显示各模型各类调用近期耗时的p50/p95"""
+        parts = []
+        for (model, kind), stats in sorted(get_latency_tracker().summary().items()):
+            if stats["count"]:
+                base, _, stream = kind.partition("/")
+                label = LATENCY_KINDS.get(base, base) + ("(流式)" if stream else "")
+                parts.append(f"{model} {label}: p50 {stats['p50']:.1f}s / p95 {stats['p95']:.1f}s")
+        self.latency_label.setText("；".join(parts) or "暂无数据")
+
+    def handle_latex_check(self, checked):
+        """把正文检查结果写入编译日志，仍有问题时提示用户"""
+        self.compile_log.setPlainText("正文检查: " + format_latex_check(checked))
+        if checked["problems"]:
+            self.preview_tabs.setCurrentWidget(self.compile_log)
+            self.statusBar().showMessage(f"正文仍有 {len(checked['problems'])} 处问题，编译可能失败，详见编译日志", 8000)
+
+    def handle_api_response(self, job):
+        """处理完成的任务：按提交时的表单生成文档"""
+        content = job.content
+        self.generated_content = content
+        prefix = f"任务 #{job.id} "
+        usage = job.usage()
+        # 服务端提示词前缀缓存命中的token数(分段生成时为各次请求之和)
+        prompt_cache = (f"，提示词缓存命中 {prompt_cache_tokens(usage)}/{usage.get('prompt_tokens', 0)} tokens"
+                        if usage else "")
+        if job.cache_hit_ms is not None:
+            # 瘦客户端模式下统计的是服务中共享缓存的命中情况
+            stats = (job.result or {}).get("cache_stats") or get_response_cache().stats()
+            self.statusBar().showMessage(
+                f"{prefix}命中缓存，用时 {job.cache_hit_ms:.1f} 毫秒 "
+                f"(缓存命中 {stats['hits']} 次 / 未命中 {stats['misses']} 次)", 5000
+            )
+        elif job.route and job.route[1]:
+            self.statusBar().showMessage(
+                f"{prefix}文书内容生成成功! (快速策略：{job.route[0]} 的请求先完成{prompt_cache})", 5000
+            )
+        elif job.sectioned:
+            self.statusBar().showMessage(
+                f"{prefix}个人陈述生成成功，共 {len(job.result['sections'])} 段，"
+                f"重新生成 {len(job.result['regenerated'])} 段，用时 {job.elapsed():.1f} 秒{prompt_cache}", 5000
+            )
+        else:
+            self.statusBar().showMessage(f"{prefix}文书内容生成成功{prompt_cache}!", 5000)
+        if job is self.preview_job:
+            # 对冲请求获胜时预览框中可能残留另一路的输出；规范化后的正文也可能与流式输出不同
+            self.content_preview.setPlainText(content)
+        result = job.result or {}
+        document = content
+        if job.sectioned:
+            self.last_generation = result
+            document = merge_sections(result)
+        # 还有任务在进行时不弹出预览对话框，避免打断排队中的任务；多目标生成在全部结束后显示汇总
+        job.tex_path = self.save_generated_document(
+            job.data, document, content, f"job{job.id}",
+            show_preview=not job.fan_out and not self.job_queue.pending_count()
+        )
+        record_generation(job.data, result.get("model", job.model), job.prompt, document, result.get("usage"),
+                          job.tex_path)
+
+    def save_generated_document(self, user_data, content, preview_text, *name_parts, show_preview=True):
+        """生成LaTeX文档，保存到output目录并显示预览，返回.tex路径"""
+        # 生成唯一的文件名(同一秒内完成的任务用name_parts区分)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        tex_path = os.path.join(OUTPUT_DIR, document_filename(user_data, timestamp, *name_parts))
+
+        # 生成LaTeX文档并保存到output目录
+        render_document(user_data, content, tex_path)
+        self.generated_tex_path = tex_path
+        if not show_preview:
+            return tex_path
+
+        # 显示预览
+        preview_dialog = QMessageBox(self)
+        preview_dialog.setWindowTitle("生成预览")
+        preview_dialog.setTextFormat(Qt.RichText)
+        preview_dialog.setText(f"<h3>文书内容预览</h3><p>{preview_text[:1000]}...</p>")
+        preview_dialog.setDetailedText(f"文件已保存至: {tex_path}")
+        preview_dialog.exec_()
+        return tex_path
+
+    @staticmethod
+    def create_latex_document(data, generated_content):
+        """创建包含生成内容的LaTeX文档，generated_content为字符串或分段的 [(标题, 正文)] 列表"""
+        from pylatex import Document, Section, Subsection, Command, Figure
+        from pylatex.utils import NoEscape
+
+        doc = Document(documentclass="article")
+
+        # 添加LaTeX包
+        doc.preamble.append(Command("usepackage", "graphicx"))
+        doc.preamble.append(Command("usepackage", "xcolor"))
+        doc.preamble.append(Command("usepackage", "fontspec"))
+        doc.preamble.append(Command("usepackage", "geometry", options=["a4paper", "margin=1.5cm"]))
+        doc.preamble.append(Command("usepackage", "parskip"))
+        # 之前的部分可预编译为格式文件(见build_format)
+        doc.preamble.append(NoEscape(ENDOFDUMP))
+
+        # 设置中文字体
+        doc.preamble.append(NoEscape(r"\setmainfont{Noto Serif CJK SC}"))
+        doc.preamble.append(NoEscape(r"\setsansfont{Noto Sans CJK SC}"))
+
+        # 文档标题
+        doc.preamble.append(Command("title", f"{data['doc_type']} - {data['name']}"))
+        doc.preamble.append(Command("author", data['name']))
+        doc.append(NoEscape(r"\maketitle"))
+
+        # 添加照片部分
+        photo_filename = copy_photo(data["photo_path"]) if data["photo_path"] else None
+        if photo_filename:
+            with doc.create(Figure(position="h!")) as photo_fig:
+                photo_fig.add_image(photo_filename, width=NoEscape(r"0.2\textwidth"))
+                photo_fig.add_caption("个人照片")
+
+        # 按文书类型的版式依次添加各章节
+        for title, source in DOCUMENT_LAYOUTS[doc_kind(data["doc_type"])]:
+            if source in PROFILE_FIELDS and not data[source]:
+                continue
+            with doc.create(Section(title)):
+                if source == "generated" and not isinstance(generated_content, str):
+                    # 分段生成的个人陈述，每段一个小节
+                    for subtitle, text in generated_content:
+                        with doc.create(Subsection(subtitle)):
+                            doc.append(NoEscape(text))
+                elif source == "generated":
+                    doc.append(NoEscape(generated_content))
+                elif source in PROFILE_FIELDS:
+                    doc.append(NoEscape(escape_paragraphs(data[source])))
+                else:
+                    for paragraph in layout_paragraphs(data, source):
+                        doc.append(paragraph)
+
+        return doc
+
+    def preview_pdf(self):
+        if not hasattr(self, "generated_tex_path") or not self.generated_tex_path:
+            self.statusBar().showMessage("请先生成文书", 3000)
+            return
+
+        if self.compile_worker is not None and self.compile_worker.isRunning():
+            self.statusBar().showMessage("PDF正在编译中，请稍候...", 3000)
+            return
+
+        # 检查系统是否安装了XeLaTeX/LuaLaTeX(瘦客户端模式下由服务编译)
+        if not self.service_url and not find_latex_engine():
+            QMessageBox.information(
+                self,
+                "PDF预览",
+                "PDF预览需要安装LaTeX环境(如MiKTeX或TeX Live)，并包含XeLaTeX\n"
+                f"生成的LaTeX文件已保存至: {self.generated_tex_path}"
+            )
+            return
+
+        self.compile_log.clear()
+        if self.service_url:
+            self.statusBar().showMessage("正在由生成服务编译PDF...")
+            self.compile_worker = ServiceCompileWorker(self.service_url, [self.generated_tex_path])
+            self.compile_worker.finished.connect(self.handle_service_compile_finished)
+        else:
+            self.statusBar().showMessage("正在后台编译PDF...")
+            self.compile_worker = PdfCompileWorker(self.generated_tex_path)
+            self.compile_worker.log.connect(self.compile_log.appendPlainText)
+            self.compile_worker.finished.connect(self.handle_compile_finished)
+        self.compile_worker.start()
+
+    def handle_service_compile_finished(self, report, error):
+        """服务编译单份文档完成，按本地编译的结果处理"""
+        if report is None:
+            self.handle_compile_finished(error, False, False)
+            return
+        item = report["items"][0]
+        if item["status"] == "ok":
+            self.handle_compile_finished(item["pdf_path"], True, item["skipped"])
+        else:
+            self.compile_log.setPlainText(item["error"])
+            self.handle_compile_finished(item["error"].strip().splitlines()[-1] if item["error"].strip() else "",
+                                         False, False)
+
+    def handle_compile_finished(self, result, success, skipped):
+        if not success:
+            self.preview_tabs.setCurrentWidget(self.compile_log)
+            QMessageBox.warning(self, "PDF生成失败", f"无法生成PDF文件，请检查LaTeX安装:\n{result}")
+            return
+
+        get_history_store().set_pdf_path(self.compile_worker.tex_path, result)
+        if skipped:
+            self.statusBar().showMessage("文书内容未变化，直接打开上次生成的PDF", 5000)
+        else:
+            self.statusBar().showMessage(f"PDF已生成: {result}", 5000)
+        # 跨平台打开PDF文件
+        QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.abspath(result)))
+
+    def compile_all(self):
+        """把输出目录中的所有.tex并行编译为PDF，进度与失败报告写入编译日志"""
+        if self.bulk_compile_worker is not None and self.bulk_compile_worker.isRunning():
+            self.statusBar().showMessage("正在批量编译，请稍候...", 3000)
+            return
+        if not self.service_url and not find_latex_engine():
+            QMessageBox.information(self, "批量编译", "批量编译需要安装LaTeX环境(如MiKTeX或TeX Live)，并包含XeLaTeX")
+            return
+        tex_paths = list_tex_files(ensure_output_dir())
+        if not tex_paths:
+            QMessageBox.information(self, "批量编译", f"{OUTPUT_DIR} 中没有.tex文件")
+            return
+
+        self.compile_log.clear()
+        self.compile_log.appendPlainText(f"开始编译 {len(tex_paths)} 份文档...")
+        self.preview_tabs.setCurrentWidget(self.compile_log)
+        self.compile_all_btn.setEnabled(False)
+        if self.service_url:
+            self.bulk_compile_worker = ServiceCompileWorker(self.service_url, tex_paths)
+        else:
+            self.bulk_compile_worker = BulkCompileWorker(tex_paths)
+        self.bulk_compile_worker.item_finished.connect(self.handle_bulk_compile_item)
+        self.bulk_compile_worker.finished.connect(self.handle_bulk_compile_finished)
+        self.bulk_compile_worker.start()
+
+    def handle_bulk_compile_item(self, item):
+        state = "跳过" if item.get("skipped") else ("完成" if item["status"] == "ok" else "失败")
+        self.compile_log.appendPlainText(f"[{state}] {item['tex_path']} ({item['seconds']}s)")
+
+    def handle_bulk_compile_finished(self, report, error):
+        self.compile_all_btn.setEnabled(True)
+        if report is None:
+            QMessageBox.warning(self, "批量编译失败", error)
+            return
+        self.compile_log.appendPlainText(format_compile_report(report))
+        self.statusBar().showMessage(f"批量编译完成：成功 {report['succeeded']}，失败 {report['failed']}", 5000)
+
+    def show_metrics(self):
+        """显示各阶段耗时p50/p95与token用量，可导出为Prometheus格式"""
+        metrics = get_metrics()
+        tokens = "\n".join(f"{model} {kind}: {value}" for (model, kind), value in sorted(metrics.token_totals().items()))
+        text = (format_stage_summary(metrics.summary()) + "\n\n" + (tokens or "暂无token用量记录")
+                + "\n\n" + format_estimate_summary(metrics.estimate_summary())
+                + "\n\n" + format_client_stats(get_api_client().stats())
+                + "\n\n" + format_backend_stats(get_backend_router().stats()))
+        if self.service_url:
+            text += "\n\n" + self.format_service_stats()
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("性能统计")
+        dialog.resize(640, 420)
+        dialog_layout = QVBoxLayout(dialog)
+        view = QPlainTextEdit(text)
+        view.setReadOnly(True)
+        view.setStyleSheet("font-family: monospace;")
+        dialog_layout.addWidget(view)
+        dialog_layout.addWidget(QLabel(f"详细记录: {os.path.abspath(metrics.path)}"))
+
+        export_button = QPushButton("导出Prometheus格式")
+        export_button.clicked.connect(lambda: self.export_metrics(metrics))
+        dialog_layout.addWidget(export_button)
+        dialog.exec_()
+
+    def format_service_stats(self):
+        """瘦客户端模式下，服务端的任务、共享缓存与连接状态"""
+        client = ServiceClient(self.service_url)
+        try:
+            stats = client.stats()
+        except ServiceError as e:
+            return str(e)
+        finally:
+            client.close()
+        jobs = "，".join(f"{JOB_STATES.get(state, state)} {count}" for state, count in stats["jobs"].items())
+        cache = stats["cache"]
+        return (f"生成服务 {self.service_url}: 任务 {jobs or '无'}，"
+                f"共享缓存命中 {cache['hits']} 次 / 未命中 {cache['misses']} 次 ({cache['entries']} 条)\n"
+                + format_client_stats(stats["api_client"]) + "\n"
+                + format_backend_stats(stats["backends"]))
+
+    def export_metrics(self, metrics):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出性能统计", os.path.join(OUTPUT_DIR, "metrics.prom"), "Prometheus文本 (*.prom *.txt)"
+        )
+        if file_path:
+            try:
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(metrics.to_prometheus())
+                self.statusBar().showMessage(f"性能统计已导出: {file_path}", 5000)
+            except Exception as e:
+                QMessageBox.critical(self, "导出失败", f"文件保存失败:\n{str(e)}")
+
+    def show_history(self):
+        """历史记录：按申请人、申请目标或正文即时搜索，可把选中的记录载入表单"""
+        store = get_history_store()
+        dialog = QDialog(self)
+        dialog.setWindowTitle("历史记录")
+        dialog.resize(820, 480)
+        dialog_layout = QVBoxLayout(dialog)
+
+        search_input = QLineEdit()
+        search_input.setPlaceholderText("搜索申请人、申请目标或文书内容")
+        dialog_layout.addWidget(search_input)
+        table = QTableWidget(0, 5)
+        table.setHorizontalHeaderLabels(["时间", "申请人", "申请目标", "类型", "内容"])
+        table.horizontalHeader().setSectionResizeMode(4, QHeaderView.Stretch)
+        table.verticalHeader().setVisible(False)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SingleSelection)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        dialog_layout.addWidget(table)
+        status_label = QLabel()
+        dialog_layout.addWidget(status_label)
+
+        def search():
+            started = time.perf_counter()
+            records = store.search(search_input.text())
+            elapsed = (time.perf_counter() - started) * 1000
+            table.setRowCount(len(records))
+            for row, record in enumerate(records):
+                created = datetime.datetime.fromtimestamp(record["created_at"]).strftime("%Y-%m-%d %H:%M")
+                values = [created, record["name"], record["target"].replace("\n", "; "), record["doc_type"],
+                          " ".join(record["snippet"].split())]
+                for column, value in enumerate(values):
+                    cell = QTableWidgetItem(value)
+                    cell.setData(Qt.UserRole, record["id"])
+                    table.setItem(row, column, cell)
+            status_label.setText(f"显示 {len(records)} 条，查询用时 {elapsed:.1f} 毫秒")
+
+        # 输入停顿后再查询，避免每个按键都查一次
+        timer = QTimer(dialog)
+        timer.setSingleShot(True)
+        timer.setInterval(150)
+        timer.timeout.connect(search)
+        search_input.textChanged.connect(lambda text: timer.start())
+
+        def load_selected():
+            rows = table.selectionModel().selectedRows()
+            if rows:
+                self.load_history_record(store.get(rows[0].data(Qt.UserRole)))
+                dialog.accept()
+
+        table.cellDoubleClicked.connect(lambda row, column: load_selected())
+        load_button = QPushButton("载入表单")
+        load_button.clicked.connect(load_selected)
+        dialog_layout.addWidget(load_button)
+        search()
+        dialog.exec_()
+
+    def load_history_record(self, record):
+        """把历史记录的表单快照填回界面，并显示当时生成的内容"""
+        if record is None:
+            return
+        form = record["form"]
+        for field, widget in [("name", self.name_input), ("email", self.email_input), ("phone", self.phone_input),
+                              ("university", self.university_input), ("major", self.major_input),
+                              ("gpa", self.gpa_input)]:
+            widget.setText(form.get(field, ""))
+        for field, widget in [("awards", self.awards_input), ("research", self.research_input),
+                              ("competitions", self.competitions_input), ("target", self.target_input)]:
+            widget.setPlainText(form.get(field, ""))
+        if self.target_type.findText(form.get("doc_type", "")) >= 0:
+            self.target_type.setCurrentText(form["doc_type"])
+
+        self.photo_path = form.get("photo_path", "")
+        self.photo_preview.setText("无照片")
+        if self.photo_path:
+            try:
+                self.photo_preview.setPixmap(QPixmap(get_photo_store().thumbnail(self.photo_path, THUMBNAIL_SIZE)))
+            except Exception:
+                self.photo_preview.setText("照片已不存在")
+
+        self.preview_job = None
+        self.generated_content = record["content"]
+        self.content_preview.setPlainText(record["content"])
+        self.preview_tabs.setCurrentWidget(self.content_preview)
+        self.generated_tex_path = record["tex_path"] if os.path.exists(record["tex_path"] or "") else ""
+        self.statusBar().showMessage(
+            f"已载入 {datetime.datetime.fromtimestamp(record['created_at']):%Y-%m-%d %H:%M} 的记录 ({record['model']})", 5000
+        )
+
+    def export_latex(self):
+        if not hasattr(self, "generated_tex_path") or not self.generated_tex_path:
+            self.statusBar().showMessage("请先生成文书", 3000)
+            return
+
+        # 保存LaTeX文件
+        default_filename = os.path.basename(self.generated_tex_path)
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "保存LaTeX文件", os.path.join(OUTPUT_DIR, default_filename), "LaTeX文件 (*.tex)"
+        )
+
+        if file_path:
+            if not file_path.endswith(".tex"):
+                file_path += ".tex"
+
+            try:
+                with open(self.generated_tex_path, "r", encoding="utf-8") as src:
+                    with open(file_path, "w", encoding="utf-8") as dest:
+                        dest.write(src.read())
+                self.statusBar().showMessage(f"LaTeX文件已保存: {file_path}", 5000)
+            except Exception as e:
+                QMessageBox.critical(self, "保存失败", f"文件保存失败:\n{str(e)}")
+
+
+def save_latex_document(doc, tex_path):
+    """保存pylatex文档到tex_path (generate_tex会自动追加.tex扩展名)"""
+    doc.generate_tex(os.path.splitext(tex_path)[0])
+    return tex_path
+
+
+# ---------------------------------------------------------------------------
+# 提示词构建与token预算
+# ---------------------------------------------------------------------------
+
+# 提示词中的档案各节：(标题, [(字段, 标签)])。邮箱、电话由版式直接排版，不需要发给模型
+PROFILE_SECTIONS = [
+    ("教育背景", [("university", "院校"), ("major", "专业"), ("gpa", "GPA")]),
+    ("经历与成就", [("awards", "获奖经历"), ("research", "科研经历"), ("competitions", "竞赛经历")]),
+]
+
+# 各文书类型默认要求的正文长度 (数量, 单位)，档案中的length字段可覆盖
+DOC_LENGTHS = {"ps": (1000, "词"), "academic_cv": (300, "词"), "job_cv": (500, "字")}
+# 每个英文词、中文字约消耗的token数
+TOKENS_PER_UNIT = {"词": 1.3, "字": 0.6}
+# 输出上限相对要求长度的余量，容纳LaTeX标记与长度浮动
+OUTPUT_TOKEN_MARGIN = 1.6
+MIN_OUTPUT_TOKENS = 400
+
+
+def compact_prompt(text):
+    """去掉缩进与多余空白，合并连续空行"""
+    lines = [" ".join(line.split()) for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def profile_value(data, field):
+    """多行字段合并为一行，空行省略"""
+    return "；".join(line.strip() for line in str(data.get(field) or "").splitlines() if line.strip())
+
+
+def profile_sections(data):
+    """档案各节，空字段不发送，整节为空时省略该节"""
+    blocks = []
+    for title, fields in PROFILE_SECTIONS:
+        lines = [f"- {label}：{profile_value(data, field)}" for field, label in fields if profile_value(data, field)]
+        if lines:
+            blocks.append(f"## {title}\n" + "\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def requested_length(data):
+    """要求的正文长度 (数量, 单位)"""
+    length, unit = DOC_LENGTHS[doc_kind(data["doc_type"])]
+    try:
+        length = int(data.get("length") or length)
+    except (TypeError, ValueError):
+        pass
+    return length, unit
+
+
+def output_max_tokens(data):
+    """按要求的长度换算max_tokens，取50的整数倍"""
+    length, unit = requested_length(data)
+    tokens = length * TOKENS_PER_UNIT[unit] * OUTPUT_TOKEN_MARGIN
+    return max(MIN_OUTPUT_TOKENS, -(-int(tokens) // 50) * 50)
+
+
+def build_prompt(data):
+    """根据文书类型构建提示词"""
+    with get_metrics().stage("prompt_build"):
+        kind = doc_kind(data["doc_type"])
+        if kind == "ps":
+            return ResumeGeneratorApp.build_study_abroad_prompt(data)
+        if kind == "academic_cv":
+            return ResumeGeneratorApp.build_academic_cv_prompt(data)
+        return ResumeGeneratorApp.build_job_application_prompt(data)
+
+
+def render_document(data, content, tex_path, renderer=None):
+    """生成.tex文件，各步骤分别计时
+
+    renderer为"template"(默认，单次拼接)或"pylatex"(create_latex_document + generate_tex)，两者输出逐字节相同。
+    """
+    metrics = get_metrics()
+    ensure_output_dir()
+    # normalize_latex可重复执行，已检查过的正文不会再被修改
+    with metrics.stage("latex_normalize"):
+        if isinstance(content, str):
+            content = normalize_latex(content)["text"]
+        else:
+            content = [(title, normalize_latex(text)["text"]) for title, text in content]
+
+    if (renderer or LATEX_RENDERER) == "pylatex":
+        with metrics.stage("create_latex_document"):
+            doc = ResumeGeneratorApp.create_latex_document(data, content)
+        with metrics.stage("generate_tex"):
+            save_latex_document(doc, tex_path)
+    else:
+        with metrics.stage("render_template"):
+            source = render_latex_template(data, content)
+        with metrics.stage("generate_tex"):
+            # 与pylatex的generate_tex相同：替换扩展名为.tex，按文本模式写入
+            with open(os.path.splitext(tex_path)[0] + ".tex", "w", encoding="utf-8") as f:
+                f.write(source)
+    return tex_path
+
+
+# ---------------------------------------------------------------------------
+# 文书版式与模板渲染
+# ---------------------------------------------------------------------------
+
+# template: 预编译的字符串模板，单次拼接；pylatex: 逐个构建对象树再序列化。两者输出相同
+LATEX_RENDERERS = ["template", "pylatex"]
+LATEX_RENDERER = "template"
+
+# 各文书类型的章节顺序：(标题, 内容来源)。内容来源为contact/education/job_target时输出固定格式的档案字段，
+# generated为模型生成的内容，其余为档案字段(为空时省略该章节)
+DOCUMENT_LAYOUTS = {
+    "ps": [
+        ("联系方式", "contact"), ("教育背景", "education"), ("申请陈述", "generated"),
+        ("获奖经历", "awards"), ("科研经历", "research"), ("竞赛经历", "competitions"),
+    ],
+    "academic_cv": [
+        ("联系方式", "contact"), ("教育背景", "education"), ("学术简介", "generated"),
+        ("科研经历", "research"), ("获奖经历", "awards"), ("竞赛经历", "competitions"),
+    ],
+    "job_cv": [
+        ("联系方式", "contact"), ("教育背景", "education"), ("求职意向", "job_target"),
+        ("个人陈述", "generated"), ("获奖经历", "awards"), ("科研经历", "research"),
+        ("竞赛经历", "competitions"),
+    ],
+}
+
+
+def doc_kind(doc_type):
+    """文书类型对应的版式：ps(留学申请文书)、academic_cv(学术简历)或job_cv(求职简历)"""
+    if "学术" in doc_type:
+        return "academic_cv"
+    if "留学" in doc_type:
+        return "ps"
+    return "job_cv"
+
+
+def layout_paragraphs(data, source):
+    """固定格式章节的段落(普通文本，渲染时转义)"""
+    if source == "contact":
+        return [f"姓名: {data['name']}\n\n", f"邮箱: {data['email']}\n\n", f"电话: {data['phone']}\n\n"]
+    if source == "education":
+        return [f"{data['university']} | {data['major']}\n\n", f"GPA: {data['gpa']}\n\n"]
+    return [f"目标职位: {data['target']}\n\n"]
+
+
+# 照片在文档中宽0.2\textwidth(A4去掉页边距后约3.6cm)，按300dpi打印约需430像素，长边缩到600像素足够
+PHOTO_MAX_SIZE = 600
+PHOTO_JPEG_QUALITY = 90
+# 处理后的照片保存在OUTPUT_DIR下的子目录，.tex中按相对路径引用
+PHOTO_DIR = "photos"
+THUMBNAIL_SIZE = 100
+
+
+def load_scaled_image(path, max_size):
+    """读取图片并把长边缩小到max_size以内(不放大)，按EXIF方向旋转
+
+    缩放在解码时进行(JPEG可直接按比例解码)，不需要先解码整张大图。
+    """
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid() and (size.width() > max_size or size.height() > max_size):
+        reader.setScaledSize(size.scaled(max_size, max_size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(f"无法读取图片 {path}: {reader.errorString()}")
+    return image
+
+
+class PhotoStore:
+    """按内容哈希保存处理后的照片和预览缩略图
+
+    照片缩小到max_size并重新编码后保存为 OUTPUT_DIR/photos/<哈希>_<max_size>.jpg，同一张照片只处理一次，
+    不同目录下的同名照片也不会互相覆盖。SQLite索引记录 (路径, 大小, 修改时间) -> 内容哈希，
+    文件未变化时不再读取文件计算哈希，重复生成与批量生成时不做任何图片处理。
+    """
+
+    def __init__(self, path=None, max_size=PHOTO_MAX_SIZE):
+        self.path = path or os.path.join(CACHE_DIR, "photos.sqlite")
+        self.max_size = max_size
+        self.stored = {}  # 内容哈希 -> 相对OUTPUT_DIR的文件名
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS photos (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                sha256 TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def content_hash(self, photo_path):
+        photo_path = os.path.abspath(photo_path)
+        stat = os.stat(photo_path)
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM photos WHERE path = ?", (photo_path,)).fetchone()
+        if row and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+        digest = file_sha256(photo_path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?)",
+                (photo_path, stat.st_size, stat.st_mtime_ns, digest)
+            )
+            self.conn.commit()
+        return digest
+
+    def ingest(self, photo_path):
+        """返回处理后照片相对OUTPUT_DIR的路径，已处理过的照片直接返回"""
+        digest = self.content_hash(photo_path)
+        filename = self.stored.get(digest)
+        if filename and os.path.exists(os.path.join(OUTPUT_DIR, filename)):
+            return filename
+
+        stem = f"{PHOTO_DIR}/{digest[:16]}_{self.max_size}"
+        for extension in ("jpg", "png"):
+            filename = f"{stem}.{extension}"
+            if os.path.exists(os.path.join(OUTPUT_DIR, filename)):
+                self.stored[digest] = filename
+                return filename
+
+        os.makedirs(os.path.join(OUTPUT_DIR, PHOTO_DIR), exist_ok=True)
+        reader = QImageReader(photo_path)
+        size, image_format = reader.size(), bytes(reader.format()).decode()
+        if (size.isValid() and max(size.width(), size.height()) <= self.max_size
+                and image_format in ("jpeg", "png") and int(reader.transformation()) == 0):
+            # 已经足够小的JPEG/PNG原样保存，避免重新编码损失画质
+            filename = f"{stem}.{'jpg' if image_format == 'jpeg' else 'png'}"
+            self.write_atomic(filename, lambda path: shutil.copyfile(photo_path, path))
+        else:
+            image = load_scaled_image(photo_path, self.max_size)
+            # 带透明通道的图片保存为PNG，其余统一为JPEG
+            if image.hasAlphaChannel():
+                filename = f"{stem}.png"
+                self.write_atomic(filename, lambda path: image.save(path, "PNG"))
+            else:
+                filename = f"{stem}.jpg"
+                self.write_atomic(filename, lambda path: image.save(path, "JPEG", PHOTO_JPEG_QUALITY))
+        self.stored[digest] = filename
+        return filename
+
+    @staticmethod
+    def write_atomic(filename, write):
+        """先写临时文件再改名，并发生成时其他线程不会读到写了一半的图片"""
+        path = os.path.join(OUTPUT_DIR, filename)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{os.path.splitext(path)[1]}"
+        try:
+            if write(temp_path) is False:
+                raise ValueError(f"无法保存图片 {filename}")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def thumbnail(self, photo_path, size=THUMBNAIL_SIZE):
+        """返回预览缩略图路径，缩略图按内容哈希缓存，只在第一次时解码原图"""
+        digest = self.content_hash(photo_path)
+        thumbnail_path = os.path.join(CACHE_DIR, "thumbnails", f"{digest[:16]}_{size}.png")
+        if not os.path.exists(thumbnail_path):
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            image = load_scaled_image(photo_path, size)
+            if not image.save(thumbnail_path, "PNG"):
+                raise ValueError(f"无法保存缩略图 {thumbnail_path}")
+        return thumbnail_path
+
+
+_photo_store = None
+_photo_store_lock = threading.Lock()
+
+
+def get_photo_store():
+    """进程内共享的照片存储"""
+    global _photo_store
+    with _photo_store_lock:
+        if _photo_store is None:
+            _photo_store = PhotoStore()
+        return _photo_store
+
+
+def copy_photo(photo_path):
+    """把照片(缩小后)保存到输出目录，返回文档中引用的文件名；失败时返回None"""
+    metrics = get_metrics()
+    try:
+        with metrics.stage("photo_copy"):
+            return get_photo_store().ingest(photo_path)
+    except Exception as e:
+        metrics.log({"event": "photo_copy_failed", "error": str(e), "photo_path": photo_path})
+        return None
+
+
+# 模型经常返回完整的LaTeX文档(有时包在```代码块中)，只取正文，避免文档里再套一个文档
+CODE_FENCE_PATTERN = re.compile(r"\A\s*```[\w-]*[ \t]*\n(.*?)\n\s*```\s*\Z", re.S)
+DOCUMENT_BODY_PATTERN = re.compile(r"\\begin\{document\}(.*?)\\end\{document\}", re.S)
+MAKETITLE_PATTERN = re.compile(r"^[ \t]*\\maketitle[ \t]*\n?", re.M)
+
+
+def extract_document_body(text):
+    """去掉代码块标记；如果是完整文档，只保留\\begin{document}与\\end{document}之间的正文(标题由外层文档生成)"""
+    fenced = CODE_FENCE_PATTERN.match(text)
+    if fenced:
+        text = fenced.group(1)
+    match = DOCUMENT_BODY_PATTERN.search(text)
+    if not match:
+        return text
+    return MAKETITLE_PATTERN.sub("", match.group(1)).strip("\n")
+
+
+# 与pylatex.utils.escape_latex相同的转义规则
+LATEX_ESCAPES = str.maketrans({
+    "&": r"\&", "%": r"\%", "$": r"\$", "#": r"\#", "_": r"\_", "{": r"\{", "}": r"\}",
+    "~": r"\textasciitilde{}", "^": r"\^{}", "\\": r"\textbackslash{}", "\n": "\\newline%\n",
+    "-": r"{-}", "\xA0": "~", "[": r"{[}", "]": r"{]}",
+})
+# 与pylatex的Marker相同：标签只保留可打印ASCII字符，并去掉特殊字符
+LABEL_REMOVED_CHARS = dict.fromkeys(map(ord, "&%$#_{}~^\\\n\xA0[]\":;' "))
+
+
+def escape_latex(text):
+    return str(text).translate(LATEX_ESCAPES)
+
+
+def escape_paragraphs(text):
+    """转义多行的档案字段(获奖、科研、竞赛经历)，每行一段"""
+    return "\n\n".join(escape_latex(line) for line in str(text).split("\n"))
+
+
+def latex_label(text):
+    return "".join(ch for ch in text if 32 <= ord(ch) < 127).translate(LABEL_REMOVED_CHARS)
+
+
+def latex_filename(filename):
+    """与pylatex.utils.fix_filename相同：文件名中有多个点时加花括号，含~时用\\detokenize"""
+    parts = filename.split("/" if os.name == "posix" else "\\")
+    name_parts = parts[-1].split(".")
+    if os.name == "posix" and len(name_parts) > 2:
+        parts[-1] = "{" + ".".join(name_parts[:-1]) + "}." + name_parts[-1]
+    fixed = "/".join(parts)
+    if "~" in fixed:
+        fixed = r"\detokenize{" + fixed + "}"
+    return fixed
+
+
+def build_template_head(photo):
+    """文档开头到\\author之前的固定部分，按是否有照片预先生成两份"""
+    packages = [
+        r"\usepackage[T1]{fontenc}", r"\usepackage[utf8]{inputenc}", r"\usepackage{lmodern}",
+        r"\usepackage{textcomp}", r"\usepackage{lastpage}",
+    ]
+    if photo:
+        # pylatex会把图片所需的graphicx加到自动生成的宏包列表末尾
+        packages.append(r"\usepackage{graphicx}")
+    preamble = [
+        r"\usepackage{graphicx}", r"\usepackage{xcolor}", r"\usepackage{fontspec}",
+        r"\usepackage[a4paper,margin=1.5cm]{geometry}", r"\usepackage{parskip}", ENDOFDUMP,
+        r"\setmainfont{Noto Serif CJK SC}", r"\setsansfont{Noto Sans CJK SC}",
+    ]
+    return "\\documentclass{article}%\n" + "%\n".join(packages) + "%\n%\n" + "%\n".join(preamble) + "%\n"
+
+
+TEMPLATE_HEADS = {False: build_template_head(False), True: build_template_head(True)}
+
+
+def template_figure(photo_filename):
+    return (
+        "%\n\n\n\\begin{figure}[h!]%\n\\centering%\n\\includegraphics[width=0.2\\textwidth]{"
+        + latex_filename(photo_filename) + "}%\n\\caption{个人照片}%\n\\end{figure}\n\n"
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def template_heading(command, prefix, title):
+    return f"\\{command}{{{escape_latex(title)}}}%\n\\label{{{prefix}:{escape_latex(latex_label(title))}}}%\n"
+
+
+def template_section(title, body, command="section", prefix="sec"):
+    # 与pylatex的Section一致：结尾的换行统一为一个空行
+    return (template_heading(command, prefix, title) + body).rstrip("\n") + "\n\n"
+
+
+def render_latex_template(data, generated_content):
+    """单次拼接生成LaTeX源码，与create_latex_document(...).dumps()逐字节相同"""
+    photo_filename = copy_photo(data["photo_path"]) if data["photo_path"] else None
+    parts = [
+        TEMPLATE_HEADS[bool(photo_filename)],
+        r"\title{", escape_latex(f"{data['doc_type']} - {data['name']}"), "}%\n",
+        r"\author{", escape_latex(data["name"]), "}%\n%\n",
+        "\\begin{document}%\n\\normalsize%\n\\maketitle",
+    ]
+    if photo_filename:
+        parts.append(template_figure(photo_filename))
+
+    for title, source in DOCUMENT_LAYOUTS[doc_kind(data["doc_type"])]:
+        if source in PROFILE_FIELDS and not data[source]:
+            continue
+        if source == "generated" and not isinstance(generated_content, str):
+            body = "%\n".join(
+                template_section(subtitle, text, "subsection", "subsec") for subtitle, text in generated_content
+            )
+        elif source == "generated":
+            body = generated_content
+        elif source in PROFILE_FIELDS:
+            body = escape_paragraphs(data[source])
+        else:
+            body = "%\n".join(escape_latex(paragraph) for paragraph in layout_paragraphs(data, source))
+        parts.append("%\n")
+        parts.append(template_section(title, body))
+
+    parts.append("%\n\\end{document}")
+    return "".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# 模型输出的LaTeX检查与规范化
+# ---------------------------------------------------------------------------
+
+# 只能出现在导言区的命令，出现在正文中会导致编译失败，直接删除
+PREAMBLE_COMMANDS = {
+    "documentclass", "usepackage", "RequirePackage", "geometry", "setmainfont", "setsansfont",
+    "setmonofont", "setCJKmainfont", "setCJKsansfont", "setCJKmonofont",
+}
+# 文书未加载对应宏包的常见命令/环境，无法自动修复，交给修复提示词处理
+PACKAGE_COMMANDS = {
+    "toprule": "booktabs", "midrule": "booktabs", "bottomrule": "booktabs", "text": "amsmath",
+    "mathbb": "amssymb", "checkmark": "amssymb", "SI": "siunitx", "si": "siunitx",
+    "multirow": "multirow", "faEnvelope": "fontawesome", "faPhone": "fontawesome",
+    "faGithub": "fontawesome", "faLinkedin": "fontawesome",
+}
+PACKAGE_ENVIRONMENTS = {
+    "align": "amsmath", "align*": "amsmath", "gather": "amsmath", "gather*": "amsmath",
+    "multline": "amsmath", "equation*": "amsmath", "tabularx": "tabularx", "longtable": "longtable",
+    "lstlisting": "listings", "minted": "minted", "tikzpicture": "tikz",
+}
+KNOWN_ENVIRONMENTS = {
+    "itemize", "enumerate", "description", "quote", "quotation", "verse", "center", "flushleft",
+    "flushright", "minipage", "table", "figure", "abstract", "tabular", "tabular*", "array",
+    "equation", "displaymath", "math", "eqnarray", "eqnarray*", "thebibliography", "list",
+}
+LIST_ENVIRONMENTS = {"itemize", "enumerate", "description", "thebibliography", "list"}
+ALIGNMENT_ENVIRONMENTS = {"tabular", "tabular*", "array", "eqnarray", "eqnarray*", "tabularx", "longtable",
+                          "align", "align*"}
+MATH_ENVIRONMENTS = {"equation", "equation*", "displaymath", "math", "eqnarray", "eqnarray*", "align",
+                     "align*", "gather", "gather*", "multline"}
+VERBATIM_ENVIRONMENTS = {"verbatim", "verbatim*", "lstlisting", "minted"}
+
+NEWLINE_PATTERN = re.compile("\n")
+LATEX_TOKEN_PATTERN = re.compile(r"\\(?:[A-Za-z]+\*?|.?)|\$\$?|\n[ \t]*\n|[{}%&_^#]", re.S)
+ENVIRONMENT_NAME_PATTERN = re.compile(r"\s*\{([^{}\n]*)\}")
+# 截断的输出中到行尾或全文结束仍未闭合的环境名，如 "\begin{item"
+INCOMPLETE_ENVIRONMENT_PATTERN = re.compile(r"\s*\{[^{}\n]*(?=\n|\Z)")
+VALID_ENVIRONMENT_NAME = re.compile(r"[A-Za-z@]+\*?")
+MARKDOWN_HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+MARKDOWN_ITEM_PATTERN = re.compile(r"^[ \t]*(?:([-*+])|\d+[.)])[ \t]+(.*)$")
+MARKDOWN_BOLD_PATTERN = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*")
+
+
+def convert_markdown(text):
+    """模型有时返回Markdown：把标题、列表和粗体转换为LaTeX，返回 (文本, 是否有转换)"""
+    lines = []
+    list_env = None
+    changed = False
+    for line in text.split("\n"):
+        item = MARKDOWN_ITEM_PATTERN.match(line)
+        env = ("itemize" if item.group(1) else "enumerate") if item else None
+        if list_env and env != list_env:
+            lines.append(f"\\end{{{list_env}}}")
+            list_env = None
+        if item:
+            if not list_env:
+                lines.append(f"\\begin{{{env}}}")
+                list_env = env
+            lines.append(r"\item " + item.group(2))
+            changed = True
+            continue
+        heading = MARKDOWN_HEADING_PATTERN.match(line)
+        if heading:
+            command = "subsection*" if len(heading.group(1)) <= 2 else "subsubsection*"
+            lines.append(f"\\{command}{{{heading.group(2)}}}")
+            changed = True
+            continue
+        lines.append(line)
+    if list_env:
+        lines.append(f"\\end{{{list_env}}}")
+    text, bold_count = MARKDOWN_BOLD_PATTERN.subn(r"\\textbf{\1}", "\n".join(lines))
+    return text, changed or bold_count > 0
+
+
+def skip_group(text, pos):
+    """从pos处的 { 开始跳过一个花括号分组，返回 (分组内容, 分组之后的位置)；没有分组时内容为None"""
+    if pos >= len(text) or text[pos] != "{":
+        return None, pos
+    depth = 0
+    index = pos
+    while index < len(text):
+        char = text[index]
+        if char == "\\":
+            index += 2
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[pos + 1:index], index + 1
+        index += 1
+    return text[pos + 1:], len(text)
+
+
+def skip_arguments(text, pos):
+    """跳过命令后的 [可选参数] 与 {参数}，返回之后的位置"""
+    while pos < len(text):
+        if text[pos] == "[":
+            end = text.find("]", pos)
+            pos = end + 1 if end != -1 else len(text)
+        elif text[pos] == "{":
+            pos = skip_group(text, pos)[1]
+        else:
+            break
+    return pos
+
+
+def normalize_latex(text):
+    """线性扫描模型输出的LaTeX正文并尽量自动修复
+
+    提取正文、去掉代码块、转换Markdown，检查花括号与环境是否配对，转义正文中的 & % _ ^ # $ 等字符。
+    返回 {"text": 修复后的正文, "fixes": 已自动修复的问题, "problems": 无法自动修复的问题, "source": 检查的原文}，
+    问题为 {"line": 行号, "message": 说明, "source": 该行内容}，行号对应source(提取正文、转换Markdown后的文本)。
+    """
+    fixes = []
+    problems = []
+    body = extract_document_body(text)
+    if body != text:
+        fixes.append({"line": 1, "message": "去掉了导言区/代码块，只保留正文", "source": ""})
+    body, converted = convert_markdown(body)
+    if converted:
+        fixes.append({"line": 1, "message": "Markdown格式已转换为LaTeX", "source": ""})
+
+    out = []
+    envs = []  # [(环境名, 进入时的花括号深度)]
+    # comment: 扫描停在行末注释中，此后补全的内容需要先换行
+    state = {"braces": 0, "math": None, "math_envs": 0, "comment": False}
+    literal_dollars = set()  # 确认是普通字符(而非公式开始)的 $ 的位置
+    snapshot = None  # 进入行内公式时的扫描状态，公式不成对时从这里按普通字符重新扫描
+    pos = 0
+
+    newlines = [match.start() for match in NEWLINE_PATTERN.finditer(body)]
+
+    def note(issues, position, message):
+        line = bisect.bisect_left(newlines, position)
+        line_start = newlines[line - 1] + 1 if line else 0
+        line_end = newlines[line] if line < len(newlines) else len(body)
+        issues.append({"line": line + 1, "message": message, "source": body[line_start:line_end].strip()[:120]})
+
+    def ends_with_dollar():
+        return next((chunk.endswith("$") for chunk in reversed(out) if chunk), False)
+
+    def drop(position, message):
+        # 删除命令后前后两个 $ 会连成 $$
+        if body.startswith("$", pos) and ends_with_dollar():
+            out.append("{}")
+        note(fixes, position, message)
+
+    def append_closing(text):
+        if state["comment"]:
+            out.append("\n")
+            state["comment"] = False
+        out.append(text)
+
+    def close_environment(name, depth, position):
+        if state["braces"] > depth:
+            append_closing("}" * (state["braces"] - depth))
+            note(fixes, position, f"补全了{state['braces'] - depth}个未闭合的花括号")
+            state["braces"] = depth
+        append_closing(f"\\end{{{name}}}")
+        if name in MATH_ENVIRONMENTS:
+            state["math_envs"] -= 1
+
+    def rescan_dollar():
+        """行内公式到段落结束或全文结束仍未闭合：开头的 $ 应该是普通字符"""
+        nonlocal pos, envs
+        pos, out_length, fix_count, problem_count, saved_envs, saved_state = snapshot
+        del out[out_length:], fixes[fix_count:], problems[problem_count:]
+        envs = saved_envs
+        state.update(saved_state)
+        literal_dollars.add(pos)
+
+    while True:
+        while pos < len(body):
+            match = LATEX_TOKEN_PATTERN.search(body, pos)
+            if not match:
+                out.append(body[pos:])
+                pos = len(body)
+                break
+            start, token = match.start(), match.group()
+            out.append(body[pos:start])
+            pos = match.end()
+            in_math = state["math"] is not None or state["math_envs"] > 0
+
+            if token.startswith("\n"):
+                if state["math"] == "$":
+                    rescan_dollar()
+                    continue
+                out.append(token)
+            elif token.startswith("$"):
+                if start in literal_dollars:
+                    out.append(r"\$")
+                    pos = start + 1
+                    note(fixes, start, "把不成对的 $ 转义为 \\$")
+                elif not in_math:
+                    state["math"] = token
+                    if token == "$":
+                        snapshot = (start, len(out), len(fixes), len(problems), list(envs), dict(state, math=None))
+                    out.append(token)
+                elif state["math"] == "$":
+                    out.append("$")
+                    pos = start + 1
+                    state["math"] = None
+                else:
+                    if state["math"] == token:
+                        state["math"] = None
+                    out.append(token)
+            elif token == "{":
+                state["braces"] += 1
+                out.append(token)
+            elif token == "}":
+                if state["braces"] > (envs[-1][1] if envs else 0):
+                    state["braces"] -= 1
+                    out.append(token)
+                else:
+                    out.append(r"\}")
+                    note(fixes, start, "转义了多余的 }")
+            elif token == "%":
+                if start > 0 and body[start - 1].isdigit():
+                    # "30%"这类百分数，而不是注释
+                    out.append(r"\%")
+                    note(fixes, start, "把百分号转义为 \\%")
+                else:
+                    end = body.find("\n", start)
+                    pos = len(body) if end == -1 else end
+                    state["comment"] = end == -1
+                    out.append(body[start:pos])
+            elif token == "&":
+                if in_math or (envs and envs[-1][0] in ALIGNMENT_ENVIRONMENTS):
+                    out.append(token)
+                else:
+                    out.append(r"\&")
+                    note(fixes, start, "把 & 转义为 \\&")
+            elif token in ("_", "^"):
+                if in_math:
+                    out.append(token)
+                else:
+                    out.append(r"\_" if token == "_" else r"\^{}")
+                    note(fixes, start, f"把正文中的 {token} 转义")
+            elif token == "#":
+                if pos < len(body) and body[pos].isdigit():
+                    out.append(token)  # 宏参数 #1
+                else:
+                    out.append(r"\#")
+                    note(fixes, start, "把 # 转义为 \\#")
+            elif token == "\\":
+                out.append(r"\textbackslash{}")
+            elif token in (r"\(", r"\["):
+                if not in_math:
+                    state["math"] = token
+                out.append(token)
+            elif token in (r"\)", r"\]"):
+                if state["math"] == token.replace(")", "(").replace("]", "["):
+                    state["math"] = None
+                out.append(token)
+            elif token in (r"\begin", r"\end"):
+                name_match = ENVIRONMENT_NAME_PATTERN.match(body, pos)
+                incomplete = None if name_match else INCOMPLETE_ENVIRONMENT_PATTERN.match(body, pos)
+                # 未闭合的环境名补全花括号后会变成新的环境，再次规范化时结果不同，因此删除
+                if incomplete:
+                    pos = incomplete.end()
+                    drop(start, f"删除了不完整的 {body[start:pos].strip()}")
+                    continue
+                if not name_match and body[pos:].lstrip().startswith("{"):
+                    drop(start, f"删除了环境名不完整的 {token}")
+                    continue
+                if not name_match:
+                    out.append(token)
+                    note(problems, start, f"{token} 缺少环境名")
+                    continue
+                name = name_match.group(1).strip()
+                pos = name_match.end()
+                if not VALID_ENVIRONMENT_NAME.fullmatch(name):
+                    # 空的或无效的环境名原样保留，不打开也不关闭环境
+                    out.append(body[start:pos])
+                    note(problems, start, f"{token} 缺少环境名" if not name else f"无效的环境名 {name}")
+                elif name == "document":
+                    drop(start, f"删除了多余的 {token}{{document}}")
+                elif token == r"\end":
+                    if not any(env_name == name for env_name, _ in envs):
+                        drop(start, f"删除了没有对应 \\begin 的 \\end{{{name}}}")
+                        continue
+                    while envs[-1][0] != name:
+                        close_environment(*envs.pop(), start)
+                        note(fixes, start, f"补全了未闭合的环境 {name}之内的环境")
+                    close_environment(*envs.pop(), start)
+                elif name in VERBATIM_ENVIRONMENTS:
+                    # 原样输出的环境，内容不检查
+                    end_tag = f"\\end{{{name}}}"
+                    end = body.find(end_tag, pos)
+                    if end == -1:
+                        note(fixes, start, f"补全了 {end_tag}")
+                    pos = len(body) if end == -1 else end + len(end_tag)
+                    out.append(body[start:pos] if end != -1 else body[start:] + end_tag)
+                    if name in PACKAGE_ENVIRONMENTS:
+                        note(problems, start, f"环境 {name} 需要未加载的宏包 {PACKAGE_ENVIRONMENTS[name]}")
+                else:
+                    if name in PACKAGE_ENVIRONMENTS:
+                        note(problems, start, f"环境 {name} 需要未加载的宏包 {PACKAGE_ENVIRONMENTS[name]}")
+                    elif name not in KNOWN_ENVIRONMENTS:
+                        note(problems, start, f"未知的环境 {name}")
+                    if name in MATH_ENVIRONMENTS:
+                        state["math_envs"] += 1
+                    envs.append((name, state["braces"]))
+                    out.append(f"\\begin{{{name}}}")
+            elif token[1:] in PREAMBLE_COMMANDS:
+                pos = skip_arguments(body, pos)
+                drop(start, f"删除了只能用于导言区的 {token}")
+            elif token == r"\maketitle":
+                drop(start, "删除了重复的 \\maketitle")
+            elif token == r"\url":
+                url, pos = skip_group(body, pos)
+                out.append(r"\texttt{" + escape_latex(url or "") + "}")
+                note(fixes, start, "把 \\url 改为 \\texttt (未加载hyperref)")
+            elif token == r"\href":
+                pos = skip_group(body, pos)[1]
+                note(fixes, start, "去掉了 \\href 的链接地址 (未加载hyperref)")
+            else:
+                name = token[1:].rstrip("*")
+                if name in PACKAGE_COMMANDS:
+                    note(problems, start, f"命令 {token} 需要未加载的宏包 {PACKAGE_COMMANDS[name]}")
+                elif name == "item" and not any(env_name in LIST_ENVIRONMENTS for env_name, _ in envs):
+                    note(problems, start, "\\item 不在列表环境中")
+                out.append(token)
+
+        if state["math"] == "$":
+            rescan_dollar()
+            continue
+        break
+
+    if state["math"] is not None:
+        closing = {"$$": "$$", r"\(": r"\)", r"\[": r"\]"}[state["math"]]
+        # 紧跟在 $ 之后的 $$ 会被当成另一种分隔符
+        append_closing(" " + closing if ends_with_dollar() else closing)
+        note(fixes, len(body), "补全了未闭合的公式")
+    while envs:
+        name, depth = envs.pop()
+        close_environment(name, depth, len(body))
+        note(fixes, len(body), f"补全了未闭合的环境 {name}")
+    if state["braces"]:
+        append_closing("}" * state["braces"])
+        note(fixes, len(body), f"补全了{state['braces']}个未闭合的花括号")
+
+    normalized = "".join(out)
+    if not normalized.strip():
+        problems.append({"line": 1, "message": "正文为空", "source": ""})
+    return {"text": normalized, "fixes": fixes, "problems": problems, "source": body}
+
+
+# 修复提示词只包含有问题的行，模型按行返回修改，输出token数与问题数成正比
+REPAIR_MODEL = "deepseek-chat"
+REPAIR_MAX_TOKENS = 800
+LOADED_PACKAGES = ["fontenc", "inputenc", "lmodern", "textcomp", "lastpage", "graphicx", "xcolor", "fontspec",
+                   "geometry", "parskip"]
+REPAIR_LINE_PATTERN = re.compile(r"^\s*(\d+)\s*[:：][ \t]?(.*)$")
+
+
+def build_repair_prompt(problems):
+    """把无法自动修复的问题整理成修复提示词"""
+    lines = {}
+    for problem in problems:
+        lines.setdefault(problem["line"], (problem["source"], []))[1].append(problem["message"])
+    listed = "\n".join(
+        f"{line}: {source}\n   问题: {'；'.join(messages)}" for line, (source, messages) in sorted(lines.items())
+    )
+    return (
+        "下面是一份LaTeX文书正文中无法编译的行。文档只加载了以下宏包，不能再添加宏包：\n"
+        f"{', '.join(LOADED_PACKAGES)}\n"
+        "请只修改这些行，改用已加载宏包或基础LaTeX实现相同的效果，保持原文内容和语言不变。\n"
+        "每行按\"行号: 修改后的内容\"的格式输出，删除某行时输出\"行号:\"，不要输出其他内容，不要使用代码块。\n\n"
+        + listed
+    )
+
+
+def apply_repair(source, reply):
+    """把模型按行返回的修改应用到原文，忽略格式不对的行和不存在的行号"""
+    lines = source.split("\n")
+    for reply_line in reply.splitlines():
+        match = REPAIR_LINE_PATTERN.match(reply_line)
+        if match and 1 <= int(match.group(1)) <= len(lines):
+            lines[int(match.group(1)) - 1] = match.group(2)
+    return "\n".join(lines)
+
+
+def adopt_repair(checked, reply):
+    """修复后问题更少时采用修复结果，否则保留原结果"""
+    repaired = normalize_latex(apply_repair(checked["source"], reply))
+    if len(repaired["problems"]) < len(checked["problems"]):
+        return dict(repaired, repaired=True)
+    return checked
+
+
+def check_latex(content, repair=None):
+    """规范化模型输出的正文；仍有无法自动修复的问题时，用repair(提示词)->回复 请模型修复一次
+
+    返回normalize_latex的结果，另有repaired标记是否采用了模型的修复。修复失败不影响生成。
+    """
+    metrics = get_metrics()
+    with metrics.stage("latex_normalize"):
+        checked = dict(normalize_latex(content), repaired=False)
+    if checked["problems"] and repair is not None:
+        with metrics.stage("latex_repair", problems=len(checked["problems"])):
+            try:
+                checked = adopt_repair(checked, repair(build_repair_prompt(checked["problems"])))
+            except Exception as e:
+                metrics.log({"event": "latex_repair_failed", "error": str(e)})
+    return checked
+
+
+async def check_latex_async(content, client):
+    """check_latex的异步版本，通过AsyncDeepSeekClient请求修复"""
+    metrics = get_metrics()
+    with metrics.stage("latex_normalize"):
+        checked = dict(normalize_latex(content), repaired=False)
+    if checked["problems"]:
+        with metrics.stage("latex_repair", problems=len(checked["problems"])):
+            try:
+                result = await client.complete(
+                    build_repair_prompt(checked["problems"]), max_tokens=REPAIR_MAX_TOKENS, model=REPAIR_MODEL,
+                    kind="repair"
+                )
+                checked = adopt_repair(checked, result["content"])
+            except Exception as e:
+                metrics.log({"event": "latex_repair_failed", "error": str(e)})
+    return checked
+
+
+def format_latex_check(checked):
+    """检查结果的简短说明，用于界面日志"""
+    lines = [f"自动修复 {len(checked['fixes'])} 处" + ("，已按模型的修复更新" if checked["repaired"] else "")]
+    lines += [f"第{problem['line']}行: {problem['message']}  {problem['source']}" for problem in checked["problems"]]
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# 个人陈述分段并行生成
+# ---------------------------------------------------------------------------
+
+# 先生成提纲，再按提纲并行生成各段；fields为该段提示词用到的档案字段
+PS_SECTIONS = [
+    {
+        "key": "motivation",
+        "title": "Motivation",
+        "fields": ["major", "university"],
+        "words": 250,
+        "instruction": "说明申请动机：学术兴趣的由来、为什么选择该方向，以及长期目标。",
+    },
+    {
+        "key": "research",
+        "title": "Research Experience",
+        "fields": ["major", "research"],
+        "words": 300,
+        "instruction": "详细介绍科研经历：研究问题、申请人的具体贡献、方法与收获，突出研究潜力。",
+    },
+    {
+        "key": "achievements",
+        "title": "Awards and Competitions",
+        "fields": ["gpa", "awards", "competitions"],
+        "words": 200,
+        "instruction": "结合GPA、获奖和竞赛经历展现学术能力与个人特质，避免简单罗列。",
+    },
+    {
+        "key": "fit",
+        "title": "Fit with the Program",
+        "fields": ["major", "research"],
+        "words": 200,
+        "instruction": "说明申请人与申请目标项目的契合度，以及入学后的学习与研究计划。",
+    },
+]
+
+FIELD_LABELS = {
+    "university": "院校",
+    "major": "专业",
+    "gpa": "GPA",
+    "awards": "获奖经历",
+    "research": "科研经历",
+    "competitions": "竞赛经历",
+}
+
+OUTLINE_MAX_TOKENS = 400
+
+
+def ps_sections_for(data):
+    """档案中没有相关经历的段落不生成"""
+    sections = []
+    for section in PS_SECTIONS:
+        if section["key"] == "research" and not data["research"].strip():
+            continue
+        if section["key"] == "achievements" and not (data["awards"].strip() or data["competitions"].strip()):
+            continue
+        sections.append(section)
+    return sections
+
+
+def format_profile(data, fields):
+    return "\n".join(f"- {FIELD_LABELS[field]}：{profile_value(data, field)}" for field in fields
+                     if profile_value(data, field))
+
+
+def build_outline_prompt(data):
+    """构建个人陈述提纲提示词"""
+    sections = ps_sections_for(data)
+    section_list = "\n".join(f"- {section['title']}" for section in sections)
+    return f"""你是一位专业的留学申请文书写作专家，请为申请人{data['name']}的英文个人陈述(Personal Statement)列出提纲。
+
+## 申请人档案
+{format_profile(data, list(FIELD_LABELS))}
+
+## 提纲要求
+按以下部分组织，每部分用英文列出2-3个要点，只输出纯文本提纲，不要LaTeX代码：
+{section_list}
+
+## 申请目标
+{data['target']}
+"""
+
+
+def build_section_prompt(data, section, outline):
+    """构建个人陈述单个段落的提示词，公共部分在前、本段内容在后"""
+    return f"""你是一位专业的留学申请文书写作专家，正在为申请人{data['name']}撰写申请以下目标的英文个人陈述，全文按提纲分段撰写。
+
+## 申请目标
+{data['target']}
+
+## 全文提纲
+{outline}
+
+## 本段相关信息
+{format_profile(data, section['fields']) or '- 无'}
+
+## 写作要求
+本段为"{section['title']}"部分：{section['instruction']}
+只输出本段正文，可使用LaTeX段落格式，不要包含\\documentclass、\\section等文档结构命令，不要使用Markdown。
+内容均为英文，约{section['words']}词。
+"""
+
+
+def section_max_tokens(section):
+    # 英文约每词1.3个token，留出LaTeX标记的余量
+    return int(section["words"] * 2)
+
+
+def stale_sections(previous, data):
+    """对比上次分段生成时的表单，返回需要重新生成的段落key列表
+
+    提纲提示词包含全部档案字段，其中任一字段(或姓名、申请目标、文书类型)的改动都会使原提纲过期，
+    此时返回None，连同提纲全部重新生成；提纲不变时，只重新生成提示词有变化或上次缺少的段落。
+    邮箱、电话、照片只影响排版，不会使提纲或任何段落过期。
+    """
+    old_data = previous["data"]
+    if old_data.get("doc_type") != data.get("doc_type") or build_outline_prompt(old_data) != build_outline_prompt(data):
+        return None
+    outline = previous["outline"]
+    return [section["key"] for section in ps_sections_for(data)
+            if section["key"] not in previous["sections"]
+            or build_section_prompt(old_data, section, outline) != build_section_prompt(data, section, outline)]
+
+
+async def generate_section_async(client, data, section, outline, on_section=None):
+    with get_metrics().stage("prompt_build", section=section["key"]):
+        prompt = build_section_prompt(data, section, outline)
+    result = await client.complete(prompt, max_tokens=section_max_tokens(section), kind="section")
+    checked = await check_latex_async(result["content"], client)
+    result = dict(result, content=checked["text"].strip(), latex_problems=checked["problems"])
+    if on_section:
+        on_section(section["key"], result["content"])
+    return result
+
+
+def sum_usage(results):
+    usage = {}
+    for result in results:
+        for key, value in (result["usage"] or {}).items():
+            if isinstance(value, int):
+                usage[key] = usage.get(key, 0) + value
+    return usage
+
+
+async def generate_sections_async(client, data, on_section=None, previous=None):
+    """先生成提纲，再并行生成各段，耗时约为提纲加最长一段
+
+    传入上次的生成结果previous且提纲所依据的字段没有变化时，沿用原提纲与未受影响的段落(见stale_sections)。
+    """
+    import asyncio
+    stale = stale_sections(previous, data) if previous else None
+    sections = ps_sections_for(data)
+    if stale is None:
+        with get_metrics().stage("prompt_build", section="outline"):
+            prompt = build_outline_prompt(data)
+        outline_result = await client.complete(prompt, max_tokens=OUTLINE_MAX_TOKENS, kind="outline")
+        outline = outline_result["content"].strip()
+        calls = [outline_result]
+        stale = [section["key"] for section in sections]
+    else:
+        outline = previous["outline"]
+        calls = []
+
+    results = await asyncio.gather(*(
+        generate_section_async(client, data, section, outline, on_section)
+        for section in sections if section["key"] in stale
+    ))
+    texts = dict(zip(stale, (result["content"] for result in results)))
+    calls.extend(results)
+    return {
+        "data": dict(data),
+        "outline": outline,
+        # 没有重新生成的段落沿用上次的正文
+        "sections": {section["key"]: texts.get(section["key"], previous and previous["sections"].get(section["key"]))
+                     for section in sections},
+        "regenerated": stale,
+        "usage": sum_usage(calls),
+        "cached": all(result["cached"] for result in calls),
+        "latex_problems": [problem for result in results for problem in result["latex_problems"]],
+    }
+
+
+def merge_sections(result):
+    """把分段结果整理为create_latex_document接受的 [(标题, 正文)] 列表"""
+    return [(section["title"], result["sections"][section["key"]])
+            for section in PS_SECTIONS if section["key"] in result["sections"]]
+
+
+def sections_to_text(sections):
+    return "\n\n".join(f"{title}\n{text}" for title, text in sections)
+
+
+def generate_statement(api_key, data, model="deepseek-chat", cache=None, force_refresh=False, previous=None,
+                       cancel_token=None, on_section=None, on_progress=None):
+    """在当前线程中完成分段生成(界面的SectionedStatementWorker与本地服务共用)，返回generate_sections_async的结果
+
+    on_section(标题, 正文)在每段完成时调用，on_progress(百分比)报告进度。
+    """
+    import asyncio
+    sections = ps_sections_for(data)
+    if previous:
+        stale = stale_sections(previous, data)
+        if stale is not None:
+            sections = [section for section in sections if section["key"] in stale]
+    done = []
+
+    def section_finished(key, text):
+        done.append(key)
+        if on_progress:
+            on_progress(20 + 80 * len(done) // (len(sections) + 1))
+        if on_section:
+            on_section(next(section["title"] for section in PS_SECTIONS if section["key"] == key), text)
+
+    async def generate():
+        client = AsyncDeepSeekClient(
+            api_key, model, max(1, len(sections)),
+            cache=cache, force_refresh=force_refresh, cancel_token=cancel_token
+        )
+        try:
+            return await generate_sections_async(client, data, section_finished, previous)
+        finally:
+            client.close()
+
+    if on_progress:
+        on_progress(5)
+    return asyncio.run(generate())
+
+
+class SectionedStatementWorker(QThread):
+    """后台线程：分段并行生成个人陈述，由JobQueue作为一个任务运行"""
+    content_delta = pyqtSignal(str)  # 完成的段落(带标题)，按完成顺序
+    reasoning_delta = pyqtSignal(str)  # 与DeepSeekAPIWorker相同的信号，分段生成时不发出
+    checked = pyqtSignal(object)  # 各段检查后仍未解决的问题，格式同check_latex的返回值
+    progress = pyqtSignal(int)  # 进度百分比
+    finished = pyqtSignal(object, bool)  # (分段结果dict或错误信息, 是否成功)
+
+    def __init__(self, api_key, data, model="deepseek-chat", force_refresh=False, previous=None, parent=None):
+        super().__init__(parent)
+        self.api_key = api_key
+        self.data = data
+        self.model = model
+        self.force_refresh = force_refresh
+        self.previous = previous
+        self.cancel_token = CancelToken()
+
+    def cancel(self):
+        """通过cancel_token取消，不等待进行中的请求完成
+
+        不再发出新的请求，重试与限流等待立即结束；进行中的请求在收到下一块数据或响应到达时即中断并丢弃，
+        线程随后以"已取消"结束。
+        """
+        self.cancel_token.cancel()
+
+    def run(self):
+        try:
+            result = generate_statement(
+                self.api_key, self.data, self.model, cache=get_response_cache(), force_refresh=self.force_refresh,
+                previous=self.previous, cancel_token=self.cancel_token,
+                on_section=lambda title, text: self.content_delta.emit(f"== {title} ==\n{text}\n\n"),
+                on_progress=self.progress.emit
+            )
+            self.cancel_token.check()
+            self.checked.emit({"text": "", "fixes": [], "problems": result["latex_problems"], "repaired": False})
+            self.progress.emit(100)
+            self.finished.emit(result, True)
+        except RequestCancelled:
+            self.finished.emit("已取消", False)
+        except DeepSeekAPIError as e:
+            self.finished.emit(str(e), False)
+        except Exception as e:
+            self.finished.emit(f"请求异常: {str(e)}", False)
+
+
+# ---------------------------------------------------------------------------
+# 无界面批量生成
+# ---------------------------------------------------------------------------
+
+PROFILE_FIELDS = [
+    "name", "email", "phone", "university", "major", "gpa",
+    "awards", "research", "competitions", "target", "doc_type", "photo_path"
+]
+
+DOC_TYPE_ALIASES = {
+    "study": "留学申请文书",
+    "ps": "留学申请文书",
+    "academic": "学术简历",
+    "academic_cv": "学术简历",
+    "job": "求职简历",
+    "cv": "求职简历",
+}
+
+
+def split_targets(value):
+    """把多个申请目标拆分为列表，支持列表、换行或分号分隔的字符串"""
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value or "").replace("；", ";").replace("\n", ";").split(";")
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+def normalize_profile(record):
+    """把JSONL/CSV中的一条申请人记录整理成与collect_user_data相同的结构"""
+    data = {field: str(record.get(field) or "").strip() for field in PROFILE_FIELDS}
+    doc_type = data["doc_type"].lower()
+    data["doc_type"] = DOC_TYPE_ALIASES.get(doc_type, data["doc_type"] or "留学申请文书")
+    if str(record.get("length") or "").strip():
+        data["length"] = str(record["length"]).strip()  # 可选：正文长度，见requested_length
+    targets = split_targets(record.get("targets")) if record.get("targets") else []
+    return data, targets or [data["target"]]
+
+
+def iter_profiles(path):
+    """流式读取申请人档案(.jsonl或.csv)，逐条返回 (行号, 数据, 目标列表)"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row_number, record in enumerate(rows, start=1):
+            data, targets = normalize_profile(record)
+            yield row_number, data, targets
+
+
+def safe_filename(text, limit=40):
+    """保留字母数字与中文，其余字符替换为下划线"""
+    cleaned = "".join(ch if ch.isalnum() else "_" for ch in text.strip())
+    return "_".join(part for part in cleaned.split("_") if part)[:limit] or "untitled"
+
+
+class AsyncDeepSeekClient:
+    """asyncio客户端：在线程池中执行阻塞请求，用信号量限制同时进行的请求数"""
+
+    def __init__(self, api_key, model="deepseek-chat", concurrency=4, url=None,
+                 cache=None, force_refresh=False, fast_policy=False, hedge_percentile=HEDGE_PERCENTILE,
+                 fallback_deadline=FALLBACK_DEADLINE, cancel_token=None):
+        self.fast_policy = fast_policy
+        self.cancel_token = cancel_token  # 取消时中断所有请求(界面中的分段生成任务)
+        self.hedge_percentile = hedge_percentile
+        self.fallback_deadline = fallback_deadline
+        self.api_key = api_key
+        self.model = model
+        self.url = url
+        self.cache = cache
+        self.force_refresh = force_refresh
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def complete(self, prompt, max_tokens=2000, model=None, kind="document"):
+        """model为None时使用客户端的默认模型，kind为调用类型(见LATENCY_KINDS)"""
+        import asyncio
+        model = model or self.model
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            if self.fast_policy:
+                call = functools.partial(
+                    hedged_completion, hedge_percentile=self.hedge_percentile,
+                    fallback_deadline=self.fallback_deadline
+                )
+            else:
+                call = generate_completion
+            return await loop.run_in_executor(
+                self.executor,
+                lambda: call(
+                    self.api_key, prompt, model, max_tokens=max_tokens, url=self.url,
+                    cache=self.cache, force_refresh=self.force_refresh, cancel_token=self.cancel_token, kind=kind
+                )
+            )
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def prompt_cache_tokens(usage):
+    """从usage中取出命中服务端提示词前缀缓存的token数 (DeepSeek与OpenAI字段不同)"""
+    if "prompt_cache_hit_tokens" in usage:
+        return usage.get("prompt_cache_hit_tokens") or 0
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens") or 0
+
+
+DOCUMENT_FILE_PREFIXES = {"ps": "study", "academic_cv": "academic", "job_cv": "job"}
+
+
+def document_filename(data, run_stamp, *parts):
+    """按文书类型、时间戳和附加部分拼出.tex文件名"""
+    prefix = DOCUMENT_FILE_PREFIXES[doc_kind(data["doc_type"])]
+    return "_".join([f"{prefix}_application", run_stamp] + [str(part) for part in parts]) + ".tex"
+
+
+async def generate_document_async(client, data, tex_path, sectioned=False):
+    """单个目标的完整流程：构建提示词 -> 调用API -> 生成LaTeX文件，返回结果记录"""
+    started = time.perf_counter()
+    item = {
+        "name": data["name"],
+        "target": data["target"],
+        "doc_type": data["doc_type"],
+    }
+    try:
+        if sectioned and "留学" in data["doc_type"]:
+            prompt = build_outline_prompt(data)
+            result = await generate_sections_async(client, data)
+            content = merge_sections(result)
+        else:
+            prompt = build_prompt(data)
+            result = await client.complete(prompt, max_tokens=output_max_tokens(data))
+            checked = await check_latex_async(result["content"], client)
+            content = checked["text"]
+            result = dict(result, latex_problems=checked["problems"])
+        render_document(data, content, tex_path)
+        record_generation(data, result.get("model", client.model), prompt, content, result["usage"], tex_path)
+        usage = result["usage"]
+        item.update(
+            status="ok", tex_path=tex_path, usage=usage, cached=result["cached"],
+            latex_problems=len(result["latex_problems"]),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            cached_prompt_tokens=prompt_cache_tokens(usage)
+        )
+    except Exception as e:
+        item.update(status="failed", error=str(e))
+    item["seconds"] = round(time.perf_counter() - started, 3)
+    return item
+
+
+async def fan_out_targets(client, data, targets, make_path, warm_prefix=True, on_item=None,
+                          sectioned=False):
+    """同一份档案并行生成多个目标的文书
+
+    warm_prefix为True时先单独完成第一个目标，让服务端缓存共享的提示词前缀，
+    其余目标再并行发出，从而命中前缀缓存。
+    """
+    import asyncio
+    jobs = [(index, dict(data, target=target)) for index, target in enumerate(targets, start=1)]
+
+    async def run(index, target_data):
+        item = await generate_document_async(client, target_data, make_path(index, target_data), sectioned)
+        item["target_index"] = index
+        if on_item:
+            on_item(item)
+        return item
+
+    results = []
+    if warm_prefix and len(jobs) > 1:
+        results.append(await run(*jobs[0]))
+        jobs = jobs[1:]
+    results.extend(await asyncio.gather(*(run(*job) for job in jobs)))
+    return results
+
+
+def format_item_summary(item):
+    status = "完成" if item["status"] == "ok" else "失败"
+    label = f"{item['name']} -> {item['target']}" if item["name"] else item["target"]
+    line = f"[{status}] {label} ({item['seconds']}s"
+    if item["status"] == "ok":
+        line += f", 提示词缓存命中 {item['cached_prompt_tokens']}/{item['prompt_tokens']} tokens"
+        if item["cached"]:
+            line += ", 本地缓存"
+        if item["latex_problems"]:
+            line += f", 正文仍有 {item['latex_problems']} 处问题"
+    return line + ")"
+
+
+async def run_batch(profiles_path, api_key, model="deepseek-chat", concurrency=4,
+                    use_cache=True, force_refresh=False, sectioned=False, fast_policy=False,
+                    hedge_percentile=HEDGE_PERCENTILE, fallback_deadline=FALLBACK_DEADLINE, url=None):
+    """批量生成：读取档案 -> 构建提示词 -> 并发调用API -> 生成LaTeX文件，返回汇总报告"""
+    import asyncio
+    cache = get_response_cache() if use_cache else None
+    client = AsyncDeepSeekClient(
+        api_key, model, concurrency, url=url, cache=cache, force_refresh=force_refresh, fast_policy=fast_policy,
+        hedge_percentile=hedge_percentile, fallback_deadline=fallback_deadline
+    )
+    router = get_backend_router()
+    if not url and len(router.backends) > 1:
+        # 先检查各后端，开始时就有耗时数据，不可达的后端不会收到请求
+        await asyncio.get_running_loop().run_in_executor(None, router.check_all, api_key)
+    run_stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # 有界队列：档案边读边处理，不会一次性载入内存
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    results = []
+
+    async def produce():
+        for profile in iter_profiles(profiles_path):
+            await queue.put(profile)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def process(row_number, data, targets):
+        def make_path(target_index, target_data):
+            filename = document_filename(
+                target_data, run_stamp, f"{row_number:04d}", f"{target_index:02d}",
+                safe_filename(target_data["name"]), safe_filename(target_data["target"])
+            )
+            return os.path.join(OUTPUT_DIR, filename)
+
+        items = await fan_out_targets(
+            client, data, targets, make_path, sectioned=sectioned,
+            on_item=lambda item: print(format_item_summary(dict(item, name=f"#{row_number} {item['name']}")))
+        )
+        for item in items:
+            item["row"] = row_number
+        return items
+
+    async def consume():
+        while True:
+            profile = await queue.get()
+            if profile is None:
+                break
+            results.extend(await process(*profile))
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    finally:
+        client.close()
+    wall_seconds = time.perf_counter() - started
+
+    succeeded = [item for item in results if item["status"] == "ok"]
+    report = {
+        "profiles": profiles_path,
+        "model": model,
+        "concurrency": concurrency,
+        "total": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "wall_seconds": round(wall_seconds, 3),
+        "sequential_seconds": round(sum(item["seconds"] for item in results), 3),
+        "completion_tokens": sum(item["usage"].get("completion_tokens", 0) for item in succeeded),
+        "prompt_tokens": sum(item["prompt_tokens"] for item in succeeded),
+        "cached_prompt_tokens": sum(item["cached_prompt_tokens"] for item in succeeded),
+        "cache_hits": sum(1 for item in succeeded if item["cached"]),
+        "api_client": get_api_client().stats(),
+        "backends": router.stats(),
+        "items": sorted(results, key=lambda item: (item["row"], item["target_index"])),
+    }
+    metrics = get_metrics()
+    report["stages"] = metrics.summary()
+    report["token_estimates"] = metrics.estimate_summary()
+    ensure_output_dir()
+    report_path = os.path.join(OUTPUT_DIR, f"batch_report_{run_stamp}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    report["report_path"] = report_path
+    # 供Prometheus textfile采集器等读取
+    metrics_path = os.path.join(OUTPUT_DIR, f"batch_metrics_{run_stamp}.prom")
+    with open(metrics_path, "w", encoding="utf-8") as f:
+        f.write(metrics.to_prometheus())
+    report["metrics_path"] = metrics_path
+    return report
+
+
+def format_stage_summary(summary):
+    """把各阶段耗时汇总格式化为对齐的文本表格"""
+    lines = [f"{'stage':<26}{'count':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'mean(ms)':>12}"]
+    for stage, stats in summary.items():
+        lines.append(f"{stage:<26}{stats['count']:>8}{stats['p50'] * 1000:>12.1f}"
+                     f"{stats['p95'] * 1000:>12.1f}{stats['mean'] * 1000:>12.1f}")
+    return "\n".join(lines)
+
+
+def format_estimate_summary(summary):
+    """估算与实际token数的对照表"""
+    if not summary:
+        return "暂无token估算记录"
+    lines = [f"{'model':<20}{'count':>7}{'est.prompt':>12}{'prompt':>10}{'error':>9}"
+             f"{'max_tokens':>12}{'output':>10}{'p95/max':>9}{'truncated':>11}"]
+    for model, stats in summary.items():
+        lines.append(f"{model:<20}{stats['count']:>7}{stats['estimated_prompt_tokens']:>12}{stats['prompt_tokens']:>10}"
+                     f"{stats['prompt_estimate_error']:>+9.1%}{stats['max_tokens']:>12}{stats['completion_tokens']:>10}"
+                     f"{stats['completion_ratio_p95']:>9.0%}{stats['truncated']:>11}")
+    return "\n".join(lines)
+
+
+def format_backend_stats(stats):
+    """各后端耗时、错误率与健康状态的对齐表格"""
+    lines = [f"{'backend':<20}{'samples':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'errors':>8}{'score':>9}  状态"]
+    for name, backend in stats.items():
+        health = backend["health"]
+        if backend["cooling_down"]:
+            state = "暂停"
+        elif health is None:
+            state = "未检查"
+        else:
+            state = f"{'正常' if health['ok'] else '异常'} ({health['status'] or '无响应'}, {health['seconds']}s)"
+        lines.append(f"{name:<20}{backend['samples']:>8}{str(backend['p50_ms'] or '-'):>10}"
+                     f"{str(backend['p95_ms'] or '-'):>10}{backend['error_rate']:>8.0%}{backend['score']:>9.3f}  {state}")
+    return "\n".join(lines)
+
+
+def format_client_stats(stats):
+    """限流与并发状态的单行摘要"""
+    return (f"最近一分钟 {stats['requests_last_minute']} 次请求 / 约 {stats['tokens_last_minute']} tokens "
+            f"(上限 {stats['rpm_limit'] or '不限'} RPM / {stats['tpm_limit'] or '不限'} TPM)，"
+            f"进行中 {stats['in_flight']}，并发上限 {stats['concurrency_limit']}，"
+            f"限流等待 {stats['rate_limited']} 次 ({stats['rate_limit_wait_seconds']} 秒)，"
+            f"并发减半 {stats['concurrency_decreases']} 次，重试 {stats['retries']} 次")
+
+
+def run_batch_cli(args):
+    api_key = args.api_key or os.environ.get("DEEPSEEK_API_KEY", "")
+    if not api_key:
+        print("缺少API密钥：请使用 --api-key 或设置环境变量 DEEPSEEK_API_KEY")
+        return 2
+    configure_api_client(
+        pool_size=max(16, args.concurrency),
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        max_retries=args.max_retries,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        initial_concurrency=args.concurrency
+    )
+    import asyncio
+    report = asyncio.run(run_batch(
+        args.batch, api_key, args.model, args.concurrency,
+        use_cache=not args.no_cache, force_refresh=args.force, sectioned=args.sectioned,
+        fast_policy=args.fast, hedge_percentile=args.hedge_percentile, fallback_deadline=args.fallback_deadline
+    ))
+    print(f"共 {report['total']} 份文书，成功 {report['succeeded']}，失败 {report['failed']}，"
+          f"耗时 {report['wall_seconds']} 秒 (顺序执行约需 {report['sequential_seconds']} 秒)，"
+          f"命中缓存 {report['cache_hits']} 份")
+    print(f"提示词共 {report['prompt_tokens']} tokens，命中服务端前缀缓存 {report['cached_prompt_tokens']} tokens")
+    print(format_client_stats(report["api_client"]))
+    print(format_backend_stats(report["backends"]))
+    print(f"汇总报告: {report['report_path']}")
+    print(f"阶段耗时(Prometheus格式): {report['metrics_path']}")
+    print(format_stage_summary(report["stages"]))
+    print(format_estimate_summary(report["token_estimates"]))
+    if args.compile:
+        compiled = compile_cli(args, [item["tex_path"] for item in report["items"] if item["status"] == "ok"])
+        return 0 if report["failed"] == 0 and compiled == 0 else 1
+    return 0 if report["failed"] == 0 else 1
+
+
+def compile_cli(args, tex_paths):
+    """命令行批量编译，逐份输出进度，结束时输出失败报告"""
+    if not tex_paths:
+        print("没有需要编译的.tex文件")
+        return 0
+    print(f"编译 {len(tex_paths)} 份文档...")
+
+    def on_item(item):
+        state = "跳过" if item.get("skipped") else ("完成" if item["status"] == "ok" else "失败")
+        print(f"[{state}] {item['tex_path']} ({item['seconds']}s)", flush=True)
+
+    try:
+        report = compile_many(tex_paths, jobs=args.jobs or None, timeout=args.compile_timeout, force=args.force,
+                              use_format=not args.no_format, on_item=on_item)
+    except LatexCompileError as e:
+        print(str(e))
+        return 2
+    print(format_compile_report(report))
+    return 0 if report["failed"] == 0 else 1
+
+
+# ---------------------------------------------------------------------------
+# 本地生成服务
+# ---------------------------------------------------------------------------
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_ENV = "RESUME_HELPER_SERVICE"  # 界面以瘦客户端方式连接的服务地址
+SERVICE_WORKERS = 8  # 同时运行的生成任务数，实际并发请求数仍由共享客户端的限流与自适应并发控制
+SERVICE_MAX_JOBS = 1000  # 保留的任务数，超出时删除最早结束的任务
+SERVICE_POLL_INTERVAL = 0.2  # 瘦客户端查询任务状态的间隔(秒)
+SERVICE_OPTIONS = {"stream", "max_tokens", "force_refresh", "fast_policy", "cache", "render", "compile",
+                   "sectioned", "previous"}
+SERVICE_FINAL_STATES = ("done", "failed", "cancelled")
+SERVICE_UPLOAD_DIR = os.path.join(OUTPUT_DIR, "uploads")  # 客户端上传编译的文档，按内容分目录存放
+UPLOAD_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")  # 上传文档可附带的图片(照片)
+
+
+def service_output_path(path):
+    """服务只编译自己output目录中的文件，防止本机的其他进程借服务编译任意路径；返回解析后的绝对路径"""
+    root = os.path.realpath(OUTPUT_DIR)
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([root, real_path]) != root:
+        raise ValueError(f"只能编译服务输出目录 {root} 中的文件: {path}")
+    return real_path
+
+
+def compile_upload(tex_path):
+    """瘦客户端上传给服务编译的文档：.tex内容及其引用的同目录图片(base64)"""
+    with open(tex_path, encoding="utf-8") as f:
+        content = f.read()
+    directory = os.path.dirname(tex_path) or "."
+    files = {}
+    for name in os.listdir(directory):
+        stem, extension = os.path.splitext(name)
+        # 照片按内容哈希命名，文件名出现在正文中即为该文档引用的照片
+        if extension.lower() in UPLOAD_IMAGE_EXTENSIONS and stem in content:
+            with open(os.path.join(directory, name), "rb") as f:
+                files[name] = base64.b64encode(f.read()).decode("ascii")
+    return {"name": os.path.basename(tex_path), "content": content, "files": files}
+
+
+def save_upload(document):
+    """把客户端上传的文档写入服务的上传目录，返回.tex路径
+
+    内容(含图片)相同的文档写入同一目录，再次编译时可按内容跳过；文件名只取basename。
+    """
+    if not isinstance(document, dict):
+        raise ValueError("documents中的每一项必须是JSON对象")
+    name = os.path.basename(str(document.get("name") or ""))
+    content = document.get("content")
+    files = document.get("files") or {}
+    if not name.endswith(".tex") or name.startswith(".") or not isinstance(content, str) \
+            or not isinstance(files, dict):
+        raise ValueError("documents中的每一项需要name(.tex文件名)、content与可选的files")
+    images = {}
+    for filename, encoded in files.items():
+        if os.path.basename(filename) != filename or filename.startswith(".") \
+                or not filename.lower().endswith(UPLOAD_IMAGE_EXTENSIONS):
+            raise ValueError(f"不支持上传的文件: {filename}")
+        images[filename] = base64.b64decode(str(encoded), validate=True)
+    digest = hashlib.sha256(json.dumps([content, files], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    directory = os.path.join(SERVICE_UPLOAD_DIR, digest)
+    os.makedirs(directory, exist_ok=True)
+    for filename, image in images.items():
+        with open(os.path.join(directory, filename), "wb") as f:
+            f.write(image)
+    tex_path = os.path.join(directory, name)
+    with open(tex_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return tex_path
+
+
+class ServiceJob:
+    """本地服务中的一个任务：生成一份文书(kind="generate")或批量编译(kind="compile")"""
+
+    def __init__(self, job_id, kind, key=None, api_key="", data=None, model="deepseek-chat", options=None):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.api_key = api_key  # 不出现在任务状态中
+        self.data = data
+        self.model = model
+        self.options = options or {}
+        self.state = "queued"
+        self.stage = None
+        self.progress = 0
+        self.content_parts = []  # 流式输出的正文，客户端按offset增量读取
+        self.result = None
+        self.checked = None
+        self.report = None
+        self.tex_path = ""
+        self.pdf_path = ""
+        self.error = ""
+        self.cache_hit_ms = None
+        self.cancel_token = CancelToken()
+        self.future = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.ended_at = None
+
+    @property
+    def pending(self):
+        return self.state in ("queued", "running")
+
+    def to_dict(self, offset=0):
+        """任务状态；offset之后的流式正文放在delta中"""
+        streamed = "".join(self.content_parts)
+        status = {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "stage": self.stage,
+            "progress": self.progress,
+            "model": self.model,
+            "delta": streamed[offset:],
+            "offset": len(streamed),
+            "tex_path": os.path.abspath(self.tex_path) if self.tex_path else "",
+            "pdf_path": os.path.abspath(self.pdf_path) if self.pdf_path else "",
+            "error": self.error,
+            "created_at": round(self.created_at, 3),
+            "elapsed": round((self.ended_at or time.time()) - self.started_at, 3) if self.started_at else None,
+        }
+        if self.kind == "generate":
+            status.update(label=f"{self.data['doc_type']} - {self.data['name']} -> {self.data['target']}",
+                          cache_hit_ms=self.cache_hit_ms)
+        if self.state == "done":
+            status.update(result=self.result, checked=self.checked, report=self.report)
+        return status
+
+
+class GenerationService:
+    """无界面的生成服务：所有客户端的任务共用同一个响应缓存、API连接池和编译线程池
+
+    生成任务依次执行 提示词 -> 调用API(先查缓存) -> 检查正文 -> 生成.tex -> 编译(可选)，
+    编译在共享的编译线程池中进行，不占用生成线程。相同的任务尚未结束时不会重复提交。
+    """
+
+    def __init__(self, workers=SERVICE_WORKERS, compile_jobs=None, compile_timeout=180, use_format=True,
+                 max_jobs=SERVICE_MAX_JOBS, api_key=""):
+        from concurrent.futures import ThreadPoolExecutor
+        self.workers = workers
+        self.compile_jobs = compile_jobs or os.cpu_count() or 1
+        self.compile_timeout = compile_timeout
+        self.use_format = use_format
+        self.max_jobs = max_jobs
+        self.api_key = api_key  # 请求未提供密钥时使用
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service")
+        self.compile_pool = ThreadPoolExecutor(max_workers=self.compile_jobs, thread_name_prefix="compile")
+        self.jobs = {}  # 按提交顺序
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    def add_job(self, job):
+        """登记任务，超出max_jobs时删除最早结束的任务 (调用方需持有锁)"""
+        self.jobs[job.id] = job
+        self.next_id += 1
+        finished = [other.id for other in self.jobs.values() if not other.pending]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+
+    def submit(self, request):
+        """提交生成任务，返回 (任务, 是否新建)；request为POST /jobs的JSON"""
+        if not isinstance(request.get("data"), dict):
+            raise ValueError("缺少data(申请人档案)")
+        unknown = set(request.get("options") or {}) - SERVICE_OPTIONS
+        if unknown:
+            raise ValueError(f"未知的选项: {', '.join(sorted(unknown))}")
+        api_key = request.get("api_key") or self.api_key
+        if not api_key:
+            raise ValueError("缺少api_key，且服务未配置默认密钥")
+        data, _ = normalize_profile(request["data"])
+        model = request.get("model") or "deepseek-chat"
+        options = dict(request.get("options") or {})
+        key = JobQueue.make_key(api_key, data, "", model, options)
+        with self.lock:
+            for job in self.jobs.values():
+                if job.key == key and job.pending:
+                    return job, False
+            job = ServiceJob(self.next_id, "generate", key, api_key, data, model, options)
+            self.add_job(job)
+        job.future = self.executor.submit(self.run_job, job, self.generate)
+        return job, True
+
+    def submit_compile(self, request):
+        """提交批量编译任务，只编译服务output目录中的文件
+
+        documents为客户端上传的文档(见compile_upload)，写入上传目录后编译；否则编译tex_paths，
+        省略时编译directory(默认为output目录)中的所有.tex，这些路径都必须位于output目录中。
+        """
+        documents = request.get("documents")
+        if documents:
+            if not isinstance(documents, list):
+                raise ValueError("documents必须是列表")
+            tex_paths = [save_upload(document) for document in documents]
+        else:
+            directory = service_output_path(request.get("directory") or OUTPUT_DIR)
+            tex_paths = [service_output_path(path) for path in request.get("tex_paths") or list_tex_files(directory)]
+        missing = [path for path in tex_paths if not os.path.isfile(path)]
+        if missing:
+            raise ValueError(f"文件不存在: {', '.join(missing[:5])}")
+        with self.lock:
+            job = ServiceJob(self.next_id, "compile", options={"force": bool(request.get("force"))})
+            job.data = {"tex_paths": tex_paths}
+            self.add_job(job)
+        job.future = self.executor.submit(self.run_job, job, self.compile)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job):
+        if not job.pending:
             return
+        job.cancel_token.cancel()
+        if job.future is not None:
+            job.future.cancel()
+        self.end(job, "cancelled")
 
-        # 保存LaTeX文件
-        default_filename = os.path.basename(self.generated_tex_path)
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "保存LaTeX文件", os.path.join(OUTPUT_DIR, default_filename), "LaTeX文件 (*.tex)"
+    def end(self, job, state, error=""):
+        with self.lock:
+            if not job.pending:
+                return  # 已取消
+            job.state = state
+            job.error = error
+            job.ended_at = time.time()
+            if job.started_at is None:
+                job.started_at = job.ended_at
+
+    def run_job(self, job, step):
+        with self.lock:
+            if job.state != "queued":
+                return  # 开始前已取消
+            job.state = "running"
+            job.started_at = time.time()
+        try:
+            if step(job):
+                self.end(job, "done")
+        except RequestCancelled:
+            self.end(job, "cancelled")
+        except DeepSeekAPIError as e:
+            self.end(job, "failed", str(e))
+        except Exception as e:
+            self.end(job, "failed", f"请求异常: {str(e)}")
+
+    def generate(self, job):
+        """生成任务的各阶段；需要编译时交给编译线程池并返回False，由编译完成后结束任务
+
+        选项sectioned为True时分段生成个人陈述(previous为上次的分段结果，只重新生成受影响的段落)。
+        """
+        options = job.options
+        cache = get_response_cache() if options.get("cache", True) else None
+        if options.get("sectioned") and "留学" in job.data["doc_type"]:
+            prompt, document = self.generate_sections(job, cache)
+        else:
+            prompt = self.generate_single(job, cache)
+            document = job.checked["text"]
+        job.progress = 100
+        if not options.get("render", True):
+            return True
+
+        # 生成.tex并写入历史(与界面、批量模式相同)
+        job.stage = "render"
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        tex_path = os.path.join(OUTPUT_DIR, document_filename(job.data, stamp, f"svc{job.id}"))
+        render_document(job.data, document, tex_path)
+        job.tex_path = tex_path
+        record_generation(job.data, job.result["model"], prompt, document, job.result.get("usage"), tex_path)
+        if not options.get("compile"):
+            return True
+
+        job.stage = "compile"
+        future = self.compile_pool.submit(compile_tex, tex_path, timeout=self.compile_timeout,
+                                          force=bool(options.get("force_refresh")),
+                                          fmt="auto" if self.use_format else None)
+        future.add_done_callback(lambda future: self.finish_compile(job, future))
+        return False
+
+    def generate_sections(self, job, cache):
+        """分段生成：各段完成时追加到流式正文，返回 (提纲提示词, 分段文档)"""
+        job.stage = "generate"
+        started = time.perf_counter()
+        result = generate_statement(
+            job.api_key, job.data, job.model, cache=cache, force_refresh=bool(job.options.get("force_refresh")),
+            previous=job.options.get("previous"), cancel_token=job.cancel_token,
+            on_section=lambda title, text: job.content_parts.append(f"== {title} ==\n{text}\n\n"),
+            on_progress=lambda value: setattr(job, "progress", value)
         )
+        job.cancel_token.check()
+        if result["cached"]:
+            job.cache_hit_ms = round((time.perf_counter() - started) * 1000, 3)
+        prompt = build_outline_prompt(job.data)
+        sections = merge_sections(result)
+        job.checked = {"text": sections_to_text(sections), "fixes": [], "problems": result["latex_problems"],
+                       "repaired": False}
+        job.result = dict(result, model=job.model, prompt=prompt,
+                          cache_stats=cache.stats() if cache is not None else None)
+        return prompt, sections
 
-        if file_path:
-            if not file_path.endswith(".tex"):
-                file_path += ".tex"
+    def generate_single(self, job, cache):
+        """单次请求生成并检查正文，返回提示词"""
+        options = job.options
+        job.stage = "prompt"
+        prompt = build_prompt(job.data)
+        job.stage = "generate"
+        started = time.perf_counter()
+        complete = hedged_completion if options.get("fast_policy") else generate_completion
+        result = complete(
+            job.api_key, prompt, job.model,
+            max_tokens=options.get("max_tokens") or output_max_tokens(job.data),
+            stream=options.get("stream", True),
+            on_content=job.content_parts.append,
+            on_progress=lambda value: setattr(job, "progress", value),
+            cache=cache,
+            force_refresh=bool(options.get("force_refresh")),
+            cancel_token=job.cancel_token
+        )
+        if result["cached"]:
+            job.cache_hit_ms = round((time.perf_counter() - started) * 1000, 3)
+        job.stage = "check"
 
-            try:
-                with open(self.generated_tex_path, "r", encoding="utf-8") as src:
-                    with open(file_path, "w", encoding="utf-8") as dest:
-                        dest.write(src.read())
-                self.statusBar().showMessage(f"LaTeX文件已保存: {file_path}", 5000)
-            except Exception as e:
-                QMessageBox.critical(self, "保存失败", f"文件保存失败:\n{str(e)}")
+        def repair(repair_prompt):
+            return generate_completion(
+                job.api_key, repair_prompt, REPAIR_MODEL, max_tokens=REPAIR_MAX_TOKENS, cache=cache,
+                cancel_token=job.cancel_token, kind="repair"
+            )["content"]
+
+        checked = check_latex(result["content"], repair=repair)
+        job.cancel_token.check()
+        job.checked = checked
+        job.result = dict(result, model=result.get("model", job.model), prompt=prompt,
+                          cache_stats=cache.stats() if cache is not None else None)
+        return prompt
+
+    def finish_compile(self, job, future):
+        try:
+            job.pdf_path, _ = future.result()
+        except Exception as e:
+            self.end(job, "failed", f"编译失败: {str(e)[-2000:]}")
+            return
+        try:
+            get_history_store().set_pdf_path(job.tex_path, job.pdf_path)
+        except sqlite3.Error:
+            pass
+        self.end(job, "done")
+
+    def compile(self, job):
+        job.stage = "compile"
+        paths = job.data["tex_paths"]
+        done = []
+
+        def on_item(item):
+            done.append(item)
+            job.progress = int(len(done) * 100 / len(paths))
+
+        job.report = compile_many(paths, jobs=self.compile_jobs, timeout=self.compile_timeout,
+                                  force=job.options["force"], use_format=self.use_format, on_item=on_item,
+                                  executor=self.compile_pool)
+        # 客户端的工作目录可能不同，返回绝对路径
+        for item in job.report["items"]:
+            if item.get("pdf_path"):
+                item["pdf_path"] = os.path.abspath(item["pdf_path"])
+        job.report["report_path"] = os.path.abspath(job.report["report_path"])
+        return True
+
+    def stats(self):
+        states = {}
+        for job in self.list():
+            states[job.state] = states.get(job.state, 0) + 1
+        metrics = get_metrics()
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "jobs": states,
+            "workers": self.workers,
+            "compile_jobs": self.compile_jobs,
+            "cache": get_response_cache().stats(),
+            "api_client": get_api_client().stats(),
+            "backends": get_backend_router().stats(),
+            "stages": metrics.summary(),
+            "token_estimates": metrics.estimate_summary(),
+        }
+
+    def shutdown(self):
+        for job in self.list():
+            self.cancel(job)
+        self.executor.shutdown(wait=False)
+        self.compile_pool.shutdown(wait=False)
+
+
+class ServiceHandler:
+    """本地服务的HTTP/JSON接口(与BaseHTTPRequestHandler组合使用，见create_service_server)
+
+    GET  /health                  服务状态
+    POST /prompt                  只构建提示词，返回提示词、max_tokens与估算的token数
+    POST /jobs                    提交生成任务 {"data": 档案, "model", "api_key", "options"}，返回202与任务编号
+    GET  /jobs                    所有任务的状态
+    GET  /jobs/<id>?offset=N      任务状态，delta为offset之后的流式正文
+    POST /jobs/<id>/cancel        取消任务(也可用DELETE /jobs/<id>)
+    POST /compile                 批量编译 {"documents": [{"name", "content", "files"}], "force": false}，返回202与任务编号；
+                                  也可用tex_paths/directory指定服务output目录中的文件
+    GET  /stats                   缓存、限流、后端与各阶段耗时
+    GET  /metrics                 Prometheus文本格式
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": {"message": message}})
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(payload, dict):
+            raise ValueError("请求体必须是JSON对象")
+        return payload
+
+    def route(self):
+        """返回 (路径各段, 查询参数)"""
+        from urllib.parse import urlsplit, parse_qs
+        parts = urlsplit(self.path)
+        return [part for part in parts.path.split("/") if part], parse_qs(parts.query)
+
+    def find_job(self, job_id):
+        job = self.service.get(int(job_id)) if job_id.isdigit() else None
+        if job is None:
+            self.send_error_json(404, f"任务 {job_id} 不存在")
+        return job
+
+    def do_GET(self):
+        path, query = self.route()
+        if path == ["health"]:
+            self.send_json(200, {"status": "ok", "pid": os.getpid()})
+        elif path == ["stats"]:
+            self.send_json(200, self.service.stats())
+        elif path == ["metrics"]:
+            body = get_metrics().to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == ["jobs"]:
+            self.send_json(200, {"jobs": [job.to_dict(offset=10 ** 9) for job in self.service.list()]})
+        elif len(path) == 2 and path[0] == "jobs":
+            job = self.find_job(path[1])
+            if job is not None:
+                offset = query.get("offset", ["0"])[0]
+                self.send_json(200, job.to_dict(int(offset) if offset.isdigit() else 0))
+        else:
+            self.send_error_json(404, "not found")
+
+    def do_POST(self):
+        path, _ = self.route()
+        try:
+            request = self.read_json()
+            if path == ["jobs"]:
+                job, created = self.service.submit(request)
+                self.send_json(202 if created else 200, dict(job.to_dict(), created=created))
+            elif path == ["compile"]:
+                self.send_json(202, dict(self.service.submit_compile(request).to_dict(), created=True))
+            elif path == ["prompt"]:
+                data, _ = normalize_profile(request.get("data") or {})
+                prompt = build_prompt(data)
+                self.send_json(200, {"prompt": prompt, "max_tokens": output_max_tokens(data),
+                                     "estimated_tokens": estimate_prompt_tokens(prompt)})
+            elif len(path) == 3 and path[0] == "jobs" and path[2] == "cancel":
+                self.cancel_job(path[1])
+            else:
+                self.send_error_json(404, "not found")
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self.send_error_json(400, str(e))
+
+    def do_DELETE(self):
+        path, _ = self.route()
+        if len(path) == 2 and path[0] == "jobs":
+            self.cancel_job(path[1])
+        else:
+            self.send_error_json(404, "not found")
+
+    def cancel_job(self, job_id):
+        job = self.find_job(job_id)
+        if job is not None:
+            self.service.cancel(job)
+            self.send_json(200, job.to_dict(offset=10 ** 9))
+
+
+def create_service_server(service, host=SERVICE_HOST, port=SERVICE_PORT):
+    """创建HTTP服务器(尚未开始处理请求)，port为0时由系统分配端口"""
+    # http.server导入较慢，启动服务时才加载，不影响界面启动
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    handler = type("ServiceRequestHandler", (ServiceHandler, BaseHTTPRequestHandler), {})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    return httpd
+
+
+def serve_cli(args):
+    """命令行启动本地服务，Ctrl+C退出"""
+    configure_api_client(
+        pool_size=max(16, args.concurrency),
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        max_retries=args.max_retries,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        initial_concurrency=args.concurrency
+    )
+    ensure_output_dir()
+    service = GenerationService(
+        workers=max(SERVICE_WORKERS, args.concurrency), compile_jobs=args.jobs or None,
+        compile_timeout=args.compile_timeout, use_format=not args.no_format,
+        api_key=args.api_key or os.environ.get("DEEPSEEK_API_KEY", "")
+    )
+    try:
+        httpd = create_service_server(service, args.host, args.port)
+    except OSError as e:
+        print(f"无法监听 {args.host}:{args.port}: {str(e)}")
+        return 2
+    host, port = httpd.server_address[:2]
+    print(f"生成服务: http://{host}:{port} (Ctrl+C 退出)", flush=True)
+    if len(get_backend_router().backends) > 1:
+        threading.Thread(target=get_backend_router().check_all, args=(service.api_key,), daemon=True).start()
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+    return 0
+
+
+class ServiceError(Exception):
+    """本地生成服务无法连接、返回错误，或任务在服务中失败"""
+
+
+class ServiceClient:
+    """本地服务的HTTP客户端，供界面(瘦客户端)和脚本调用"""
+
+    def __init__(self, base_url, timeout=10):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def request(self, method, path, payload=None):
+        import requests
+        try:
+            response = self.session.request(method, self.base_url + path, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ServiceError(f"无法连接生成服务 {self.base_url}: {str(e)}")
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code >= 400:
+            message = (body.get("error") or {}).get("message") or response.text[:200]
+            raise ServiceError(f"生成服务返回错误 {response.status_code}: {message}")
+        return body
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def submit(self, data, model="deepseek-chat", api_key="", **options):
+        return self.request("POST", "/jobs", {"data": data, "model": model, "api_key": api_key, "options": options})
+
+    def status(self, job_id, offset=0):
+        return self.request("GET", f"/jobs/{job_id}?offset={offset}")
+
+    def cancel(self, job_id):
+        return self.request("POST", f"/jobs/{job_id}/cancel", {})
+
+    def compile(self, tex_paths, force=False):
+        """上传本地的.tex(及其引用的照片)，在服务的编译线程池中编译"""
+        documents = [compile_upload(path) for path in tex_paths]
+        return self.request("POST", "/compile", {"documents": documents, "force": force})
+
+    def stats(self):
+        return self.request("GET", "/stats")
+
+    def close(self):
+        self.session.close()
+
+
+class ServiceJobWorker(QThread):
+    """瘦客户端模式下代替DeepSeekAPIWorker：把任务提交给本地服务并轮询状态，信号与DeepSeekAPIWorker相同
+
+    服务只负责生成和检查正文(render=False)，.tex仍按界面中的表单在本地生成。
+    sectioned为True时由服务分段生成个人陈述，completed发出的结果与SectionedStatementWorker的相同。
+    """
+    finished = pyqtSignal(str, bool)
+    progress = pyqtSignal(int)
+    content_delta = pyqtSignal(str)
+    reasoning_delta = pyqtSignal(str)  # 服务不转发推理过程，保留信号以便与DeepSeekAPIWorker互换
+    cache_hit = pyqtSignal(float)
+    routed = pyqtSignal(str, bool)
+    checked = pyqtSignal(object)
+    completed = pyqtSignal(object)
+
+    def __init__(self, service_url, api_key, data, model="deepseek-chat", parent=None,
+                 stream=True, max_tokens=2000, cache=None, force_refresh=False, fast_policy=False,
+                 sectioned=False, previous=None):
+        super().__init__(parent)
+        self.service_url = service_url
+        self.api_key = api_key
+        self.data = data
+        self.model = model
+        self.fast_policy = fast_policy
+        if sectioned:
+            # 与SectionedStatementWorker相同，分段生成总是使用缓存
+            self.options = {"sectioned": True, "previous": previous, "force_refresh": force_refresh,
+                            "render": False}
+        else:
+            # 服务使用自己的响应缓存，cache参数只决定是否查缓存
+            self.options = {"stream": stream, "max_tokens": max_tokens, "cache": cache is not None,
+                            "force_refresh": force_refresh, "fast_policy": fast_policy, "render": False}
+        self.cancel_token = CancelToken()
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def run(self):
+        client = None
+        try:
+            client = ServiceClient(self.service_url)
+            status = client.submit(self.data, self.model, self.api_key, **self.options)
+            created = status["created"]
+            while True:
+                if self.cancel_token.cancelled:
+                    # 相同的任务可能是其他客户端提交的，只取消自己新建的任务
+                    if created:
+                        client.cancel(status["id"])
+                    raise RequestCancelled()
+                if status["delta"]:
+                    self.content_delta.emit(status["delta"])
+                self.progress.emit(status["progress"])
+                if status["state"] in SERVICE_FINAL_STATES:
+                    break
+                self.cancel_token.event.wait(SERVICE_POLL_INTERVAL)
+                status = client.status(status["id"], status["offset"])
+
+            if status["state"] == "cancelled":
+                raise RequestCancelled()
+            if status["state"] == "failed":
+                raise ServiceError(status["error"])
+            result = status["result"]
+            if status["cache_hit_ms"] is not None:
+                self.cache_hit.emit(status["cache_hit_ms"])
+            if self.fast_policy:
+                self.routed.emit(result["model"], result.get("hedged", False))
+            self.checked.emit(status["checked"])
+            self.completed.emit(result)
+            self.progress.emit(100)
+            self.finished.emit(status["checked"]["text"], True)
+        except RequestCancelled:
+            self.finished.emit("已取消", False)
+        except ServiceError as e:
+            self.finished.emit(str(e), False)
+        except Exception as e:
+            self.finished.emit(f"请求异常: {str(e)}", False)
+        finally:
+            if client is not None:
+                client.close()
+
+
+class ServiceCompileWorker(QThread):
+    """瘦客户端模式下代替BulkCompileWorker：上传.tex给本地服务，在服务共享的编译线程池中编译，信号相同"""
+    item_finished = pyqtSignal(dict)
+    finished = pyqtSignal(object, str)
+
+    def __init__(self, service_url, tex_paths, force=False, parent=None):
+        super().__init__(parent)
+        self.service_url = service_url
+        self.tex_paths = tex_paths
+        self.tex_path = tex_paths[0]  # 预览PDF时只编译一份，与PdfCompileWorker相同
+        self.force = force
+
+    def run(self):
+        client = None
+        try:
+            client = ServiceClient(self.service_url)
+            status = client.compile(self.tex_paths, force=self.force)
+            while status["state"] not in SERVICE_FINAL_STATES:
+                time.sleep(SERVICE_POLL_INTERVAL)
+                status = client.status(status["id"])
+            if status["state"] != "done":
+                raise ServiceError(status["error"] or "编译任务已取消")
+            report = status["report"]
+            # 服务编译的是上传的副本，结果记录中换回本地的.tex路径
+            for item, tex_path in zip(report["items"], self.tex_paths):
+                item["tex_path"] = tex_path
+                self.item_finished.emit(item)
+            self.finished.emit(report, "")
+        except Exception as e:
+            self.finished.emit(None, str(e))
+        finally:
+            if client is not None:
+                client.close()
+
+
+def report_startup_probe(window, imports_done):
+    """输出启动各时间点(时间戳)后退出，供启动耗时基准测试读取"""
+    print(json.dumps({
+        "imports_done": imports_done,
+        "first_paint": window.first_paint_at,
+        "ready": time.time(),
+        "modules": sorted(name for name in ("requests", "pylatex") if name in sys.modules),
+    }), flush=True)
+    QApplication.quit()
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    imports_done = time.time()
+    parser = argparse.ArgumentParser(description="留学求职文书助手")
+    parser.add_argument("--batch", metavar="PROFILES", help="无界面批量生成，读取.jsonl或.csv申请人档案")
+    parser.add_argument("--concurrency", type=int, default=4, help="批量模式同时进行的API请求数")
+    parser.add_argument("--model", default="deepseek-chat", help="批量模式使用的模型")
+    parser.add_argument("--api-key", default="", help="DeepSeek API密钥(默认读取DEEPSEEK_API_KEY)")
+    parser.add_argument("--no-cache", action="store_true", help="批量模式不使用响应缓存")
+    parser.add_argument("--connect-timeout", type=float, default=10, help="连接超时(秒)")
+    parser.add_argument("--read-timeout", type=float, default=120, help="读取超时(秒)")
+    parser.add_argument("--max-retries", type=int, default=3, help="可重试错误的最大重试次数")
+    parser.add_argument("--rpm", type=int, default=RATE_LIMIT_RPM, help="每分钟最多发出的请求数，0为不限")
+    parser.add_argument("--tpm", type=int, default=RATE_LIMIT_TPM,
+                        help="每分钟最多消耗的token数(提示词估算值 + max_tokens)，0为不限")
+    parser.add_argument("--force", action="store_true", help="忽略已缓存结果与已编译的PDF，强制重新生成/编译")
+    parser.add_argument("--sectioned", action="store_true", help="留学文书按提纲分段并行生成")
+    parser.add_argument("--fast", action="store_true", help="快速策略：慢请求发出对冲请求，推理模型超时回退")
+    parser.add_argument("--hedge-percentile", type=float, default=HEDGE_PERCENTILE,
+                        help="请求耗时超过该模型历史第N百分位时发出对冲请求")
+    parser.add_argument("--fallback-deadline", type=float, default=FALLBACK_DEADLINE,
+                        help="deepseek-reasoner的耗时样本不足时，超过该秒数仍未完成则回退到deepseek-chat")
+    parser.add_argument("--backends", metavar="PATH",
+                        help=f"OpenAI兼容后端的配置文件(JSON)，默认读取{BACKENDS_CONFIG}，不存在时使用DeepSeek官方接口")
+    parser.add_argument("--check-backends", action="store_true", help="检查各后端是否可用并输出耗时后退出")
+    parser.add_argument("--compile-all", nargs="?", const=OUTPUT_DIR, metavar="DIR",
+                        help=f"并行编译目录(默认{OUTPUT_DIR})中的所有.tex后退出")
+    parser.add_argument("--compile", action="store_true", help="批量模式生成后并行编译为PDF")
+    parser.add_argument("--jobs", type=int, default=0, help="同时运行的编译进程数，默认等于CPU核数")
+    parser.add_argument("--compile-timeout", type=float, default=180, help="单份文档的编译超时(秒)")
+    parser.add_argument("--no-format", action="store_true", help="编译时不使用预编译的导言区格式文件")
+    parser.add_argument("--serve", action="store_true",
+                        help="无界面运行本地生成服务(HTTP/JSON)，多个界面或脚本共用缓存、连接与编译进程")
+    parser.add_argument("--host", default=SERVICE_HOST, help="本地服务监听的地址")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="本地服务监听的端口")
+    parser.add_argument("--service", metavar="URL", default=os.environ.get(SERVICE_ENV, ""),
+                        help=f"界面作为瘦客户端，把生成任务提交给该地址的本地服务(也可设置{SERVICE_ENV})")
+    parser.add_argument("--renderer", choices=LATEX_RENDERERS, default=LATEX_RENDERER,
+                        help="生成.tex的方式：template(模板，较快)或pylatex，两者输出相同")
+    args, qt_args = parser.parse_known_args()
+    LATEX_RENDERER = args.renderer
+    if args.backends:
+        configure_backends(args.backends)
+
+    if args.check_backends:
+        router = get_backend_router()
+        results = router.check_all(args.api_key or os.environ.get("DEEPSEEK_API_KEY", ""))
+        print(format_backend_stats(router.stats()))
+        sys.exit(0 if any(result["ok"] for result in results.values()) else 1)
+
+    if args.compile_all:
+        sys.exit(compile_cli(args, list_tex_files(args.compile_all)))
+
+    if args.batch:
+        sys.exit(run_batch_cli(args))
+
+    if args.serve:
+        sys.exit(serve_cli(args))
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     # 设置应用样式
     app.setStyle("Fusion")
@@ -555,6 +5394,8 @@ if __name__ == "__main__":
         }
     """)
 
-    window = ResumeGeneratorApp()
+    window = ResumeGeneratorApp(service_url=args.service or None)
+    if os.environ.get(STARTUP_PROBE_ENV):
+        window.startup_finished.connect(lambda: report_startup_probe(window, imports_done))
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
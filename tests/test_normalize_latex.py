@@ -0,0 +1,95 @@
+"""normalize_latex的固定用例：被截断的环境、嵌套花括号、转义与未转义的%，并检查结果再次规范化时不变
+
+用法: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def normalize(text):
+    result = main.normalize_latex(text)
+    # 修复后的正文会写入缓存并作为修复提示词的输入，再规范化一次必须完全相同
+    assert main.normalize_latex(result["text"])["text"] == result["text"]
+    return result
+
+
+def messages(issues):
+    return [issue["message"] for issue in issues]
+
+
+@pytest.mark.parametrize("text, expected, fixes", [
+    ("\\begin{itemize}\n\\item 论文一篇",
+     "\\begin{itemize}\n\\item 论文一篇\\end{itemize}",
+     ["补全了未闭合的环境 itemize"]),
+    ("\\begin{itemize}\n\\item a \\begin{enumerate}\\item b",
+     "\\begin{itemize}\n\\item a \\begin{enumerate}\\item b\\end{enumerate}\\end{itemize}",
+     ["补全了未闭合的环境 enumerate", "补全了未闭合的环境 itemize"]),
+    ("Intro \\begin{equation} a_1",
+     "Intro \\begin{equation} a_1\\end{equation}",
+     ["补全了未闭合的环境 equation"]),
+    ("\\begin{itemize}\\item a % 注释 {",
+     "\\begin{itemize}\\item a % 注释 {\n\\end{itemize}",
+     ["补全了未闭合的环境 itemize"]),
+])
+def test_truncated_environments_are_closed(text, expected, fixes):
+    result = normalize(text)
+    assert result["text"] == expected
+    assert messages(result["fixes"]) == fixes
+    assert result["problems"] == []
+
+
+def test_truncated_begin_is_dropped():
+    result = normalize("\\begin{equ")
+    assert result["text"] == ""
+    assert messages(result["fixes"]) == ["删除了不完整的 \\begin{equ"]
+
+
+def test_mismatched_end_is_replaced():
+    result = normalize("\\begin{foo} text \\end{bar}")
+    assert result["text"] == "\\begin{foo} text \\end{foo}"
+    assert messages(result["fixes"]) == ["删除了没有对应 \\begin 的 \\end{bar}", "补全了未闭合的环境 foo"]
+    assert messages(result["problems"]) == ["未知的环境 foo"]
+
+
+@pytest.mark.parametrize("text, expected, fixes", [
+    ("\\textbf{a {b {c}}} d", "\\textbf{a {b {c}}} d", []),
+    ("\\textbf{a {b {c}} d", "\\textbf{a {b {c}} d}", ["补全了1个未闭合的花括号"]),
+    ("x}} y", "x\\}\\} y", ["转义了多余的 }", "转义了多余的 }"]),
+    # 花括号与环境按嵌套顺序补全
+    ("\\begin{itemize}\\item {a", "\\begin{itemize}\\item {a}\\end{itemize}",
+     ["补全了1个未闭合的花括号", "补全了未闭合的环境 itemize"]),
+    ("{a \\begin{itemize}\\item b", "{a \\begin{itemize}\\item b\\end{itemize}}",
+     ["补全了未闭合的环境 itemize", "补全了1个未闭合的花括号"]),
+    ("\\begin{itemize}\\item x\\end{itemize}}", "\\begin{itemize}\\item x\\end{itemize}\\}",
+     ["转义了多余的 }"]),
+    # 注释中的花括号不计数，停在注释中时补全的内容另起一行
+    ("\\textbf{a % 注释", "\\textbf{a % 注释\n}", ["补全了1个未闭合的花括号"]),
+    ("a % {\nb}", "a % {\nb\\}", ["转义了多余的 }"]),
+])
+def test_nested_braces(text, expected, fixes):
+    result = normalize(text)
+    assert result["text"] == expected
+    assert messages(result["fixes"]) == fixes
+
+
+@pytest.mark.parametrize("text, expected, fixes", [
+    ("准确率提升 30%", "准确率提升 30\\%", ["把百分号转义为 \\%"]),
+    ("准确率提升 30\\%", "准确率提升 30\\%", []),
+    ("30\\% and 40% here", "30\\% and 40\\% here", ["把百分号转义为 \\%"]),
+    ("\\foo{\\%}", "\\foo{\\%}", []),
+    # 空格后的 % 和换行命令 \\ 后的 % 视为注释，保持原样
+    ("a % 这是注释 {", "a % 这是注释 {", []),
+    ("a \\% b % c", "a \\% b % c", []),
+    ("\\\\% c", "\\\\% c", []),
+    ("100% {b", "100\\% {b}", ["把百分号转义为 \\%", "补全了1个未闭合的花括号"]),
+])
+def test_percent_signs(text, expected, fixes):
+    result = normalize(text)
+    assert result["text"] == expected
+    assert messages(result["fixes"]) == fixes